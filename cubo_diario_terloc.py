@@ -0,0 +1,165 @@
+"""
+🧊 CUBO DIÁRIO TERLOC - Agregados por dia, cliente e cliente de venda
+======================================================================
+Gerado uma vez por versão do cache (artefato "cubo_diario"): cada célula guarda a contagem
+de processos e, para cada par de etapas e uso de PARES_ETAPAS, quantas durações válidas,
+soma, soma dos quadrados, mínimo e máximo. Volumes, rankings e tempos médios de qualquer
+combinação de período e filtros de cliente saem da soma das células, sem varrer as linhas.
+Com as mesmas chaves, o artefato "esbocos_diarios" guarda os esboços de quantis (quantis_terloc)
+das durações, para os percentis do período sem reordenar as linhas.
+"""
+
+import numpy as np
+import pandas as pd
+
+from esquema_terloc import COLUNAS
+from motor_intervalos_terloc import MotorIntervalos, PARES_ETAPAS
+from quantis_terloc import QUANTIS, baldes, quantis_do_esboco
+
+# Dimensões do cubo além do dia (só as presentes no dataset)
+CHAVES_CLIENTES = (COLUNAS['cliente'], COLUNAS['cliente_venda'])
+
+# Estatística de cada medida -> agregação ao juntar linhas (ou células) na mesma célula
+MEDIDAS = {'n': 'sum', 'soma': 'sum', 'soma_quadrados': 'sum', 'minimo': 'min', 'maximo': 'max'}
+
+
+def prefixo_medida(par, uso):
+    """Prefixo das colunas de um par de etapas num uso (ex.: 'ticket_senha_cartoes')"""
+    return f"{par[0]}_{par[1]}_{uso}"
+
+
+def chaves_cubo(df):
+    """Colunas-chave das células (data, CLIENTE, CLIENTE DE VENDA) de cada linha de df"""
+    if 'data_convertida' in df.columns:
+        datas = df['data_convertida'].dt.normalize()
+    else:
+        datas = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+    chaves = {'data': datas}
+    chaves.update({coluna: df[coluna] for coluna in CHAVES_CLIENTES if coluna in df.columns})
+    return chaves
+
+
+def cubo_diario(df):
+    """Cubo (dia, CLIENTE, CLIENTE DE VENDA) -> registros e estatísticas das durações.
+
+    Linhas sem data ou sem cliente também viram células (chave vazia), para o cubo somar
+    exatamente as linhas do dataset quando não há filtro de período.
+    """
+    motor = MotorIntervalos(df)
+    colunas = chaves_cubo(df)
+    chaves = list(colunas)
+    colunas['registros'] = np.ones(len(df), dtype='int64')
+    agregacoes = {'registros': 'sum'}
+    for par in motor.pares:
+        for uso in PARES_ETAPAS[par]:
+            # Duração só nas linhas válidas para o uso (NaN nas demais: fora das somas)
+            duracoes = np.where(motor.mascara(par, uso), motor.duracoes[:, motor.coluna[par]], np.nan)
+            prefixo = prefixo_medida(par, uso)
+            colunas[f'{prefixo}_n'] = (~np.isnan(duracoes)).astype('int64')
+            colunas[f'{prefixo}_soma'] = duracoes
+            colunas[f'{prefixo}_soma_quadrados'] = duracoes ** 2
+            colunas[f'{prefixo}_minimo'] = duracoes
+            colunas[f'{prefixo}_maximo'] = duracoes
+            agregacoes.update({f'{prefixo}_{medida}': funcao for medida, funcao in MEDIDAS.items()})
+
+    tabela = pd.DataFrame(colunas, index=df.index)
+    return tabela.groupby(chaves, observed=True, dropna=False).agg(agregacoes).reset_index()
+
+
+def esbocos_diarios(df):
+    """Esboços de quantis por célula do cubo e medida (prefixo_medida): linhas (data,
+    clientes, medida, balde, contagem), só com os baldes que têm durações válidas"""
+    motor = MotorIntervalos(df)
+    base = pd.DataFrame(chaves_cubo(df), index=df.index)
+    chaves = list(base.columns)
+    partes = []
+    for par in motor.pares:
+        for uso in PARES_ETAPAS[par]:
+            mascara = motor.mascara(par, uso)
+            partes.append(base[mascara].assign(
+                medida=prefixo_medida(par, uso),
+                balde=baldes(motor.duracoes[mascara, motor.coluna[par]]),
+            ))
+    if not partes:
+        return pd.DataFrame(columns=chaves + ['medida', 'balde', 'contagem'])
+
+    tabela = pd.concat(partes, ignore_index=True)
+    tabela['medida'] = tabela['medida'].astype('category')
+    return tabela.groupby(chaves + ['medida', 'balde'], observed=True, dropna=False).size().reset_index(name='contagem')
+
+
+def filtrar_celulas(tabela, inicio=None, fim=None, clientes=None, clientes_venda=None):
+    """Células (do cubo ou dos esboços) do período e dos clientes selecionados"""
+    mascara = pd.Series(True, index=tabela.index)
+    if inicio is not None:
+        mascara &= tabela['data'] >= pd.Timestamp(inicio)
+    if fim is not None:
+        mascara &= tabela['data'] <= pd.Timestamp(fim)
+    for coluna, selecionados in zip(CHAVES_CLIENTES, (clientes, clientes_venda)):
+        if selecionados and coluna in tabela.columns:
+            mascara &= tabela[coluna].isin(selecionados)
+    return tabela[mascara]
+
+
+class CuboPeriodo:
+    """🧊 Células do cubo de um período e dos filtros de cliente da sidebar.
+
+    Mesma interface de médias do MotorIntervalos (disponivel, media), mais estatísticas
+    completas por par, percentis (com os esboços) e os volumes por dia e por cliente.
+    """
+
+    def __init__(self, cubo, inicio=None, fim=None, clientes=None, clientes_venda=None, esbocos=None):
+        self.celulas = filtrar_celulas(cubo, inicio, fim, clientes, clientes_venda)
+        self.esbocos = None if esbocos is None else filtrar_celulas(esbocos, inicio, fim, clientes, clientes_venda)
+        self.registros = int(self.celulas['registros'].sum())
+
+    def disponivel(self, par):
+        return any(f'{prefixo_medida(par, uso)}_n' in self.celulas.columns for uso in PARES_ETAPAS[par])
+
+    def estatisticas(self, par, uso):
+        """Durações válidas do par no uso: {'n', 'media', 'desvio', 'minimo', 'maximo'} (s),
+        None sem nenhuma"""
+        prefixo = prefixo_medida(par, uso)
+        if f'{prefixo}_n' not in self.celulas.columns:
+            return None
+        n = int(self.celulas[f'{prefixo}_n'].sum())
+        if n == 0:
+            return None
+        media = self.celulas[f'{prefixo}_soma'].sum() / n
+        variancia = self.celulas[f'{prefixo}_soma_quadrados'].sum() / n - media ** 2
+        return {
+            'n': n,
+            'media': float(media),
+            'desvio': float(np.sqrt(max(variancia, 0.0))),
+            'minimo': float(self.celulas[f'{prefixo}_minimo'].min()),
+            'maximo': float(self.celulas[f'{prefixo}_maximo'].max()),
+        }
+
+    def media(self, par, uso):
+        """Duração média (s) do par para o uso, None sem nenhuma linha válida"""
+        estatisticas = self.estatisticas(par, uso)
+        return None if estatisticas is None else estatisticas['media']
+
+    def quantis(self, par, uso, quantis=QUANTIS):
+        """Percentis (s) das durações válidas do par no uso, juntando os esboços das células:
+        {quantil: duração}, None sem esboços ou sem nenhuma duração"""
+        if self.esbocos is None:
+            return None
+        linhas = self.esbocos[self.esbocos['medida'] == prefixo_medida(par, uso)]
+        return quantis_do_esboco(linhas['balde'], linhas['contagem'], quantis)
+
+    def por_dia(self):
+        """Processos por dia (só dias com processos), em ordem de data"""
+        return self.celulas.groupby('data')['registros'].sum()
+
+    def por_cliente(self, coluna=COLUNAS['cliente']):
+        """Processos por cliente, do maior volume para o menor"""
+        if coluna not in self.celulas.columns:
+            return pd.Series(dtype='int64')
+        volumes = self.celulas.groupby(coluna, observed=True)['registros'].sum()
+        return volumes[volumes > 0].sort_values(ascending=False, kind='stable')
+
+    def por_dia_cliente(self, coluna=COLUNAS['cliente']):
+        """Processos por dia e cliente (linhas data, cliente, registros)"""
+        volumes = self.celulas.groupby(['data', coluna], observed=True)['registros'].sum()
+        return volumes[volumes > 0].reset_index()
@@ -6,6 +6,11 @@ import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import os
 import warnings
+from esquema_terloc import COLUNAS, TIPOS_COLUNAS, resolver_cabecalho, avisos_esquema, instantes_etapas
+from motor_intervalos_terloc import MotorIntervalos
+from cubo_diario_terloc import cubo_diario, esbocos_diarios, CuboPeriodo
+from quantis_terloc import QUANTIS
+from indice_terloc import IndiceCategorias, posicoes_periodo
 warnings.filterwarnings('ignore')
 
 # Configuração da página
@@ -18,18 +23,130 @@ st.set_page_config(
 
 # � CARREGAMENTO INTELIGENTE - Monitor de Mudanças + Cache
 try:
-    from sistema_hibrido_terloc import carregar_dados_streamlit  # interface_upload_streamlit - TEMPORARIAMENTE COMENTADO
+    from sistema_hibrido_terloc import carregar_dados_streamlit, intervalo_datas_streamlit, versao_dados_streamlit, auditoria_normalizacao_streamlit, perfil_colunas_streamlit, esquema_colunas_streamlit, cubo_diario_streamlit, esbocos_diarios_streamlit  # interface_upload_streamlit - TEMPORARIAMENTE COMENTADO
     
-    @st.cache_data(ttl=7200, show_spinner=False)  # Cache por 2 horas
-    def carregar_dados(limite_registros=50000):
-        """Carrega dados com sistema híbrido (padrão + upload)"""
-        return carregar_dados_streamlit(limite_registros)
+    @st.cache_resource(max_entries=16, show_spinner=False)
+    def dataset_compartilhado(versao, limite_registros=50000, periodos=None):
+        """Dataset SOMENTE LEITURA, um por versão do cache e períodos, compartilhado por todas as sessões"""
+        return carregar_dados_streamlit(limite_registros, periodos)
+    
+    def carregar_dados(limite_registros=50000, periodos=None):
+        """Carrega dados com sistema híbrido (padrão + upload), lendo só as partições dos períodos.
+        
+        Devolve uma visão rasa do dataset compartilhado (sem copiar os dados nem desserializar
+        a cada rerun); colunas novas criadas na visão não alteram o dataset das outras sessões.
+        """
+        versao = versao_dados_streamlit(limite_registros)
+        df = dataset_compartilhado(versao, limite_registros, periodos)
+        if df is None:
+            return None
+        df = df.copy(deep=False)
+        df.attrs['versao'] = versao
+        return df
+    
+    @st.cache_resource(max_entries=16, show_spinner=False)
+    def indice_compartilhado(versao, limite_registros=50000, periodos=None):
+        """Índice cliente -> posições das linhas do dataset compartilhado de mesma versão e períodos"""
+        return IndiceCategorias(dataset_compartilhado(versao, limite_registros, periodos))
+    
+    def carregar_indice_categorias(df, limite_registros=50000, periodos=None):
+        """Índice invertido de CLIENTE e CLIENTE DE VENDA do dataset carregado, montado uma vez
+        por versão (a versão vem do próprio df, para as posições sempre baterem com as linhas)"""
+        return indice_compartilhado(df.attrs['versao'], limite_registros, periodos)
+    
+    @st.cache_data(max_entries=16, show_spinner=False)
+    def intervalo_por_versao(versao, limite_registros=50000):
+        return intervalo_datas_streamlit(limite_registros)
+    
+    def carregar_intervalo_datas(limite_registros=50000):
+        """Intervalo de datas disponível (do manifest do cache, sem ler os dados)"""
+        return intervalo_por_versao(versao_dados_streamlit(limite_registros), limite_registros)
+    
+    @st.cache_data(max_entries=16, show_spinner=False)
+    def auditoria_por_versao(versao, limite_registros=50000):
+        return auditoria_normalizacao_streamlit(limite_registros)
+    
+    def carregar_auditoria_normalizacao(limite_registros=50000):
+        """Auditoria da normalização de nomes (artefato do cache) e tempos da última carga"""
+        return auditoria_por_versao(versao_dados_streamlit(limite_registros), limite_registros)
+    
+    @st.cache_data(max_entries=16, show_spinner=False)
+    def perfil_por_versao(versao, limite_registros=50000):
+        return perfil_colunas_streamlit(limite_registros)
+    
+    def carregar_perfil_colunas(limite_registros=50000):
+        """Perfil das colunas da planilha inteira (do manifest do cache, sem ler os dados)"""
+        return perfil_por_versao(versao_dados_streamlit(limite_registros), limite_registros)
+    
+    @st.cache_data(max_entries=16, show_spinner=False)
+    def esquema_por_versao(versao, limite_registros=50000):
+        return esquema_colunas_streamlit(limite_registros)
+    
+    def carregar_esquema_colunas(limite_registros=50000):
+        """Resolução do cabeçalho da planilha contra o esquema (do manifest do cache)"""
+        return esquema_por_versao(versao_dados_streamlit(limite_registros), limite_registros)
+    
+    @st.cache_data(max_entries=16, show_spinner=False)
+    def cubo_por_versao(versao, limite_registros=50000):
+        return cubo_diario_streamlit(limite_registros)
+    
+    def carregar_cubo_diario(limite_registros=50000):
+        """Cubo diário dia x cliente x cliente de venda (artefato do cache), None sem ele"""
+        return cubo_por_versao(versao_dados_streamlit(limite_registros), limite_registros)
+    
+    @st.cache_data(max_entries=16, show_spinner=False)
+    def esbocos_por_versao(versao, limite_registros=50000):
+        return esbocos_diarios_streamlit(limite_registros)
+    
+    def carregar_esbocos_diarios(limite_registros=50000):
+        """Esboços de quantis das durações por célula do cubo (artefato do cache), None sem eles"""
+        return esbocos_por_versao(versao_dados_streamlit(limite_registros), limite_registros)
         
 except ImportError:
     # Fallback para sistema antigo se carregador não estiver disponível
+    # Normalização de nomes compartilhada com o sistema híbrido (mapeamento + arquivo de regras)
+    from normalizador_terloc import NormalizadorNomes
+    normalizador = NormalizadorNomes('Mapeamento de Normalização de Nomes.txt', 'Regras de Normalização de Nomes.json')
+    
+    def carregar_auditoria_normalizacao(limite_registros=10000):
+        """FALLBACK: sem o cache não há artefato de auditoria"""
+        return None, {}
+    
+    def carregar_perfil_colunas(limite_registros=10000):
+        """FALLBACK: sem o cache não há perfil das colunas"""
+        return {}
+    
+    def carregar_esquema_colunas(limite_registros=10000):
+        """FALLBACK: resolução do cabeçalho feita na leitura da planilha"""
+        df = carregar_dados(limite_registros)
+        return {} if df is None else df.attrs.get('esquema', {})
+    
+    def carregar_cubo_diario(limite_registros=10000):
+        """FALLBACK: sem o cache o cubo diário é montado a partir das linhas carregadas"""
+        return None
+    
+    def carregar_esbocos_diarios(limite_registros=10000):
+        """FALLBACK: sem o cache os esboços de quantis são montados a partir das linhas carregadas"""
+        return None
+    
+    def carregar_indice_categorias(df, limite_registros=10000, periodos=None):
+        """FALLBACK: índice montado sobre a planilha carregada a cada renderização"""
+        return IndiceCategorias(df)
+    
+    @st.cache_data(ttl=600)
+    def carregar_intervalo_datas(limite_registros=10000):
+        """FALLBACK: Intervalo de datas calculado a partir da planilha completa"""
+        df = carregar_dados(limite_registros)
+        if df is None or COLUNAS['data'] not in df.columns:
+            return None
+        datas_validas = pd.to_datetime(df[COLUNAS['data']], errors='coerce').dropna()
+        if len(datas_validas) == 0:
+            return None
+        return (datas_validas.min().date(), datas_validas.max().date())
+    
     @st.cache_data(ttl=600)
-    def carregar_dados(limite_registros=10000):
-        """FALLBACK: Carrega dados da planilha TERLOC (sistema antigo)"""
+    def carregar_dados(limite_registros=10000, periodos=None):
+        """FALLBACK: Carrega dados da planilha TERLOC (sistema antigo) - lê a planilha inteira"""
         try:
             possiveis_arquivos = [
                 'PLANILHA TROCA DE NOTA TERLOC.xlsx',
@@ -49,265 +166,73 @@ except ImportError:
             
             df = pd.read_excel(arquivo_excel, sheet_name='PLANILHA ÚNICA', nrows=limite_registros)
             
+            # Cabeçalhos -> nomes canônicos do esquema (mesmos nomes do cache)
+            nomes, df.attrs['esquema'] = resolver_cabecalho([str(col) for col in df.columns])
+            df.columns = nomes
+            
             # Processamento básico
-            colunas_tempo = [col for col in df.columns if any(termo in col.upper() for termo in ['HORA', 'DATA', 'TICKET', 'LIBERAÇÃO'])]
+            colunas_tempo = [col for col in df.columns if TIPOS_COLUNAS.get(col) in ('data', 'hora')]
             df['campos_preenchidos'] = df[colunas_tempo].notna().sum(axis=1)
             df['processo_completo'] = df['campos_preenchidos'] >= len(colunas_tempo) * 0.6
             
-            if 'CLIENTE' in df.columns:
-                df['CLIENTE'] = df['CLIENTE'].apply(normalizar_nome_cliente)
-            if 'CLIENTE DE VENDA' in df.columns:
-                df['CLIENTE DE VENDA'] = df['CLIENTE DE VENDA'].apply(normalizar_cliente_venda)
+            normalizador.atualizar()
+            for coluna, tipo in (('CLIENTE', 'cliente'), ('CLIENTE DE VENDA', 'cliente_venda')):
+                if coluna in df.columns:
+                    df[coluna] = normalizador.normalizar_serie(df[coluna], tipo)
             
-            return df
+            # Mesmos tipos do cache: datas em datetime64, horários em segundos desde a meia-noite
+            for col in df.columns:
+                tipo = TIPOS_COLUNAS.get(col)
+                if tipo == 'data' or (tipo is None and col.upper().startswith('DATA')):
+                    df[col] = pd.to_datetime(df[col], errors='coerce')
+                elif tipo == 'hora' or (tipo is None and 'HORA' in col.upper()):
+                    df[col] = pd.to_timedelta(df[col].astype(str), errors='coerce').dt.total_seconds().astype('Int32')
+            
+            # Instante absoluto de cada etapa, como no cache
+            df = df.assign(**instantes_etapas(df))
+            
+            # Ordem de data, como no cache: períodos viram fatias contíguas (posicoes_periodo)
+            df['data_convertida'] = pd.to_datetime(df[COLUNAS['data']], errors='coerce') if COLUNAS['data'] in df.columns else pd.NaT
+            return df.sort_values('data_convertida', kind='stable', na_position='last', ignore_index=True)
             
         except Exception as e:
             st.error(f"Erro ao carregar dados: {e}")
             return None
 
-def normalizar_nome_cliente(nome):
-    """
-    Normaliza nomes de clientes usando correção automática de erros típicos de digitação
-    """
-    if pd.isna(nome) or nome == '':
-        return 'NÃO INFORMADO'
-    
-    # Converter para string e limpar
-    nome_limpo = str(nome).strip().upper()
-    
-    # Remover acentos e caracteres especiais
-    nome_limpo = (nome_limpo.replace('Ã', 'A').replace('Õ', 'O').replace('Ç', 'C')
-                            .replace('É', 'E').replace('Ê', 'E').replace('Í', 'I')
-                            .replace('Ó', 'O').replace('Ô', 'O').replace('Ú', 'U')
-                            .replace('Ù', 'U').replace('Û', 'U').replace('Ü', 'U'))
-    
-    # CORREÇÃO AUTOMÁTICA DE ERROS DE DIGITAÇÃO
-    
-    # 1. ELEKEIROZ - Capturar TODAS as variações com erros de digitação
-    if any(variacao in nome_limpo for variacao in ['ELEKEIROZ', 'ELEIKEIROZ', 'ELEQUEIROZ', 'ELEQUEIOZ', 'ELKEIROZ']):
-        return 'ELEKEIROZ VARZEA/SP'
-    
-    # 2. ADUFERTIL - Capturar todas as variações
-    if any(variacao in nome_limpo for variacao in ['ADUFERTIL', 'ADULFERTIL', 'ADUFETIL', 'ADUFERIL']):
-        return 'ADUFERTIL JUNDIAI/SP'
-    
-    # 3. MOSAIC CUBATÃO
-    if 'MOSAIC' in nome_limpo and ('CUBATAO' in nome_limpo or nome_limpo == 'MOSAIC'):
-        return 'MOSAIC CUBATAO/SP'
-    
-    # 4. MOSAIC UBERABA
-    if 'MOSAIC' in nome_limpo and 'UBERABA' in nome_limpo:
-        return 'MOSAIC UBERABA/MG'
-    
-    # 5. CSRD
-    if 'CSRD' in nome_limpo:
-        return 'CSRD'
-    
-    # Se não encontrou padrão conhecido, retorna normalizado
-    return nome_limpo.replace('-', '/').replace('  ', ' ').strip()
+def formatar_horarios(segundos):
+    """Horários em segundos desde a meia-noite -> texto HH:MM:SS ('-' quando vazio)"""
+    partes = [segundos // 3600, segundos % 3600 // 60, segundos % 60]
+    texto = partes[0].astype(str).str.zfill(2) + ':' + partes[1].astype(str).str.zfill(2) + ':' + partes[2].astype(str).str.zfill(2)
+    return texto.where(segundos.notna(), '-')
+
+def formatar_hh_mm(segundos):
+    """Duração em segundos -> texto H:MM"""
+    return f"{int(segundos // 3600)}:{int((segundos % 3600) // 60):02d}"
+
+def formatar_duracao(segundos):
+    """Duração média em segundos -> texto h:mm:ss ('0:00:00' sem nenhuma linha válida)"""
+    if segundos is None:
+        return "0:00:00"
+    horas = int(segundos // 3600)
+    minutos = int((segundos % 3600) // 60)
+    return f"{horas}:{minutos:02d}:{int(segundos % 60):02d}"
+
+def cubo_do_dataset(df, limite_registros):
+    """Cubo diário e esboços de quantis da versão do cache; sem os artefatos, montados a
+    partir das linhas lidas (cobrem P1 e P2, o que basta para as consultas da renderização)"""
+    cubo = carregar_cubo_diario(limite_registros)
+    esbocos = carregar_esbocos_diarios(limite_registros)
+    return (cubo_diario(df) if cubo is None else cubo), (esbocos_diarios(df) if esbocos is None else esbocos)
 
-def normalizar_cliente_venda(nome):
-    """
-    Normaliza nomes de clientes de venda usando o arquivo de mapeamento
-    """
-    if pd.isna(nome) or nome == '':
-        return 'NÃO INFORMADO'
-    
-    # Converter para string e limpar
-    nome_limpo = str(nome).strip().upper()
-    
-    # Dicionário completo baseado no arquivo "Mapeamento de Normalização de Nomes.txt"
-    mapeamento_clientes_venda = {
-        # ADUBOS ARAGUAIA ANAPOLIS
-        'ADUBOS ANAPOLIS': 'ADUBOS ARAGUAIA ANAPOLIS',
-        'ADUBOS ARAG. ANAPOLIS /GO': 'ADUBOS ARAGUAIA ANAPOLIS',
-        'ADUBOS ARAG. ANAPOLIS/GO': 'ADUBOS ARAGUAIA ANAPOLIS',
-        'ADUBOS ARAG. ANAPOLIS/MG': 'ADUBOS ARAGUAIA ANAPOLIS',
-        'ADUBOS ARAG.ANAPOLIS/GO': 'ADUBOS ARAGUAIA ANAPOLIS',
-        
-        # ADUBOS ARAGUAIA CATALÃO
-        'ADUBOS ARAG - CATALAO/GO': 'ADUBOS ARAGUAIA CATALÃO',
-        'ADUBOS ARAG. CATALAO/GO': 'ADUBOS ARAGUAIA CATALÃO',
-        'ADUBOS ARAG. CATALÃO/GO': 'ADUBOS ARAGUAIA CATALÃO',
-        'ADUBOS ARAG.CATALAO/GO': 'ADUBOS ARAGUAIA CATALÃO',
-        'ADUBOS ARAGUAIA CATALAO/GO': 'ADUBOS ARAGUAIA CATALÃO',
-        
-        # ADUFERTIL ALFENAS
-        'ADUFERTIL - ALFENAS/MG': 'ADUFERTIL ALFENAS',
-        'ADUFÉRTIL - ALFENAS/MG': 'ADUFERTIL ALFENAS',
-        'ADUFERTIL / ALFENAS': 'ADUFERTIL ALFENAS',
-        'ADUFERTIL / ALFENAS/MG': 'ADUFERTIL ALFENAS',
-        'ADUFERTIL ALFENAS': 'ADUFERTIL ALFENAS',
-        'ADUFERTIL ALFENAS/MG': 'ADUFERTIL ALFENAS',
-        'ADULFERTIL ALFENAS/MG': 'ADUFERTIL ALFENAS',
-        
-        # BONFINOPOLIS
-        'BONFINOPOLIS/MG': 'BONFINOPOLIS',
-        
-        # CAFE BRASIL
-        'CAFE BRASIL /MG': 'CAFE BRASIL',
-        'CAFE BRASIL/MG': 'CAFE BRASIL',
-        
-        # COFCO CATANDUVA
-        'COFCO - CATANDUVA/SP': 'COFCO CATANDUVA',
-        'COFCO CATANDUVA': 'COFCO CATANDUVA',
-        'COFCO CATANDUVA/SP': 'COFCO CATANDUVA',
-        'COFCO-CATANDUVA': 'COFCO CATANDUVA',
-        
-        # COFCO MERIDIANO
-        'COFCO - MERIDIANO/SP': 'COFCO MERIDIANO',
-        'COFCO MERIDIANO': 'COFCO MERIDIANO',
-        'COFCO MERIDIANO/SP': 'COFCO MERIDIANO',
-        
-        # COFCO POTIRENDABA
-        'COFCO - POTIRENDABA': 'COFCO POTIRENDABA',
-        'COFCO - POTIRENDABA/SP': 'COFCO POTIRENDABA',
-        'COFCO POTIRENDA/SP': 'COFCO POTIRENDABA',
-        'COFCO POTIRENDABA': 'COFCO POTIRENDABA',
-        'COFCO POTIRENDABA/SP': 'COFCO POTIRENDABA',
-        'COFCO/POTIRENDABA/SP': 'COFCO POTIRENDABA',
-        
-        # COFCO SEBASTIANÓPOLIS
-        'COFCO - SEBASTIANOPOLIS': 'COFCO SEBASTIANÓPOLIS',
-        'COFCO - SEBASTIANOPOLIS/SP': 'COFCO SEBASTIANÓPOLIS',
-        'COFCO - SEBASTIANÓPOLIS/SP': 'COFCO SEBASTIANÓPOLIS',
-        'COFCO - SEBASTIANPOLIS/SP': 'COFCO SEBASTIANÓPOLIS',
-        'COFCO SEBASTIANOPOLIS': 'COFCO SEBASTIANÓPOLIS',
-        'COFCO SEBASTIANÓPOLIS/SP': 'COFCO SEBASTIANÓPOLIS',
-        
-        # EMBRAFOS BARRETOS
-        'EMBRAFOS BARRETOS': 'EMBRAFOS BARRETOS',
-        
-        # EQUILIBRIO ITAPETININGA
-        'EQUILIBRIO ITAPETININGA/SP': 'EQUILIBRIO ITAPETININGA',
-        'EQUILIBRIO ITAPETININGA04': 'EQUILIBRIO ITAPETININGA',
-        
-        # FASS NOVA INDEPENDÊNCIA
-        'FASS - NOVA INDEPENDENCIA': 'FASS NOVA INDEPENDÊNCIA',
-        'FASS - NOVA INDEPENDENCIA/SP': 'FASS NOVA INDEPENDÊNCIA',
-        'FASS INDEPENDENCIA': 'FASS NOVA INDEPENDÊNCIA',
-        'FASS N.INDEPENDENCIA': 'FASS NOVA INDEPENDÊNCIA',
-        'FASS NOVA IND.': 'FASS NOVA INDEPENDÊNCIA',
-        'FASS NOVA INDEPEDENCIA': 'FASS NOVA INDEPENDÊNCIA',
-        'FASS NOVA INDEPENCIA': 'FASS NOVA INDEPENDÊNCIA',
-        'FASS NOVA INDEPENDENCIA': 'FASS NOVA INDEPENDÊNCIA',
-        'FASS NOVA INDEPENDÊNCIA': 'FASS NOVA INDEPENDÊNCIA',
-        'FASS NOVA INDEPÊNDENCIA': 'FASS NOVA INDEPENDÊNCIA',
-        'FASS NOVA INDEPENDENCIA/SP': 'FASS NOVA INDEPENDÊNCIA',
-        
-        # FASS SERTÃOZINHO
-        'FAAS - SERTAOZINHO/SP': 'FASS SERTÃOZINHO',
-        'FASS - SERTAOZINHO': 'FASS SERTÃOZINHO',
-        'FASS - SERTAOZINHO/SP': 'FASS SERTÃOZINHO',
-        'FASS - SERTÃOZINHO/SP': 'FASS SERTÃOZINHO',
-        'FASS SERTAOZINHO': 'FASS SERTÃOZINHO',
-        'FASS SERTÃOZINHO': 'FASS SERTÃOZINHO',
-        'FASS SERTAOZINHO SP': 'FASS SERTÃOZINHO',
-        'FASS SERTAOZINHO/SP': 'FASS SERTÃOZINHO',
-        'FASS- SERTAOZINHO/SP': 'FASS SERTÃOZINHO',
-        'FASS SERTÃOZINHO/SP': 'FASS SERTÃOZINHO',
-        'FASS- SERTÃOZINHO/SP': 'FASS SERTÃOZINHO',
-        'FASS-SERTAOZINHO/SP': 'FASS SERTÃOZINHO',
-        'FASS-SERTÃOZINHO/SP': 'FASS SERTÃOZINHO',
-        
-        # FERTI SOLO INSUMOS
-        'FERTI SOLO INSUMOS AGRICO': 'FERTI SOLO INSUMOS',
-        'FERTI SOLO INSUMOS AGRICO/PR': 'FERTI SOLO INSUMOS',
-        
-        # FERTIBOM CATANDUVA
-        'FERTIBOM - CATANDUVA': 'FERTIBOM CATANDUVA',
-        'FERTIBOM - CATANDUVA/SP': 'FERTIBOM CATANDUVA',
-        'FERTIBOM CATANDUVA': 'FERTIBOM CATANDUVA',
-        'FERTIBOM/ CATANDUVA': 'FERTIBOM CATANDUVA',
-        'FERTIBOM/CATANDUVA': 'FERTIBOM CATANDUVA',
-        
-        # IC ARAUCARIA
-        'IC ARAUCARIA': 'IC ARAUCARIA',
-        
-        # ICL JACAREÍ
-        'ICL - JACAREI/SP': 'ICL JACAREÍ',
-        'ICL - JACAREI/SP - 0013/56': 'ICL JACAREÍ',
-        'ICL - JACAREÍ/SP - 0013/56': 'ICL JACAREÍ',
-        'ICL JACAREI': 'ICL JACAREÍ',
-        'ICL JACAREI 0008/99': 'ICL JACAREÍ',
-        'ICL JACAREI- 0008/99': 'ICL JACAREÍ',
-        'ICL JACAREI 0013/56': 'ICL JACAREÍ',
-        'ICL JACAREI 0013-56 /SP': 'ICL JACAREÍ',
-        'ICL JACAREI/SP': 'ICL JACAREÍ',
-        'ICL JACAREÍ/SP': 'ICL JACAREÍ',
-        'ICL JACAREI/SP - 00008/99': 'ICL JACAREÍ',
-        'ICL JACAREI/SP - 0008/99': 'ICL JACAREÍ',
-        'ICL JACAREI/SP - 0008-99': 'ICL JACAREÍ',
-        'ICL JACAREI/SP - 0013/56': 'ICL JACAREÍ',
-        'ICL JACAREÍ/SP - 0013/56': 'ICL JACAREÍ',
-        'ICL JACAREI/SP 0008/99': 'ICL JACAREÍ',
-        'ICL JACAREI/SP -0013/56': 'ICL JACAREÍ',
-        
-        # ICL UBERLÂNDIA
-        'ICL UBERLANDIA': 'ICL UBERLÂNDIA',
-        'ICL UBERLANDIA/MG': 'ICL UBERLÂNDIA',
-        'ICL UBERLANDIA/SP': 'ICL UBERLÂNDIA',
-        
-        # KALIUM
-        'KALIUM': 'KALIUM',
-        
-        # LOYDER OLÍMPIA
-        'LOYDER - OLIMPIA/SP': 'LOYDER OLÍMPIA',
-        'LOYDER OLIMPIA': 'LOYDER OLÍMPIA',
-        'LOYDER OLIMPIA/SP': 'LOYDER OLÍMPIA',
-        'LOYDER- OLIMPIA/SP': 'LOYDER OLÍMPIA',
-        
-        # MAXFOL AGROIND
-        'MAXFOL AGRO.IND/SP': 'MAXFOL AGROIND',
-        
-        # MOSAIC CAJATI
-        'MOSAIC P&K - CAJATI': 'MOSAIC CAJATI',
-        
-        # SAFRA ALFENAS
-        'SAFRA ALFENAS': 'SAFRA ALFENAS',
-        'SAFRA- ALFENAS': 'SAFRA ALFENAS',
-        'SAFRA ALFENAS/MG': 'SAFRA ALFENAS',
-        'SAFRA IND ALFENAS': 'SAFRA ALFENAS',
-        'SAFRA IND FERT/ALFENAS': 'SAFRA ALFENAS',
-        'SAFRA IND. ALFENAS': 'SAFRA ALFENAS',
-        'SAFRA IND. ALFENAS/MG': 'SAFRA ALFENAS',
-        'SAFRA IND. FERLT/ALFENAS': 'SAFRA ALFENAS',
-        'SAFRA IND. FERT/ALFENAS': 'SAFRA ALFENAS',
-        'SAFRA IND. FERTL ALFENAS/MG': 'SAFRA ALFENAS',
-        'SAFRA IND. FERTL/ALFENAS': 'SAFRA ALFENAS',
-        'SAFRA IND.FERTL/ALFENAS': 'SAFRA ALFENAS',
-        'SANDRA IND. FERT/ALFENAS': 'SAFRA ALFENAS',
-        
-        # TERA FERTILIZANTES
-        'TERA FERTILIZANTES/MG': 'TERA FERTILIZANTES',
-        'TRA FERTILIZANTES/MG': 'TERA FERTILIZANTES',
-        
-        # USINA SANTA ADÉLIA
-        'USINA SANTA ADELEIA/SP': 'USINA SANTA ADÉLIA',
-        'USINA SANTA ADELIA S/A': 'USINA SANTA ADÉLIA',
-        
-        # USINA SÃO MANOEL
-        'USINA SÃO MANOEL /SP': 'USINA SÃO MANOEL',
-        'USINA SÃO MANOEL/SP': 'USINA SÃO MANOEL',
-        'USINA SAO MANUEL': 'USINA SÃO MANOEL',
-        'USINA SAO MANUEL/SP': 'USINA SÃO MANOEL',
-        'USINA SÃO MANUEL/SP': 'USINA SÃO MANOEL',
-    }
-    
-    # Aplicar mapeamento
-    return mapeamento_clientes_venda.get(nome_limpo, nome_limpo)
 def main():
     st.title("Trocas de Nota Terloc Sólidos")
     
     # Volume fixo - sem opção para o usuário
     limite_registros = 50000  # Valor fixo otimizado
     
-    # Carregar dados (mais discreto)
+    # Intervalo de datas disponível (metadata do cache - as linhas são lidas depois, por período)
     with st.spinner("Carregando dados..."):
-        df = carregar_dados(limite_registros)
-    if df is None:
-        st.error("Erro ao carregar dados")
-        return
+        intervalo_datas = carregar_intervalo_datas(limite_registros)
     
 
     
@@ -330,88 +255,104 @@ def main():
     # Variável padrão do período (será atualizada se houver dados válidos)
     periodo_texto = "Período não definido"
     
-    # Inicializar variáveis padrão para datas P2 (evitar erro UnboundLocalError)
+    # Inicializar variáveis padrão para datas P1/P2 (evitar erro UnboundLocalError)
+    data_inicio_p1 = None
+    data_fim_p1 = None
     data_inicio_p2 = None
     data_fim_p2 = None
-    df_p2 = pd.DataFrame()  # DataFrame vazio por padrão
+    clientes_selecionados = []
+    clientes_venda_selecionados = []
+    periodos = None
+    linhas_p1 = slice(None)  # posições das linhas de P1 no dataset carregado
     
     # Calcular períodos disponíveis
-    if 'DATA' in df.columns:
-        df['data_convertida'] = pd.to_datetime(df['DATA'], errors='coerce')
-        datas_validas = df['data_convertida'].dropna()
+    if intervalo_datas is None:
+        # Sem datas válidas: carregar tudo, sem filtro de período
+        with st.spinner("Carregando dados..."):
+            df = carregar_dados(limite_registros)
+        if df is None:
+            st.error("Erro ao carregar dados")
+            return
+        cubo, esbocos = cubo_do_dataset(df, limite_registros)
+    else:
+        data_min, data_max = intervalo_datas
         
-        if len(datas_validas) > 0:
-            data_min = datas_validas.min().date()
-            data_max = datas_validas.max().date()
-            
-            # SEÇÃO EXPANSÍVEL - Períodos de Análise
-            with st.sidebar.expander("Períodos de Análise", expanded=True):
-                # Info discreta - formato dd/mm/aaaa
-                st.caption(f"📊 Dados: {data_min.strftime('%d/%m/%Y')} a {data_max.strftime('%d/%m/%Y')}")
-                
-                # P1 em linha (lado a lado) - formato dd/mm/aaaa
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.markdown("**Início P1**")
-                    data_inicio_p1 = st.date_input("", value=data_min, key="inicio_p1", 
-                                                  label_visibility="collapsed", format="DD/MM/YYYY",
-                                                  min_value=data_min, max_value=data_max)
-                with col2:
-                    st.markdown("**Fim P1**")
-                    data_fim_p1 = st.date_input("", value=data_max, key="fim_p1", 
-                                               label_visibility="collapsed", format="DD/MM/YYYY",
-                                               min_value=data_min, max_value=data_max)
-                
-                #P2 em linha (lado a lado) - formato dd/mm/aaaa
-                col3, col4 = st.columns(2)
-                with col3:
-                    st.markdown("**InícioP2**")
-                    data_inicio_p2 = st.date_input("", value=data_min, key="inicio_p2", 
-                                                  label_visibility="collapsed", format="DD/MM/YYYY",
-                                                  min_value=data_min, max_value=data_max)
-                with col4:
-                    st.markdown("**FimP2**") 
-                    data_fim_p2 = st.date_input("", value=data_max, key="fim_p2", 
-                                               label_visibility="collapsed", format="DD/MM/YYYY",
-                                               min_value=data_min, max_value=data_max)
-            
-            # VALIDAÇÃO DAS DATAS
-            if data_inicio_p1 > data_fim_p1:
-                st.sidebar.error("❌ **P1**: Data de início deve ser menor ou igual à data de fim!")
-                st.stop()
-            
-            if data_inicio_p2 > data_fim_p2:
-                st.sidebar.error("❌ **P2**: Data de início deve ser menor ou igual à data de fim!")
-                st.stop()
-            
-            # APLICAR FILTRO P1 COMO PRINCIPAL (sempre ativo)
-            mask_periodo_p1 = (df['data_convertida'].dt.date >= data_inicio_p1) & (df['data_convertida'].dt.date <= data_fim_p1)
-            df_filtrado = df[mask_periodo_p1].copy()
-            
-            # Criar datasetP2 para comparações (quando necessário)
-            mask_periodo_p2 = (df['data_convertida'].dt.date >= data_inicio_p2) & (df['data_convertida'].dt.date <= data_fim_p2)
-            df_p2 = df[mask_periodo_p2].copy()
+        # SEÇÃO EXPANSÍVEL - Períodos de Análise
+        with st.sidebar.expander("Períodos de Análise", expanded=True):
+            # Info discreta - formato dd/mm/aaaa
+            st.caption(f"📊 Dados: {data_min.strftime('%d/%m/%Y')} a {data_max.strftime('%d/%m/%Y')}")
             
-            # Usar P1 como filtro principal
-            df = df_filtrado
-            data_inicio = data_inicio_p1
-            data_fim = data_fim_p1
+            # P1 em linha (lado a lado) - formato dd/mm/aaaa
+            col1, col2 = st.columns(2)
+            with col1:
+                st.markdown("**Início P1**")
+                data_inicio_p1 = st.date_input("", value=data_min, key="inicio_p1", 
+                                              label_visibility="collapsed", format="DD/MM/YYYY",
+                                              min_value=data_min, max_value=data_max)
+            with col2:
+                st.markdown("**Fim P1**")
+                data_fim_p1 = st.date_input("", value=data_max, key="fim_p1", 
+                                           label_visibility="collapsed", format="DD/MM/YYYY",
+                                           min_value=data_min, max_value=data_max)
             
-            # Definir texto do período para usar em todos os títulos
-            periodo_texto = f"{data_inicio_p1.strftime('%d/%m/%Y')} a {data_fim_p1.strftime('%d/%m/%Y')}"
-            
-            # VISÃO GERAL - Movida para cima, logo após o título principal
-            periodo_str = f"Período 1 (P1): {data_inicio.strftime('%d/%m/%Y')} a {data_fim.strftime('%d/%m/%Y')}"
-            st.markdown(f"""
-            ### {periodo_str}
-            """, unsafe_allow_html=True)
+            #P2 em linha (lado a lado) - formato dd/mm/aaaa
+            col3, col4 = st.columns(2)
+            with col3:
+                st.markdown("**InícioP2**")
+                data_inicio_p2 = st.date_input("", value=data_min, key="inicio_p2", 
+                                              label_visibility="collapsed", format="DD/MM/YYYY",
+                                              min_value=data_min, max_value=data_max)
+            with col4:
+                st.markdown("**FimP2**") 
+                data_fim_p2 = st.date_input("", value=data_max, key="fim_p2", 
+                                           label_visibility="collapsed", format="DD/MM/YYYY",
+                                           min_value=data_min, max_value=data_max)
+        
+        # VALIDAÇÃO DAS DATAS
+        if data_inicio_p1 > data_fim_p1:
+            st.sidebar.error("❌ **P1**: Data de início deve ser menor ou igual à data de fim!")
+            st.stop()
+        
+        if data_inicio_p2 > data_fim_p2:
+            st.sidebar.error("❌ **P2**: Data de início deve ser menor ou igual à data de fim!")
+            st.stop()
+        
+        # Carregar apenas as partições (ano/mês) que cobrem P1 e P2
+        periodos = ((data_inicio_p1, data_fim_p1), (data_inicio_p2, data_fim_p2))
+        with st.spinner("Carregando dados..."):
+            df = carregar_dados(limite_registros, periodos)
+        if df is None:
+            st.error("Erro ao carregar dados")
+            return
+        if 'data_convertida' not in df.columns:
+            df['data_convertida'] = pd.to_datetime(df[COLUNAS['data']], errors='coerce')
+        cubo, esbocos = cubo_do_dataset(df, limite_registros)
+        
+        # APLICAR FILTRO P1 COMO PRINCIPAL (sempre ativo): o dataset vem ordenado por data,
+        # então P1 é uma fatia contígua achada por busca binária (P2 sai do cubo diário)
+        linhas_p1 = posicoes_periodo(df, data_inicio_p1, data_fim_p1)
+        data_inicio = data_inicio_p1
+        data_fim = data_fim_p1
+        
+        # Definir texto do período para usar em todos os títulos
+        periodo_texto = f"{data_inicio_p1.strftime('%d/%m/%Y')} a {data_fim_p1.strftime('%d/%m/%Y')}"
+        
+        # VISÃO GERAL - Movida para cima, logo após o título principal
+        periodo_str = f"Período 1 (P1): {data_inicio.strftime('%d/%m/%Y')} a {data_fim.strftime('%d/%m/%Y')}"
+        st.markdown(f"""
+        ### {periodo_str}
+        """, unsafe_allow_html=True)
+
+    # Filtros de cliente pelo índice invertido (categoria -> posições), montado uma vez por
+    # versão do dataset e restrito às linhas de P1: nada de máscaras sobre o dataset inteiro
+    indice = carregar_indice_categorias(df, limite_registros, periodos)
     
     # SEÇÃO EXPANSÍVEL - Clientes (multiselect)
     with st.sidebar.expander("Clientes", expanded=True):
         st.markdown("Selecione os clientes")
         
         if 'CLIENTE' in df.columns:
-            clientes_todos = sorted(df['CLIENTE'].dropna().unique())
+            clientes_todos = indice.opcoes('CLIENTE', linhas_p1)
             
             # Multiselect - permite múltiplas seleções
             clientes_selecionados = st.multiselect(
@@ -424,14 +365,14 @@ def main():
             
             # Aplicar filtro se houver seleções
             if clientes_selecionados:
-                df = df[df['CLIENTE'].isin(clientes_selecionados)]
+                linhas_p1 = indice.posicoes('CLIENTE', clientes_selecionados, linhas_p1)
     
     # SEÇÃO EXPANSÍVEL - Cliente de Venda (destino da carga)
     with st.sidebar.expander("Cliente de Venda", expanded=True):
         st.markdown("Selecione os clientes de venda (destino da carga)")
         
         if 'CLIENTE DE VENDA' in df.columns:
-            clientes_venda_todos = sorted(df['CLIENTE DE VENDA'].dropna().unique())
+            clientes_venda_todos = indice.opcoes('CLIENTE DE VENDA', linhas_p1)
             
             # Multiselect para clientes de venda
             clientes_venda_selecionados = st.multiselect(
@@ -444,15 +385,32 @@ def main():
             
             # Aplicar filtro se houver seleções
             if clientes_venda_selecionados:
-                df = df[df['CLIENTE DE VENDA'].isin(clientes_venda_selecionados)]
+                linhas_p1 = indice.posicoes('CLIENTE DE VENDA', clientes_venda_selecionados, linhas_p1)
         else:
             st.warning("Coluna 'CLIENTE DE VENDA' não encontrada na planilha")
     
+    # Linhas de P1 com os filtros: fatia do dataset (sem cópia) ou só as linhas selecionadas
+    df = df.iloc[linhas_p1]
+    
+    # Volumes e tempos médios de P1 (com os filtros de cliente) e de P2 saem da soma das
+    # células do cubo diário; as linhas ficam para as tabelas detalhadas e a permanência
+    cubo_p1 = CuboPeriodo(cubo, data_inicio_p1, data_fim_p1, clientes_selecionados, clientes_venda_selecionados, esbocos=esbocos)
+    if data_inicio_p2 is not None:
+        cubo_p2 = CuboPeriodo(cubo, data_inicio_p2, data_fim_p2, esbocos=esbocos)
+    else:
+        cubo_p2 = CuboPeriodo(cubo.iloc[:0], esbocos=esbocos.iloc[:0])
+    
+    # Nomes vêm categóricos do cache: descartar as categorias sem linhas após os filtros,
+    # para que contagens e gráficos mostrem só os clientes presentes
+    for coluna in ('CLIENTE', 'CLIENTE DE VENDA'):
+        if coluna in df.columns and isinstance(df[coluna].dtype, pd.CategoricalDtype):
+            df[coluna] = df[coluna].cat.remove_unused_categories()
+    
     # SEÇÃO EXPANSÍVEL - Normalização de Clientes (diagnóstico) - Final da sidebar
     with st.sidebar.expander("Normalização de Clientes", expanded=False):
         if 'CLIENTE' in df.columns:
             # Mostrar estatísticas de normalização
-            clientes_originais = df['CLIENTE'].value_counts()
+            clientes_originais = cubo_p1.por_cliente()
             clientes_unicos = len(clientes_originais)
             
             st.markdown(f"**Clientes únicos após normalização:** {clientes_unicos}")
@@ -467,6 +425,32 @@ def main():
                 st.markdown("**Todos os clientes normalizados:**")
                 for cliente in sorted(clientes_originais.index):
                     st.text(f"• {cliente}")
+        
+        # Auditoria (artefato do cache): etapa que resolveu cada valor original e quantas
+        # linhas ela cobre, para achar regras amplas demais e grafias sem mapeamento
+        tabela_auditoria, etapas_carga = carregar_auditoria_normalizacao(limite_registros)
+        if tabela_auditoria is not None and 'origem' in tabela_auditoria.columns:
+            st.markdown("**Auditoria por origem:**")
+            resumo_origens = (tabela_auditoria.groupby(['coluna', 'origem'])
+                              .agg(valores=('original', 'size'), registros=('registros', 'sum'))
+                              .sort_values('registros', ascending=False)
+                              .reset_index())
+            st.dataframe(resumo_origens, use_container_width=True, hide_index=True)
+            
+            fora_mapeamento = tabela_auditoria[tabela_auditoria['origem'].isin(['aproximação', 'sem padrão'])]
+            if len(fora_mapeamento) > 0:
+                st.markdown(f"**Grafias sem mapeamento nem regra:** {len(fora_mapeamento)}")
+                st.dataframe(fora_mapeamento, use_container_width=True, hide_index=True)
+            
+            if etapas_carga:
+                st.caption("⏱️ " + " · ".join(f"{etapa}: {tempo:.3f}s" for etapa, tempo in etapas_carga.items()))
+            
+            st.download_button(
+                label="Baixar Auditoria (Parquet)",
+                data=tabela_auditoria.to_parquet(index=False),
+                file_name=f'auditoria_nomes_{datetime.now().strftime("%Y%m%d_%H%M")}.parquet',
+                mime='application/octet-stream'
+            )
     
     # ═══════════════════════════════════════════════════════════════════════════════════
     # 🔄 BOTÃO "ATUALIZAR DADOS" - TEMPORARIAMENTE OCULTO
@@ -480,59 +464,21 @@ def main():
     
     # MÉTRICAS PRINCIPAIS - Padrão de espaçamento
     
-    # Função para calcular tempo médio e formatar
-    def calcular_e_formatar_tempo(df, col_data, col_hora1, col_hora2):
-        """Calcula tempo médio entre duas etapas e formata como h:mm:ss - IGNORA linhas vazias"""
-        try:
-            if col_data in df.columns and col_hora1 in df.columns and col_hora2 in df.columns:
-                # Criar datetime apenas para linhas onde AMBAS as colunas têm dados
-                mask_dados_validos = (
-                    df[col_hora1].notna() & 
-                    (df[col_hora1] != '') & 
-                    df[col_hora2].notna() & 
-                    (df[col_hora2] != '')
-                )
-                
-                if mask_dados_validos.sum() == 0:
-                    return "0:00:00"
-                
-                # Filtrar apenas linhas com dados completos
-                df_valido = df[mask_dados_validos].copy()
-                
-                datetime1 = pd.to_datetime(df_valido[col_data].astype(str) + ' ' + df_valido[col_hora1].astype(str), errors='coerce')
-                datetime2 = pd.to_datetime(df_valido[col_data].astype(str) + ' ' + df_valido[col_hora2].astype(str), errors='coerce')
-                
-                diferenca = (datetime2 - datetime1).dt.total_seconds()  # em segundos
-                diferenca_valida = diferenca[diferenca.notna() & (diferenca >= 0) & (diferenca < 24*3600)]
-                
-                if len(diferenca_valida) > 0:
-                    media_segundos = diferenca_valida.mean()
-                    horas = int(media_segundos // 3600)
-                    minutos = int((media_segundos % 3600) // 60)
-                    segundos = int(media_segundos % 60)
-                    return f"{horas}:{minutos:02d}:{segundos:02d}"
-                    
-            return "0:00:00"
-        except Exception as e:
-            print(f"Erro no cálculo {col_hora1} → {col_hora2}: {e}")
-            return "0:00:00"
-    
-    # Verificar se existe a coluna crítica para o cálculo
-    if 'HORA RECEBIMENTO NF DE VENDA' not in df.columns:
-        colunas_nf_venda = [col for col in df.columns if 'NF' in col.upper() and 'VENDA' in col.upper()]
-        if not colunas_nf_venda:
-            st.warning("⚠️ **Aviso**: A coluna 'HORA RECEBIMENTO NF DE VENDA' não foi encontrada neste período. O campo 'Espera pela Nota de Venda' será exibido como 0:00:00.")
+    # Colunas obrigatórias que a planilha não tem (cabeçalho renomeado?), resolvidas na ingestão
+    colunas_ausentes = avisos_esquema(carregar_esquema_colunas())
+    if colunas_ausentes:
+        st.warning(f"⚠️ **Aviso**: Colunas não encontradas na planilha: {', '.join(colunas_ausentes)}. Os tempos que dependem delas serão exibidos como 0:00:00 - corrija o cabeçalho ou inclua a grafia nova nos apelidos de esquema_terloc.py.")
     
     # Calcular tempos médios reais
-    tempo_ticket_senha = calcular_e_formatar_tempo(df, 'DATA  TICKET', 'HORA TICKET', 'HORARIO SENHA ')
-    tempo_senha_gate = calcular_e_formatar_tempo(df, 'DATA  TICKET', 'HORARIO SENHA ', 'HORA GATE ')  
-    tempo_gate_nf = calcular_e_formatar_tempo(df, 'DATA  TICKET', 'HORA GATE ', 'HORA RECEBIMENTO NF DE VENDA')
-    tempo_nf_liberacao = calcular_e_formatar_tempo(df, 'DATA  TICKET', 'HORA RECEBIMENTO NF DE VENDA', 'HORARIO DE LIBERAÇÃO')
+    tempo_ticket_senha = formatar_duracao(cubo_p1.media(('ticket', 'senha'), 'cartoes'))
+    tempo_senha_gate = formatar_duracao(cubo_p1.media(('senha', 'gate'), 'cartoes'))
+    tempo_gate_nf = formatar_duracao(cubo_p1.media(('gate', 'nf_venda'), 'cartoes'))
+    tempo_nf_liberacao = formatar_duracao(cubo_p1.media(('nf_venda', 'liberacao'), 'cartoes'))
     
     # Métricas principais com 5 colunas
     col1, col2, col3, col4, col5 = st.columns(5)
     
-    total_atendimentos = len(df)
+    total_atendimentos = cubo_p1.registros
     
     with col1:
         st.metric(
@@ -583,7 +529,7 @@ def main():
 
     # Gráfico de top clientes (full width)
     if 'CLIENTE' in df.columns:
-        top_clientes = df['CLIENTE'].value_counts().head(10).reset_index()
+        top_clientes = cubo_p1.por_cliente().head(10).reset_index()
         top_clientes.columns = ['Cliente', 'Quantidade']
 
         fig_clientes = px.bar(
@@ -638,33 +584,14 @@ def main():
     """, unsafe_allow_html=True)
 
     # Calcular Tempo Total de Permanência
-    if 'HORA TICKET' in df.columns and 'HORARIO DE LIBERAÇÃO' in df.columns and 'data_convertida' in df.columns:
-        df_permanencia = df.copy()
-        
-        # Combinar data com horários para criar datetime completo
+    # Durações por linha do período P1 (a tabela e o histograma precisam de cada processo)
+    motor_p1 = MotorIntervalos(df)
+    par_permanencia = ('ticket', 'liberacao')
+    if motor_p1.disponivel(par_permanencia) and 'data_convertida' in df.columns:
+        # Processos com permanência válida (entre 0 e 24 horas) e a duração de cada um
         try:
-            df_permanencia['datetime_ticket'] = pd.to_datetime(
-                df_permanencia['data_convertida'].astype(str) + ' ' + 
-                df_permanencia['HORA TICKET'].astype(str), 
-                errors='coerce'
-            )
-            df_permanencia['datetime_liberacao'] = pd.to_datetime(
-                df_permanencia['data_convertida'].astype(str) + ' ' + 
-                df_permanencia['HORARIO DE LIBERAÇÃO'].astype(str), 
-                errors='coerce'
-            )
-            
-            # Calcular diferença em horas
-            df_permanencia['tempo_permanencia_segundos'] = (
-                df_permanencia['datetime_liberacao'] - df_permanencia['datetime_ticket']
-            ).dt.total_seconds()
-            
-            # Filtrar valores válidos (entre 0 e 24 horas)
-            df_permanencia = df_permanencia[
-                (df_permanencia['tempo_permanencia_segundos'].notna()) & 
-                (df_permanencia['tempo_permanencia_segundos'] >= 0) & 
-                (df_permanencia['tempo_permanencia_segundos'] <= 24*3600)
-            ].copy()
+            df_permanencia = df[motor_p1.mascara(par_permanencia, 'permanencia')].copy()
+            df_permanencia['tempo_permanencia_segundos'] = motor_p1.validas(par_permanencia, 'permanencia')
             
             if len(df_permanencia) > 0:
                 # Converter para horas e minutos
@@ -698,19 +625,33 @@ def main():
                              delta=delta_info,
                              help=f"Processos com dados válidos para análise\nTotal do período: {total_processos_periodo}\nSem dados de horário: {processos_sem_dados}")
                 
+                # Percentis: a média esconde a cauda de caminhões que ficam muito mais tempo.
+                # Vêm da junção dos esboços de quantis dos dias/clientes de P1 e de P2
+                quantis_p1 = cubo_p1.quantis(par_permanencia, 'permanencia')
+                quantis_p2 = cubo_p2.quantis(par_permanencia, 'permanencia')
+                if quantis_p1:
+                    for coluna, quantil in zip(st.columns(len(QUANTIS)), QUANTIS):
+                        percentil = int(quantil * 100)
+                        p2_texto = formatar_hh_mm(quantis_p2[quantil]) if quantis_p2 else "sem dados"
+                        with coluna:
+                            st.metric(f"P{percentil} de Permanência", formatar_hh_mm(quantis_p1[quantil]),
+                                     help=f"{percentil}% dos processos de P1 ficaram até este tempo no sistema\nP2: {p2_texto}")
+                
                 # Tabela detalhada (similar ao anexo)
                 st.markdown("#### **Detalhamento dos Processos**")
                 
                 # Preparar dados para exibição
                 df_exibicao = df_permanencia[[
-                    'data_convertida', 'PLACA', 'MOTORISTA', 'HORA TICKET', 
-                    'HORARIO DE LIBERAÇÃO', 'tempo_formatado'
+                    'data_convertida', COLUNAS['placa'], COLUNAS['motorista'], COLUNAS['hora_ticket'], 
+                    COLUNAS['hora_liberacao'], 'tempo_formatado'
                 ]].copy()
                 
                 df_exibicao.columns = [
                     'Data', 'Placa', 'Motorista', 'Hora Ticket', 
                     'Horário Liberação', 'Tempo Total Permanência'
                 ]
+                df_exibicao['Hora Ticket'] = formatar_horarios(df_exibicao['Hora Ticket'])
+                df_exibicao['Horário Liberação'] = formatar_horarios(df_exibicao['Horário Liberação'])
                 
                 # Ordenar por tempo de permanência (maior para menor)
                 df_exibicao = df_exibicao.sort_values('Tempo Total Permanência', ascending=False)
@@ -767,7 +708,7 @@ def main():
         except Exception as e:
             st.error(f"❌ Erro ao calcular tempo de permanência: {str(e)}")
     else:
-        st.warning("⚠️ Colunas necessárias não encontradas: 'HORA TICKET' e 'HORARIO DE LIBERAÇÃO'")
+        st.warning(f"⚠️ Colunas necessárias não encontradas: '{COLUNAS['hora_ticket']}' e '{COLUNAS['hora_liberacao']}'")
 
     st.markdown('<div style="height:12px"></div>', unsafe_allow_html=True)
 
@@ -791,8 +732,9 @@ def main():
     # Gráfico de atendimentos por data (full width)
     if 'data_convertida' in df.columns:
         # Calcular métricas para P1
-        atendimentos_diarios_p1 = df.groupby(df['data_convertida'].dt.date).size().reset_index()
+        atendimentos_diarios_p1 = cubo_p1.por_dia().reset_index()
         atendimentos_diarios_p1.columns = ['Data', 'Quantidade']
+        atendimentos_diarios_p1['Data'] = atendimentos_diarios_p1['Data'].dt.date
         
         media_diaria_p1 = atendimentos_diarios_p1['Quantidade'].mean()
         dias_acima_media_p1 = (atendimentos_diarios_p1['Quantidade'] > media_diaria_p1).sum()
@@ -802,8 +744,9 @@ def main():
         vale_dia_p1 = atendimentos_diarios_p1.loc[atendimentos_diarios_p1['Quantidade'].idxmin()]
         
         # Calcular métricas paraP2
-        atendimentos_diarios_p2 = df_p2.groupby(df_p2['data_convertida'].dt.date).size().reset_index()
+        atendimentos_diarios_p2 = cubo_p2.por_dia().reset_index()
         atendimentos_diarios_p2.columns = ['Data', 'Quantidade']
+        atendimentos_diarios_p2['Data'] = atendimentos_diarios_p2['Data'].dt.date
         
         if len(atendimentos_diarios_p2) > 0:
             media_diaria_p2 = atendimentos_diarios_p2['Quantidade'].mean()
@@ -902,11 +845,12 @@ def main():
         
         if 'CLIENTE' in df.columns and 'data_convertida' in df.columns:
             # Criar tabela pivô: Data x Cliente
-            df_cliente_data = df.groupby([df['data_convertida'].dt.date, 'CLIENTE']).size().reset_index()
+            df_cliente_data = cubo_p1.por_dia_cliente()
             df_cliente_data.columns = ['Data', 'Cliente', 'Quantidade']
+            df_cliente_data['Data'] = df_cliente_data['Data'].dt.date
             
             # Pegar apenas os top 10 clientes por volume total para não poluir o gráfico
-            top_clientes = df['CLIENTE'].value_counts().head(10).index.tolist()
+            top_clientes = cubo_p1.por_cliente().head(10).index.tolist()
             df_cliente_data_top = df_cliente_data[df_cliente_data['Cliente'].isin(top_clientes)]
             
             if len(df_cliente_data_top) > 0:
@@ -973,7 +917,7 @@ def main():
                 # Informações complementares
                 col1, col2, col3 = st.columns(3)
                 with col1:
-                    total_clientes_periodo = df['CLIENTE'].nunique()
+                    total_clientes_periodo = len(cubo_p1.por_cliente())
                     st.metric("Total de Clientes", total_clientes_periodo, help="Quantidade total de clientes únicos no período")
                 with col2:
                     clientes_ativos_por_dia = df_cliente_data.groupby('Data')['Cliente'].nunique().mean()
@@ -1005,83 +949,17 @@ def main():
     else:
         data_base = "20/10/2025"
     
-    # CALCULAR MÉDIAS REAIS das etapas com nomes exatos
-    def calcular_tempo_medio(df, col_data1, col_hora1, col_hora2, col_data2=None):
-        """Calcula tempo médio entre duas etapas no formato h:mm:ss
-        
-        Parâmetros:
-        - col_data1: coluna de data para o primeiro horário
-        - col_hora1: primeira hora
-        - col_hora2: segunda hora
-        - col_data2: coluna de data para o segundo horário (opcional, usa col_data1 se não fornecida)
-        """
-        try:
-            # Se col_data2 não for fornecida, usar a mesma data para ambos os horários
-            if col_data2 is None:
-                col_data2 = col_data1
-            
-            if col_data1 in df.columns and col_data2 in df.columns and col_hora1 in df.columns and col_hora2 in df.columns:
-                # Filtrar apenas linhas com valores válidos (não nulos e não vazios)
-                mask_valido = (
-                    df[col_data1].notna() & 
-                    df[col_data2].notna() & 
-                    df[col_hora1].notna() & 
-                    df[col_hora2].notna() &
-                    (df[col_data1] != '') &
-                    (df[col_data2] != '') &
-                    (df[col_hora1] != '') &
-                    (df[col_hora2] != '')
-                )
-                
-                df_valido = df[mask_valido].copy()
-                
-                if len(df_valido) == 0:
-                    return "0:00:00"
-                
-                # Combinar data e hora para criar datetime
-                datetime1 = pd.to_datetime(df_valido[col_data1].astype(str) + ' ' + df_valido[col_hora1].astype(str), errors='coerce')
-                datetime2 = pd.to_datetime(df_valido[col_data2].astype(str) + ' ' + df_valido[col_hora2].astype(str), errors='coerce')
-                
-                # Calcular diferença em segundos
-                diferenca = (datetime2 - datetime1).dt.total_seconds()
-                
-                # LÓGICA DE NEGÓCIO adaptada para diferentes casos
-                mask_tempo_razoavel = diferenca.notna()
-                diferenca_filtrada = diferenca[mask_tempo_razoavel].copy()
-                
-                # Para Gate → NF Venda (que pode span dias), usar limite maior
-                if col_hora1 == 'HORA GATE ' and col_hora2 == 'HORA RECEBIMENTO NF DE VENDA':
-                    # Filtrar apenas tempos positivos e razoáveis (0 a 72 horas = 3 dias máximo)
-                    diferenca_valida = diferenca_filtrada[(diferenca_filtrada >= 0) & (diferenca_filtrada <= 72*3600)]
-                else:
-                    # Para outros intervalos, usar lógica anterior
-                    # Corrigir casos de meia-noite: se negativo entre -2h e 0, adicionar 24h
-                    mask_meia_noite = (diferenca_filtrada >= -2*3600) & (diferenca_filtrada < 0)
-                    diferenca_filtrada.loc[mask_meia_noite] = diferenca_filtrada.loc[mask_meia_noite] + 24*3600
-                    
-                    # Filtrar apenas tempos lógicos: 0 a 6 horas (processo normal)
-                    diferenca_valida = diferenca_filtrada[(diferenca_filtrada >= 0) & (diferenca_filtrada <= 6*3600)]
-                
-                if len(diferenca_valida) > 0:
-                    media_segundos = diferenca_valida.mean()
-                    horas = int(media_segundos // 3600)
-                    minutos = int((media_segundos % 3600) // 60)
-                    segundos = int(media_segundos % 60)
-                    return f"{horas}:{minutos:02d}:{segundos:02d}"
-                        
-            return "0:00:00"
-        except Exception as e:
-            return "0:00:00"
-    
     # Informações discretas sobre os dados
     st.sidebar.caption(f"� {len(df):,} registros carregados")
-    st.sidebar.caption(f"📅 Período: {df['DATA'].min().strftime('%d/%m/%Y') if 'DATA' in df.columns else 'N/A'} a {df['DATA'].max().strftime('%d/%m/%Y') if 'DATA' in df.columns else 'N/A'}")
+    coluna_data = COLUNAS['data']
+    st.sidebar.caption(f"📅 Período: {df[coluna_data].min().strftime('%d/%m/%Y') if coluna_data in df.columns else 'N/A'} a {df[coluna_data].max().strftime('%d/%m/%Y') if coluna_data in df.columns else 'N/A'}")
     
-    # Calcular intervalos das 5 etapas com nomes CORRETOS das colunas (com espaços exatos!)
-    intervalo1 = calcular_tempo_medio(df, 'DATA  TICKET', 'HORA TICKET', 'HORARIO SENHA ')       # Ticket → Senha
-    intervalo2 = calcular_tempo_medio(df, 'DATA  TICKET', 'HORARIO SENHA ', 'HORA GATE ')        # Senha → Gate
-    intervalo3 = calcular_tempo_medio(df, 'DATA  TICKET', 'HORA GATE ', 'HORA RECEBIMENTO NF DE VENDA', 'DATA DE LIBERAÇÃO')  # Gate → NF Venda
-    intervalo4 = calcular_tempo_medio(df, 'DATA  TICKET', 'HORA RECEBIMENTO NF DE VENDA', 'HORARIO DE LIBERAÇÃO')  # NF Venda → Liberação
+    # Intervalos das 5 etapas: mesmas durações dos cartões, com os limites da linha do tempo
+    # (0 a 6 horas no processo normal; Gate → NF Venda pode levar até 72 horas)
+    intervalo1 = formatar_duracao(cubo_p1.media(('ticket', 'senha'), 'linha_do_tempo'))       # Ticket → Senha
+    intervalo2 = formatar_duracao(cubo_p1.media(('senha', 'gate'), 'linha_do_tempo'))         # Senha → Gate
+    intervalo3 = formatar_duracao(cubo_p1.media(('gate', 'nf_venda'), 'linha_do_tempo'))      # Gate → NF Venda
+    intervalo4 = formatar_duracao(cubo_p1.media(('nf_venda', 'liberacao'), 'linha_do_tempo')) # NF Venda → Liberação
     
     # 5 etapas do processo sem horários
     etapas_info = [
@@ -1158,93 +1036,47 @@ def main():
     # Espaçamento adequado após a linha do tempo
     st.markdown('<div style="margin-bottom: 30px;"></div>', unsafe_allow_html=True)
     
-    # Identificar colunas para gaps (manter funcionalidade)
-    colunas = list(df.columns)
-    etapas_encontradas = {}
-    
-    # Mapear etapas principais
+    # Etapas para os gaps: colunas canônicas do esquema presentes no período
     mapeamento_etapas = {
-        'entrada_patio': ('HORA TICKET', 'Entrada no Pátio (Ticket)'),
-        'retorno_simbolico': ('SIMBOLICO', 'Retorno Simbólico'),
-        'nota_venda': ('NF DE VENDA', 'Nota de Venda'),
-        'hora_senha': ('SENHA', 'Hora Senha'),
-        'hora_gate': ('GATE', 'Hora Gate'),
-        'liberacao': ('LIBERAÇÃO', 'Liberação')
+        'entrada_patio': (COLUNAS['hora_ticket'], 'Entrada no Pátio (Ticket)'),
+        'retorno_simbolico': (COLUNAS['hora_retorno_simbolico'], 'Retorno Simbólico'),
+        'nota_venda': (COLUNAS['hora_nf_venda'], 'Nota de Venda'),
+        'hora_senha': (COLUNAS['hora_senha'], 'Hora Senha'),
+        'hora_gate': (COLUNAS['hora_gate'], 'Hora Gate'),
+        'liberacao': (COLUNAS['hora_liberacao'], 'Liberação')
+    }
+    etapas_encontradas = {
+        etapa_id: {'coluna': coluna, 'nome': nome_etapa}
+        for etapa_id, (coluna, nome_etapa) in mapeamento_etapas.items()
+        if coluna in df.columns
     }
     
-    for etapa_id, (busca, nome_etapa) in mapeamento_etapas.items():
-        for col in colunas:
-            if busca in col.upper() and 'HORA' in col.upper():
-                etapas_encontradas[etapa_id] = {'coluna': col, 'nome': nome_etapa}
-                break
-    
-    # Função para calcular gaps de um período específico
-    def calcular_gaps_periodo(df_periodo, nome_periodo):
+    # Função para calcular gaps de um período específico (estatísticas do cubo do período)
+    def calcular_gaps_periodo(cubo_periodo, nome_periodo):
         gaps = {}
         
-        # Gap 1: Cliente - Tempo para enviar NF
-        if 'entrada_patio' in etapas_encontradas and 'nota_venda' in etapas_encontradas:
-            try:
-                col_ticket = etapas_encontradas['entrada_patio']['coluna']
-                col_nf = etapas_encontradas['nota_venda']['coluna']
-                
-                # Converter para datetime
-                base_date = pd.Timestamp('2024-01-01')
-                
-                dt_ticket = pd.to_datetime(base_date.strftime('%Y-%m-%d') + ' ' + df_periodo[col_ticket].astype(str), errors='coerce')
-                dt_nf = pd.to_datetime(base_date.strftime('%Y-%m-%d') + ' ' + df_periodo[col_nf].astype(str), errors='coerce')
-                
-                # Calcular diferença
-                diferenca = (dt_nf - dt_ticket).dt.total_seconds() / 3600
-                diferenca = diferenca.where(diferenca >= 0, diferenca + 24)  # Ajustar para horários que cruzam meia-noite
-                
-                dados_validos = diferenca.dropna()
-                
-                if len(dados_validos) > 0:
-                    gaps[f'Gap Cliente (Envio NF Venda) - {nome_periodo}'] = {
-                        'tempo_medio': dados_validos.mean(),
-                        'tempo_maximo': dados_validos.max(),
-                        'tempo_minimo': dados_validos.min(),
-                        'registros': len(dados_validos),
-                        'dados': dados_validos,
-                        'periodo': nome_periodo
-                    }
-            except Exception as e:
-                st.warning(f"Erro no Gap Cliente {nome_periodo}: {str(e)}")
-        
-        # Gap 2: Pátio - Tempo de liberação
-        if 'nota_venda' in etapas_encontradas and 'liberacao' in etapas_encontradas:
-            try:
-                col_nf = etapas_encontradas['nota_venda']['coluna']
-                col_liberacao = etapas_encontradas['liberacao']['coluna']
-                
-                base_date = pd.Timestamp('2024-01-01')
-                
-                dt_nf = pd.to_datetime(base_date.strftime('%Y-%m-%d') + ' ' + df_periodo[col_nf].astype(str), errors='coerce')
-                dt_liberacao = pd.to_datetime(base_date.strftime('%Y-%m-%d') + ' ' + df_periodo[col_liberacao].astype(str), errors='coerce')
-                
-                diferenca = (dt_liberacao - dt_nf).dt.total_seconds() / 3600
-                diferenca = diferenca.where(diferenca >= 0, diferenca + 24)
-                
-                dados_validos = diferenca.dropna()
-                
-                if len(dados_validos) > 0:
-                    gaps[f'Gap Pátio (Liberação) - {nome_periodo}'] = {
-                        'tempo_medio': dados_validos.mean(),
-                        'tempo_maximo': dados_validos.max(),
-                        'tempo_minimo': dados_validos.min(),
-                        'registros': len(dados_validos),
-                        'dados': dados_validos,
-                        'periodo': nome_periodo
-                    }
-            except Exception as e:
-                st.warning(f"Erro no Gap Pátio {nome_periodo}: {str(e)}")
+        # Gap 1: Cliente - Tempo para enviar NF; Gap 2: Pátio - Tempo de liberação
+        for par, nome_gap in ((('ticket', 'nf_venda'), 'Gap Cliente (Envio NF Venda)'),
+                              (('nf_venda', 'liberacao'), 'Gap Pátio (Liberação)')):
+            estatisticas = cubo_periodo.estatisticas(par, 'gaps')
+            quantis = cubo_periodo.quantis(par, 'gaps') or {}
+            
+            if estatisticas is not None:
+                gaps[f'{nome_gap} - {nome_periodo}'] = {
+                    'tempo_medio': estatisticas['media'] / 3600,
+                    'tempo_maximo': estatisticas['maximo'] / 3600,
+                    'tempo_minimo': estatisticas['minimo'] / 3600,
+                    'desvio_padrao': estatisticas['desvio'] / 3600,
+                    'registros': estatisticas['n'],
+                    'quantis': {quantil: segundos / 3600 for quantil, segundos in quantis.items()},
+                    'periodo': nome_periodo
+                }
         
         return gaps
     
     # Calcular gaps para P1 eP2
-    gaps_p1 = calcular_gaps_periodo(df, 'P1')
-    gaps_p2 = calcular_gaps_periodo(df_p2, 'P2')
+    gaps_p1 = calcular_gaps_periodo(cubo_p1, 'P1')
+    gaps_p2 = calcular_gaps_periodo(cubo_p2, 'P2')
     
     # Combinar todos os gaps calculados
     gaps_calculados = {**gaps_p1, **gaps_p2}    # EXIBIR RESULTADOS DOS GAPS
@@ -1311,8 +1143,10 @@ def main():
                             label="P1",
                             value=f"{tempo_p1:.1f}h",
                             delta=f"{registros_p1} processos",
-                            help=f"Período 1: {periodo_texto}\nStatus: {status_p1}\nTempo máximo: {dados_p1['tempo_maximo']:.1f}h"
+                            help=f"Período 1: {periodo_texto}\nStatus: {status_p1}\nTempo máximo: {dados_p1['tempo_maximo']:.1f}h\nDesvio padrão: {dados_p1['desvio_padrao']:.1f}h"
                         )
+                        if dados_p1['quantis']:
+                            st.caption(" · ".join(f"P{int(quantil * 100)} {horas:.1f}h" for quantil, horas in dados_p1['quantis'].items()))
                 
                 #P2
                 if 'P2' in periodos:
@@ -1326,8 +1160,10 @@ def main():
                             label="P2",
                             value=f"{tempo_p2:.1f}h",
                             delta=f"{registros_p2} processos",
-                            help=f"Período 2: {periodo_p2_texto}\nStatus: {status_p2}\nTempo máximo: {dados_p2['tempo_maximo']:.1f}h"
+                            help=f"Período 2: {periodo_p2_texto}\nStatus: {status_p2}\nTempo máximo: {dados_p2['tempo_maximo']:.1f}h\nDesvio padrão: {dados_p2['desvio_padrao']:.1f}h"
                         )
+                        if dados_p2['quantis']:
+                            st.caption(" · ".join(f"P{int(quantil * 100)} {horas:.1f}h" for quantil, horas in dados_p2['quantis'].items()))
                 
                 # Comparação
                 if 'P1' in periodos and 'P2' in periodos:
@@ -1541,7 +1377,7 @@ def main():
     colunas_importantes = []
     
     # Colunas essenciais que sempre tentamos incluir
-    colunas_padrao = ['DATA', 'CLIENTE', 'EXPEDIÇÃO']
+    colunas_padrao = [COLUNAS['data'], COLUNAS['cliente'], COLUNAS['expedicao']]
     
     for col in colunas_padrao:
         if col in df.columns:
@@ -1552,13 +1388,11 @@ def main():
         if dados['coluna'] not in colunas_importantes:
             colunas_importantes.append(dados['coluna'])
     
-    # Buscar outras colunas relevantes
-    outras_colunas_relevantes = [col for col in df.columns if any(termo in col.upper() for termo in 
-                                ['NF', 'NOTA', 'DOCUMENTO', 'PROCESSO', 'STATUS', 'DESTINO'])]
+    # Outras colunas relevantes (documentos da troca de nota)
+    outras_colunas_relevantes = [COLUNAS['possui_conta_ordem'], COLUNAS['nota_venda']]
     
-    # Adicionar até 3 colunas relevantes adicionais
-    for col in outras_colunas_relevantes[:3]:
-        if col not in colunas_importantes:
+    for col in outras_colunas_relevantes:
+        if col in df.columns and col not in colunas_importantes:
             colunas_importantes.append(col)
     
     # Criar tabela limpa
@@ -1571,6 +1405,9 @@ def main():
         
         # Limpar e formatar os dados
         for col in df_exibir.columns:
+            # Horários (segundos desde a meia-noite) voltam a HH:MM:SS só para exibir
+            if df_exibir[col].dtype == 'Int32':
+                df_exibir[col] = formatar_horarios(df_exibir[col])
             # Substituir valores nulos por texto mais limpo
             df_exibir[col] = df_exibir[col].fillna('-')
             
@@ -1620,7 +1457,7 @@ def main():
         st.markdown("*Percentual de preenchimento por campo - Use para cobrar qualidade no dia a dia*")
         
         # Filtrar colunas removendo DATA e adicionando coluna de Total no início
-        colunas_filtradas = [col for col in colunas_existentes if 'DATA' not in col.upper()]
+        colunas_filtradas = [col for col in colunas_existentes if TIPOS_COLUNAS.get(col) != 'data']
         
         # Criar lista final com Total de Processos no início
         cols_stats = st.columns(len(colunas_filtradas) + 1)
@@ -1636,9 +1473,14 @@ def main():
             )
         
         # Demais colunas: Qualidade de preenchimento
+        # Perfil da planilha inteira (calculado na leitura) para comparar com o período
+        perfil_planilha = carregar_perfil_colunas()
+        perfil_colunas = perfil_planilha.get('colunas', {})
+        registros_planilha = perfil_planilha.get('registros', 0)
         for idx, col in enumerate(colunas_filtradas):
             with cols_stats[idx + 1]:
-                valores_preenchidos = df[col].notna().sum()
+                # Vazio: NA nos horários, '' nos textos
+                valores_preenchidos = (df[col].notna() & (df[col] != '')).sum()
                 percentual_preenchimento = (valores_preenchidos / total_registros) * 100
                 celulas_vazias = total_registros - valores_preenchidos
                 
@@ -1650,11 +1492,16 @@ def main():
                 else:
                     status_cor = "RUIM"
                 
+                texto_planilha = ""
+                perfil_col = perfil_colunas.get(col)
+                if perfil_col and registros_planilha:
+                    texto_planilha = f"\n\nPlanilha inteira: {perfil_col['preenchidas'] / registros_planilha * 100:.1f}% preenchido · tipo {perfil_col['tipo']} · {perfil_col['distintos']:,} valores distintos"
+                
                 st.metric(
                     label=col.replace('HORA', 'H.'),
                     value=f"{percentual_preenchimento:.1f}%",
                     delta=f"{valores_preenchidos:,} de {total_registros:,}",
-                    help=f"QUALIDADE DE PREENCHIMENTO\n\nCampos preenchidos: {valores_preenchidos:,}\nCampos vazios: {celulas_vazias:,}\nQualidade: {status_cor}\n\nUse para cobrar o preenchimento correto das planilhas no dia a dia!\n\nMeta recomendada: >95% preenchimento"
+                    help=f"QUALIDADE DE PREENCHIMENTO\n\nCampos preenchidos: {valores_preenchidos:,}\nCampos vazios: {celulas_vazias:,}\nQualidade: {status_cor}{texto_planilha}\n\nUse para cobrar o preenchimento correto das planilhas no dia a dia!\n\nMeta recomendada: >95% preenchimento"
                 )
         
         # Download da tabela (opcional)
@@ -0,0 +1,184 @@
+"""
+🧭 ESQUEMA DE COLUNAS TERLOC - Nomes canônicos, tipos e apelidos das colunas da planilha
+=========================================================================================
+Os cabeçalhos da planilha são resolvidos uma única vez na ingestão contra o esquema
+declarado aqui (espaços, maiúsculas e acentos não contam; grafias alternativas ficam em
+`apelidos`). O cache guarda as colunas já com o nome canônico e o dashboard acessa cada
+uma pelo id (COLUNAS['hora_gate']), sem procurar nomes por trecho a cada renderização.
+O instante absoluto de cada etapa do processo também é calculado aqui, uma vez na ingestão.
+"""
+
+import difflib
+
+import pandas as pd
+
+from normalizador_terloc import limpar_nome
+
+# id -> coluna canônica, tipo na coerção ('data' | 'hora' | 'texto'), outras grafias do
+# cabeçalho e se alguma métrica do dashboard depende dela (ausente: aviso na carga)
+ESQUEMA_COLUNAS = {
+    'data': {'coluna': 'DATA', 'tipo': 'data', 'obrigatoria': True},
+    'expedicao': {'coluna': 'EXPEDIÇÃO', 'tipo': 'texto', 'obrigatoria': True},
+    'motorista': {'coluna': 'MOTORISTA', 'tipo': 'texto', 'obrigatoria': True},
+    'placa': {'coluna': 'PLACA', 'tipo': 'texto', 'obrigatoria': True},
+    'cliente': {'coluna': 'CLIENTE', 'tipo': 'texto', 'obrigatoria': True},
+    'cliente_venda': {'coluna': 'CLIENTE DE VENDA', 'tipo': 'texto'},
+    'possui_conta_ordem': {'coluna': 'POSSUI NF DE CONTA E ORDEM?', 'tipo': 'texto'},
+    'data_retorno_simbolico': {'coluna': 'DATA EMISSÃO RETORNO SIMBÓLICO', 'tipo': 'data'},
+    'hora_retorno_simbolico': {'coluna': 'HORA EMISSÃO RETORNO SIMBÓLICO', 'tipo': 'hora'},
+    'retorno_simbolico': {'coluna': 'RETORNO SIMBÓLICO', 'tipo': 'texto'},
+    'nota_venda': {'coluna': 'NOTA DE VENDA', 'tipo': 'texto'},
+    'hora_nf_venda': {'coluna': 'HORA RECEBIMENTO NF DE VENDA', 'tipo': 'hora', 'obrigatoria': True,
+                      'apelidos': ['HORA RECEBIMENTO NF VENDA', 'HORARIO RECEBIMENTO NF DE VENDA']},
+    'conta_ordem': {'coluna': 'CONTA E ORDEM', 'tipo': 'texto'},
+    'data_ticket': {'coluna': 'DATA TICKET', 'tipo': 'data', 'obrigatoria': True},
+    'hora_ticket': {'coluna': 'HORA TICKET', 'tipo': 'hora', 'obrigatoria': True,
+                    'apelidos': ['HORARIO TICKET']},
+    'hora_senha': {'coluna': 'HORARIO SENHA', 'tipo': 'hora', 'obrigatoria': True,
+                   'apelidos': ['HORA SENHA']},
+    'hora_gate': {'coluna': 'HORA GATE', 'tipo': 'hora', 'obrigatoria': True,
+                  'apelidos': ['HORARIO GATE']},
+    'colaborador_nf': {'coluna': 'COLABORADOR QUE RECEBEU A NF', 'tipo': 'texto'},
+    'data_liberacao': {'coluna': 'DATA DE LIBERAÇÃO', 'tipo': 'data', 'obrigatoria': True},
+    'hora_liberacao': {'coluna': 'HORARIO DE LIBERAÇÃO', 'tipo': 'hora', 'obrigatoria': True,
+                       'apelidos': ['HORA DE LIBERAÇÃO', 'HORARIO LIBERAÇÃO', 'HORA LIBERAÇÃO']},
+    'colaborador_liberacao': {'coluna': 'COLABORADOR LIBERAÇÃO', 'tipo': 'texto'},
+    'obs': {'coluna': 'OBS', 'tipo': 'texto', 'apelidos': ['OBSERVAÇÃO', 'OBSERVAÇÕES']},
+}
+
+# Nome canônico por id e tipo por nome canônico
+COLUNAS = {id_coluna: item['coluna'] for id_coluna, item in ESQUEMA_COLUNAS.items()}
+TIPOS_COLUNAS = {item['coluna']: item['tipo'] for item in ESQUEMA_COLUNAS.values()}
+
+# Etapas do processo: coluna de horário, colunas de data (vale a primeira preenchida) e etapa
+# anterior. Sem data própria, o horário fica no dia da etapa anterior (ver instantes_etapas)
+ETAPAS = {
+    'ticket': {'hora': 'hora_ticket', 'datas': ['data_ticket', 'data']},
+    'senha': {'hora': 'hora_senha', 'anterior': 'ticket'},
+    'gate': {'hora': 'hora_gate', 'anterior': 'senha'},
+    'nf_venda': {'hora': 'hora_nf_venda', 'anterior': 'gate'},
+    'liberacao': {'hora': 'hora_liberacao', 'datas': ['data_liberacao'], 'anterior': 'nf_venda'},
+    'retorno_simbolico': {'hora': 'hora_retorno_simbolico', 'datas': ['data_retorno_simbolico'], 'anterior': 'ticket'},
+}
+
+# Coluna do cache com o instante de cada etapa: segundos desde 1970-01-01 (Int64, vazio: NA)
+INSTANTES = {etapa: f'instante_{etapa}' for etapa in ETAPAS}
+
+# Horário mais de 12h antes da etapa anterior (no mesmo dia) = processo cruzou a meia-noite
+VIRADA_DIA = 12 * 3600
+
+# Data própria a mais de 3 dias da etapa anterior é erro de digitação (ano/mês trocado):
+# o horário herda o dia da etapa anterior
+PRAZO_DATA_PROPRIA = 3 * 86400
+
+# Similaridade mínima (difflib) para apontar um cabeçalho desconhecido como a provável
+# nova grafia de uma coluna ausente
+LIMITE_SUGESTAO = 0.6
+
+
+def chave_cabecalho(nome):
+    """Cabeçalho comparável: maiúsculas, sem acentos e com espaços simples"""
+    return ' '.join(limpar_nome(nome).split())
+
+
+# Chave de cada grafia conhecida (nome canônico e apelidos) -> id
+CHAVES_COLUNAS = {
+    chave_cabecalho(grafia): id_coluna
+    for id_coluna, item in ESQUEMA_COLUNAS.items()
+    for grafia in [item['coluna'], *item.get('apelidos', [])]
+}
+
+
+def resolver_cabecalho(colunas):
+    """Resolve os nomes de coluna lidos da planilha contra o esquema.
+
+    Retorna (nomes, resolucao): os nomes na mesma ordem, já canônicos onde o cabeçalho
+    foi reconhecido, e o resumo gravado no manifest do cache:
+    - 'colunas': nome canônico -> cabeçalho original
+    - 'ausentes': colunas do esquema que a planilha não tem
+    - 'desconhecidas': cabeçalhos fora do esquema (as "Unnamed" não contam)
+    - 'sugestoes': coluna ausente -> cabeçalho desconhecido mais parecido
+    """
+    nomes = []
+    resolvidas = {}
+    desconhecidas = []
+    for coluna in colunas:
+        id_coluna = CHAVES_COLUNAS.get(chave_cabecalho(coluna))
+        # Cabeçalho repetido: só a primeira ocorrência fica com o nome canônico
+        if id_coluna is None or COLUNAS[id_coluna] in resolvidas:
+            nomes.append(coluna)
+            if not coluna.startswith('Unnamed:'):
+                desconhecidas.append(coluna)
+            continue
+        resolvidas[COLUNAS[id_coluna]] = coluna
+        nomes.append(COLUNAS[id_coluna])
+
+    ausentes = [coluna for coluna in COLUNAS.values() if coluna not in resolvidas]
+    chaves_desconhecidas = {chave_cabecalho(coluna): coluna for coluna in desconhecidas}
+    sugestoes = {}
+    for coluna in ausentes:
+        parecidas = difflib.get_close_matches(chave_cabecalho(coluna), list(chaves_desconhecidas), n=1, cutoff=LIMITE_SUGESTAO)
+        if parecidas:
+            sugestoes[coluna] = chaves_desconhecidas[parecidas[0]]
+
+    return nomes, {
+        'colunas': resolvidas,
+        'ausentes': ausentes,
+        'desconhecidas': desconhecidas,
+        'sugestoes': sugestoes,
+    }
+
+
+def avisos_esquema(resolucao):
+    """Colunas obrigatórias ausentes, com o cabeçalho parecido quando houver
+    (ex.: "HORA GATE (cabeçalho parecido: 'HR GATE')")"""
+    if not resolucao:
+        return []
+    obrigatorias = {item['coluna'] for item in ESQUEMA_COLUNAS.values() if item.get('obrigatoria')}
+    avisos = []
+    for coluna in resolucao.get('ausentes', []):
+        if coluna not in obrigatorias:
+            continue
+        parecida = resolucao.get('sugestoes', {}).get(coluna)
+        avisos.append(f"{coluna} (cabeçalho parecido: '{parecida}')" if parecida else coluna)
+    return avisos
+
+
+def instantes_etapas(df):
+    """Instante absoluto de cada etapa (colunas INSTANTES) a partir das colunas já tipadas:
+    datas em datetime64 e horários em segundos desde a meia-noite.
+
+    Etapa com data própria preenchida: data + horário. Sem ela (ou com ela a mais de
+    PRAZO_DATA_PROPRIA do último instante conhecido das etapas anteriores), o horário fica
+    no dia desse instante e passa para o dia seguinte quando cai mais de VIRADA_DIA antes
+    dele. Etapas cujo horário não existe na planilha ficam de fora.
+    """
+    instantes = {}
+    referencias = {}  # etapa -> último instante conhecido até ela (segundos, NaN sem nenhum)
+    for etapa, info in ETAPAS.items():
+        anterior = referencias.get(info.get('anterior'))
+        coluna_hora = COLUNAS[info['hora']]
+        if coluna_hora not in df.columns:
+            if anterior is not None:
+                referencias[etapa] = anterior
+            continue
+
+        segundos = df[coluna_hora].astype('float64')
+        data = None
+        for id_data in info.get('datas', []):
+            if COLUNAS[id_data] in df.columns:
+                serie = pd.to_datetime(df[COLUNAS[id_data]], errors='coerce').dt.normalize()
+                data = serie if data is None else data.fillna(serie)
+        dia = (data - pd.Timestamp(0)).dt.total_seconds() if data is not None else pd.Series(float('nan'), index=df.index)
+
+        instante = dia + segundos
+        if anterior is not None:
+            herdado = anterior // 86400 * 86400 + segundos
+            herdado = herdado.where(~(herdado < anterior - VIRADA_DIA), herdado + 86400)
+            plausivel = anterior.isna() | ((instante - anterior).abs() <= PRAZO_DATA_PROPRIA)
+            instante = instante.where(plausivel).fillna(herdado)
+            referencias[etapa] = instante.fillna(anterior)
+        else:
+            referencias[etapa] = instante
+        instantes[INSTANTES[etapa]] = instante.round().astype('Int64')
+    return instantes
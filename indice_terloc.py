@@ -0,0 +1,91 @@
+"""
+🗂️ ÍNDICES TERLOC - Períodos e clientes como posições de linhas
+================================================================
+O dataset vem do cache ordenado por data: um período é uma faixa contígua de posições,
+achada por busca binária. Para CLIENTE e CLIENTE DE VENDA, um índice invertido (categoria ->
+posições das linhas, em ordem) é montado uma vez por versão do dataset; os filtros da sidebar
+viram buscas nesse índice restritas à faixa do período, sem máscaras sobre o dataset inteiro.
+"""
+
+import numpy as np
+import pandas as pd
+
+from esquema_terloc import COLUNAS
+
+# Colunas com multiselect na sidebar
+COLUNAS_INDEXADAS = (COLUNAS['cliente'], COLUNAS['cliente_venda'])
+
+
+def posicoes_periodo(df, inicio, fim):
+    """Posições (slice) das linhas com data entre inicio e fim, inclusive, num DataFrame
+    ordenado por data_convertida: duas buscas binárias, sem varrer as datas"""
+    datas = df['data_convertida'].to_numpy()
+    fim_exclusivo = pd.Timestamp(fim) + pd.Timedelta(days=1)
+    return slice(int(datas.searchsorted(pd.Timestamp(inicio).to_datetime64())),
+                 int(datas.searchsorted(fim_exclusivo.to_datetime64())))
+
+
+def fatiar_periodo(df, inicio, fim):
+    """Linhas de um período como fatia contígua (iloc) do DataFrame ordenado por data:
+    sem máscara booleana nem cópia das linhas"""
+    return df.iloc[posicoes_periodo(df, inicio, fim)]
+
+
+class IndiceCategorias:
+    """🗂️ Índice invertido categoria -> posições das linhas, por coluna indexada.
+
+    As posições de todas as categorias ficam num único vetor, agrupadas por código da
+    categoria e em ordem crescente dentro de cada uma; `chaves` (código * linhas + posição)
+    é crescente no vetor inteiro, então a faixa de uma categoria dentro de um período
+    sai de duas buscas binárias. `linhas` nos métodos é a fatia do período (slice) ou um
+    vetor de posições já filtradas por outra coluna.
+    """
+
+    def __init__(self, df, colunas=COLUNAS_INDEXADAS):
+        self.registros = len(df)
+        self.colunas = {}
+        for coluna in colunas:
+            if coluna not in df.columns:
+                continue
+            serie = df[coluna]
+            if not isinstance(serie.dtype, pd.CategoricalDtype):
+                serie = serie.astype('category')
+            codigos = serie.cat.codes.to_numpy()  # -1 = vazio
+            posicoes = np.argsort(codigos, kind='stable')
+            self.colunas[coluna] = {
+                'categorias': serie.cat.categories,
+                'codigos': codigos,
+                'posicoes': posicoes,
+                'chaves': codigos[posicoes].astype('int64') * self.registros + posicoes,
+            }
+
+    def faixas(self, coluna, codigos, linhas):
+        """Início e fim, no vetor de posições, das linhas de cada código dentro da fatia"""
+        info = self.colunas[coluna]
+        inicio, fim, _ = linhas.indices(self.registros)
+        base = np.asarray(codigos, dtype='int64') * self.registros
+        return info['chaves'].searchsorted(base + inicio), info['chaves'].searchsorted(base + fim)
+
+    def opcoes(self, coluna, linhas=slice(None)):
+        """Categorias com alguma linha entre `linhas`, em ordem alfabética"""
+        if coluna not in self.colunas:
+            return []
+        info = self.colunas[coluna]
+        if isinstance(linhas, slice):
+            inicio, fim = self.faixas(coluna, np.arange(len(info['categorias'])), linhas)
+            presentes = fim > inicio
+        else:
+            codigos = info['codigos'][linhas]
+            presentes = np.bincount(codigos[codigos >= 0], minlength=len(info['categorias'])) > 0
+        return sorted(info['categorias'][presentes])
+
+    def posicoes(self, coluna, selecionados, linhas=slice(None)):
+        """Posições (crescentes) das linhas entre `linhas` com alguma das categorias selecionadas"""
+        info = self.colunas[coluna]
+        codigos = info['categorias'].get_indexer(selecionados)
+        codigos = codigos[codigos >= 0]
+        if not isinstance(linhas, slice):
+            return linhas[np.isin(info['codigos'][linhas], codigos)]
+        inicio, fim = self.faixas(coluna, codigos, linhas)
+        partes = [info['posicoes'][i:f] for i, f in zip(inicio, fim)]
+        return np.sort(np.concatenate(partes)) if partes else np.empty(0, dtype='int64')
@@ -0,0 +1,73 @@
+"""
+⏱️ MOTOR DE INTERVALOS TERLOC - Durações entre as etapas do processo
+=====================================================================
+As durações de todos os pares de etapas declarados em PARES_ETAPAS saem de uma única
+subtração NumPy sobre os instantes absolutos gravados na ingestão (esquema_terloc),
+uma vez por período. Cada seção do dashboard (cartões, linha do tempo, gaps, permanência)
+só aplica o limite que o par declara para ela, sem recalcular as durações.
+"""
+
+import numpy as np
+
+from esquema_terloc import INSTANTES
+
+HORA = 3600
+
+# Par de etapas (início, fim) -> limite superior (s) da duração em cada uso; None = sem
+# limite. Durações negativas (etapa registrada antes da anterior) nunca entram; virada da
+# meia-noite e processos de vários dias já vêm resolvidos nos instantes
+PARES_ETAPAS = {
+    ('ticket', 'senha'): {'cartoes': 24 * HORA, 'linha_do_tempo': 6 * HORA},
+    ('senha', 'gate'): {'cartoes': 24 * HORA, 'linha_do_tempo': 6 * HORA},
+    # A NF de venda pode chegar dias depois do gate
+    ('gate', 'nf_venda'): {'cartoes': 24 * HORA, 'linha_do_tempo': 72 * HORA},
+    ('nf_venda', 'liberacao'): {'cartoes': 24 * HORA, 'linha_do_tempo': 6 * HORA, 'gaps': None},
+    ('ticket', 'nf_venda'): {'gaps': None},
+    ('ticket', 'liberacao'): {'permanencia': 24 * HORA},
+}
+
+
+class MotorIntervalos:
+    """⏱️ Durações (s) de todos os pares de etapas de um período: matriz linhas x pares.
+
+    Pares com alguma etapa fora do DataFrame ficam indisponíveis (sem linhas válidas).
+    """
+
+    def __init__(self, df):
+        presentes = [etapa for etapa, coluna in INSTANTES.items() if coluna in df.columns]
+        posicao = {etapa: i for i, etapa in enumerate(presentes)}
+        self.pares = [par for par in PARES_ETAPAS if par[0] in posicao and par[1] in posicao]
+        self.coluna = {par: i for i, par in enumerate(self.pares)}
+
+        # Instantes linhas x etapas (NaN onde a etapa está vazia) e todas as diferenças de uma vez
+        instantes = np.empty((len(df), len(presentes)))
+        for etapa, i in posicao.items():
+            instantes[:, i] = df[INSTANTES[etapa]].to_numpy(dtype='float64', na_value=np.nan)
+        inicio = [posicao[par[0]] for par in self.pares]
+        fim = [posicao[par[1]] for par in self.pares]
+        self.duracoes = instantes[:, fim] - instantes[:, inicio]
+
+    def disponivel(self, par):
+        return par in self.coluna
+
+    def mascara(self, par, uso):
+        """Linhas com duração válida para o uso: preenchida, não negativa e dentro do limite"""
+        if par not in self.coluna:
+            return np.zeros(len(self.duracoes), dtype=bool)
+        duracoes = self.duracoes[:, self.coluna[par]]
+        limite = PARES_ETAPAS[par][uso]
+        mascara = duracoes >= 0
+        if limite is not None:
+            mascara &= duracoes <= limite
+        return mascara
+
+    def validas(self, par, uso):
+        """Durações válidas (s) do par para o uso, na ordem das linhas"""
+        if par not in self.coluna:
+            return np.empty(0)
+        return self.duracoes[self.mascara(par, uso), self.coluna[par]]
+
+    def media(self, par, uso):
+        """Duração média (s) do par para o uso, None sem nenhuma linha válida"""
+        validas = self.validas(par, uso)
+        return float(validas.mean()) if len(validas) else None
@@ -0,0 +1,471 @@
+"""
+🔤 NORMALIZADOR DE NOMES TERLOC - Clientes e Clientes de Venda
+===============================================================
+Normalizador compilado: o arquivo de mapeamento e o de regras são interpretados uma
+única vez (recompilados só quando mudam) e cada nome distinto é resolvido uma única vez.
+Grafias novas que não casam com nada são aproximadas do nome padrão mais parecido
+(índice de trigramas) e as aproximações ficam gravadas no arquivo de apelidos aprendidos.
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+from datetime import date
+from collections import deque
+from pathlib import Path
+
+import pandas as pd
+
+# Acentos removidos antes de consultar o mapeamento (um único str.translate por nome)
+TABELA_ACENTOS = str.maketrans('ÃÕÇÉÊÍÓÔÚÙÛÜ', 'AOCEEIOOUUUU')
+
+# Tipos de nome normalizados (seções do mapeamento e do arquivo de regras)
+TIPOS = ('cliente', 'cliente_venda')
+
+
+# Similaridade (Dice de trigramas) mínima para aplicar uma aproximação automaticamente e
+# para registrá-la como sugestão (não aplicada) no arquivo de apelidos
+LIMITE_ACEITE = 0.8
+LIMITE_SUGESTAO = 0.6
+
+
+def limpar_nome(nome):
+    """Texto em maiúsculas, sem espaços nas pontas e sem acentos"""
+    return str(nome).strip().upper().translate(TABELA_ACENTOS)
+
+
+def interpretar_mapeamento(conteudo):
+    """Interpreta o texto do arquivo de mapeamento: (clientes, clientes_venda), variação -> nome padrão"""
+    secoes = conteudo.split('2. Cliente de Venda')
+    secao_clientes = secoes[0].replace('1. Clientes', '').strip()
+    secao_clientes_venda = secoes[1].strip() if len(secoes) > 1 else ''
+    return interpretar_secao(secao_clientes), interpretar_secao(secao_clientes_venda)
+
+
+def interpretar_secao(secao):
+    """Blocos "Nome Padrão: NOME Variações:" seguidos de uma variação por linha"""
+    mapeamento = {}
+    for bloco in secao.split('Nome Padrão:')[1:]:
+        linhas = [l.strip() for l in bloco.strip().split('\n') if l.strip()]
+        if linhas:
+            # Primeira linha contém: "NOME PADRAO Variações:"
+            primeira_linha = linhas[0].strip()
+            if ' Variações:' in primeira_linha:
+                nome_padrao = primeira_linha.replace(' Variações:', '').strip()
+            else:
+                nome_padrao = primeira_linha
+
+            # Processar variações (a partir da linha 1)
+            for linha in linhas[1:]:
+                if linha and linha != 'Variações:':
+                    mapeamento[linha.upper()] = nome_padrao
+    return mapeamento
+
+
+def nome_sem_padrao(nome_limpo):
+    """Nome de quem não casa com nada: o próprio nome limpo, com '-' trocado por '/'"""
+    return nome_limpo.replace('-', '/').replace('  ', ' ').strip()
+
+
+def chave_aproximacao(nome_limpo):
+    """Nome só com letras, dígitos, '+' e '&' separados por um espaço (pontuação não conta)"""
+    return ' '.join(re.sub(r'[^0-9A-Z+&]+', ' ', nome_limpo).split())
+
+
+def trigramas(chave):
+    """Trigramas de caracteres, com bordas marcadas por espaços"""
+    texto = f"  {chave} "
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def interpretar_apelidos(conteudo):
+    """Interpreta o arquivo de apelidos aprendidos (JSON): tipo -> {grafia: entrada}"""
+    dados = json.loads(conteudo) if conteudo.strip() else {}
+    return {tipo: dict(dados.get(tipo, {})) for tipo in TIPOS}
+
+
+def interpretar_regras(conteudo):
+    """Interpreta o arquivo de regras (JSON): tipo ('cliente'/'cliente_venda') -> RegrasNomes"""
+    dados = json.loads(conteudo) if conteudo.strip() else {}
+    return {tipo: RegrasNomes(dados.get(tipo, [])) for tipo in TIPOS}
+
+
+class CasadorTokens:
+    """Autômato de Aho-Corasick: encontra todos os tokens presentes num texto (inclusive
+    sobrepostos) numa única passada, com custo que não cresce com o número de tokens."""
+
+    def __init__(self, tokens):
+        self.transicoes = [{}]  # nó -> {caractere: próximo nó}
+        self.saidas = [set()]   # nó -> tokens que terminam nele
+        for token in tokens:
+            no = 0
+            for caractere in token:
+                if caractere not in self.transicoes[no]:
+                    self.transicoes.append({})
+                    self.saidas.append(set())
+                    self.transicoes[no][caractere] = len(self.transicoes) - 1
+                no = self.transicoes[no][caractere]
+            self.saidas[no].add(token)
+
+        # Links de falha em largura: maior sufixo próprio que também é prefixo de um token
+        self.falhas = [0] * len(self.transicoes)
+        fila = deque(self.transicoes[0].values())
+        while fila:
+            no = fila.popleft()
+            for caractere, filho in self.transicoes[no].items():
+                falha = self.falhas[no]
+                while falha and caractere not in self.transicoes[falha]:
+                    falha = self.falhas[falha]
+                destino = self.transicoes[falha].get(caractere, 0)
+                self.falhas[filho] = destino if destino != filho else 0
+                self.saidas[filho] |= self.saidas[self.falhas[filho]]
+                fila.append(filho)
+
+    def encontrar(self, texto):
+        """Conjunto dos tokens que aparecem em `texto`"""
+        encontrados = set()
+        no = 0
+        for caractere in texto:
+            while no and caractere not in self.transicoes[no]:
+                no = self.falhas[no]
+            no = self.transicoes[no].get(caractere, 0)
+            if self.saidas[no]:
+                encontrados |= self.saidas[no]
+        return encontrados
+
+
+class RegrasNomes:
+    """Regras de fallback compiladas num único casador de tokens.
+
+    Cada regra exige todos os grupos de `tokens` (um grupo casa com qualquer uma das
+    opções) e/ou o nome `exato`; entre as regras que casam vence a de menor
+    `prioridade` (empate: a que vem primeiro no arquivo).
+    """
+
+    def __init__(self, regras):
+        self.destinos = []  # por regra (em ordem de prioridade): nome padrão
+        self.descricoes = []  # por regra: "regra <prioridade>: <nome>" (auditoria)
+        self.grupos = []    # por regra: lista de conjuntos de tokens alternativos
+        self.exatos = {}    # nome exato -> regras que o exigem
+        self.por_token = {} # token -> regras que o usam
+
+        ordenadas = sorted(enumerate(regras), key=lambda item: (item[1].get('prioridade', 0), item[0]))
+        for indice, (_, regra) in enumerate(ordenadas):
+            if not regra.get('nome'):
+                raise ValueError(f"regra sem 'nome': {regra}")
+            grupos = [
+                frozenset(limpar_nome(opcao) for opcao in (grupo if isinstance(grupo, list) else [grupo]))
+                for grupo in regra.get('tokens', [])
+            ]
+            exato = limpar_nome(regra['exato']) if regra.get('exato') else None
+            if not grupos and exato is None:
+                raise ValueError(f"regra '{regra['nome']}' sem 'tokens' nem 'exato'")
+
+            self.destinos.append(regra['nome'])
+            self.descricoes.append(f"regra {regra.get('prioridade', 0)}: {regra['nome']}")
+            self.grupos.append(grupos)
+            if exato is not None:
+                self.exatos.setdefault(exato, []).append(indice)
+            for grupo in grupos:
+                for token in grupo:
+                    self.por_token.setdefault(token, []).append(indice)
+        self.exigem_exato = {indice for indices in self.exatos.values() for indice in indices}
+        self.casador = CasadorTokens(self.por_token)
+
+    def aplicar(self, nome_limpo):
+        """Nome padrão da regra de maior prioridade que casa; None se nenhuma casar"""
+        indice = self.casar(nome_limpo)
+        return None if indice is None else self.destinos[indice]
+
+    def casar(self, nome_limpo):
+        """Índice da regra de maior prioridade que casa; None se nenhuma casar"""
+        encontrados = self.casador.encontrar(nome_limpo)
+        exatas = self.exatos.get(nome_limpo, [])
+        candidatas = set(exatas)
+        for token in encontrados:
+            candidatas.update(self.por_token[token])
+
+        for indice in sorted(candidatas):
+            if indice in self.exigem_exato and indice not in exatas:
+                continue
+            if all(grupo & encontrados for grupo in self.grupos[indice]):
+                return indice
+        return None
+
+
+class IndiceTrigramas:
+    """Índice invertido trigrama -> grafias conhecidas, para aproximar grafias novas.
+
+    Só as grafias que dividem algum trigrama com a consulta são pontuadas, então uma
+    consulta custa dezenas de microssegundos mesmo com centenas de grafias.
+    """
+
+    def __init__(self, grafias):
+        self.destinos = {}   # chave da grafia -> nome padrão
+        self.trigramas = {}  # chave da grafia -> trigramas
+        self.indice = {}     # trigrama -> chaves das grafias que o contêm
+        for grafia, destino in grafias.items():
+            chave = chave_aproximacao(grafia)
+            if not chave:
+                continue
+            self.destinos[chave] = destino
+            self.trigramas[chave] = trigramas(chave)
+            for trigrama in self.trigramas[chave]:
+                self.indice.setdefault(trigrama, set()).add(chave)
+
+    def sugerir(self, nome_limpo):
+        """(nome padrão, similaridade) da grafia mais parecida (coeficiente de Dice); None sem candidatas"""
+        consulta = trigramas(chave_aproximacao(nome_limpo))
+        comuns = {}
+        for trigrama in consulta:
+            for chave in self.indice.get(trigrama, ()):
+                comuns[chave] = comuns.get(chave, 0) + 1
+        if not comuns:
+            return None
+        # Empate de similaridade: a menor grafia em ordem alfabética (resultado determinístico)
+        similaridade, chave = min(
+            (-2 * quantidade / (len(consulta) + len(self.trigramas[chave])), chave)
+            for chave, quantidade in comuns.items()
+        )
+        return self.destinos[chave], round(-similaridade, 3)
+
+
+class NormalizadorNomes:
+    """🔤 Normalizador compilado de CLIENTE e CLIENTE DE VENDA.
+
+    Mapeamento e regras são recompilados só quando os arquivos mudam (mtime/tamanho,
+    confirmado pelo hash do conteúdo) e cada valor bruto é resolvido uma única vez por
+    versão dos arquivos (memo). `atualizar()` é chamado no início de cada lote.
+
+    Ordem de resolução: mapeamento, apelidos aprendidos (aceitos), regras, aproximação
+    pelo índice de trigramas e, por fim, o próprio nome limpo. A etapa que resolveu cada
+    valor fica registrada (`origem`) e o tempo de cada etapa é somado em `tempos`. Aproximações novas ficam
+    pendentes até `salvar_apelidos()` (com `arquivo_apelidos`); no arquivo, cada grafia
+    tem o nome padrão, a similaridade e "aceito" - false deixa a grafia como está (sugestão
+    a revisar, ou aproximação recusada) e pode ser trocado para true à mão.
+    """
+
+    def __init__(self, arquivo_mapeamento, arquivo_regras, arquivo_apelidos=None):
+        self.arquivos = {'mapeamento': Path(arquivo_mapeamento), 'regras': Path(arquivo_regras)}
+        if arquivo_apelidos is not None:
+            self.arquivos['apelidos'] = Path(arquivo_apelidos)
+        self.assinatura = None  # (mtime_ns, tamanho) de cada arquivo compilado
+        self.hashes = None      # BLAKE2 do conteúdo de cada arquivo compilado
+        self.compilado = False
+        self.mapeamentos = {tipo: {} for tipo in TIPOS}
+        self.regras = {tipo: RegrasNomes([]) for tipo in TIPOS}
+        self.apelidos = {tipo: {} for tipo in TIPOS}
+        self.indices = {tipo: IndiceTrigramas({}) for tipo in TIPOS}
+        self.novos_apelidos = {tipo: {} for tipo in TIPOS}
+        self.memo = {tipo: {} for tipo in TIPOS}
+        self.origens = {tipo: {} for tipo in TIPOS}  # valor bruto -> etapa que o resolveu
+        self.tempos = {}  # etapa -> segundos acumulados desde o último consumir_tempos()
+
+    def atualizar(self):
+        """Recompila mapeamento e regras se algum arquivo mudou; retorna True quando recompilou"""
+        assinatura = {}
+        for nome, arquivo in self.arquivos.items():
+            try:
+                stat = arquivo.stat()
+                assinatura[nome] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                assinatura[nome] = None
+
+        if self.compilado and assinatura == self.assinatura:
+            return False
+
+        conteudos = {}
+        for nome, arquivo in self.arquivos.items():
+            conteudos[nome] = b''
+            if assinatura[nome] is not None:
+                with open(arquivo, 'rb') as f:
+                    conteudos[nome] = f.read()
+        hashes = {nome: hashlib.blake2b(conteudo).hexdigest() for nome, conteudo in conteudos.items()}
+        self.assinatura = assinatura
+
+        # Só o mtime mudou (arquivo salvo sem alteração): mantém o compilado e o memo
+        if self.compilado and hashes == self.hashes:
+            return False
+
+        inicio = time.perf_counter()
+        try:
+            clientes, clientes_venda = interpretar_mapeamento(conteudos['mapeamento'].decode('utf-8'))
+            mapeamentos = {'cliente': clientes, 'cliente_venda': clientes_venda}
+        except Exception as e:
+            self.avisar(f"Erro ao carregar mapeamento: {e}")
+            mapeamentos = {tipo: {} for tipo in TIPOS}
+        try:
+            regras = interpretar_regras(conteudos['regras'].decode('utf-8'))
+        except Exception as e:
+            self.avisar(f"Erro ao carregar regras de nomes: {e}")
+            regras = {tipo: RegrasNomes([]) for tipo in TIPOS}
+        try:
+            apelidos = interpretar_apelidos(conteudos.get('apelidos', b'').decode('utf-8'))
+        except Exception as e:
+            self.avisar(f"Erro ao carregar apelidos aprendidos: {e}")
+            apelidos = {tipo: {} for tipo in TIPOS}
+
+        self.mapeamentos = mapeamentos
+        self.regras = regras
+        self.apelidos = apelidos
+        self.indices = {tipo: self.indexar(tipo) for tipo in TIPOS}
+        self.memo = {tipo: {} for tipo in TIPOS}
+        self.origens = {tipo: {} for tipo in TIPOS}
+        self.hashes = hashes
+        self.compilado = True
+        self.medir('compilacao', inicio)
+        return True
+
+    def medir(self, etapa, inicio):
+        self.tempos[etapa] = self.tempos.get(etapa, 0.0) + time.perf_counter() - inicio
+
+    def consumir_tempos(self):
+        """Tempos (s) acumulados por etapa desde a última chamada (e zera o acumulado)"""
+        tempos, self.tempos = self.tempos, {}
+        return tempos
+
+    def indexar(self, tipo):
+        """Índice de trigramas das grafias conhecidas: variações do mapeamento e nomes padrão"""
+        grafias = dict(self.mapeamentos[tipo])
+        for destino in set(self.mapeamentos[tipo].values()) | set(self.regras[tipo].destinos):
+            grafias[limpar_nome(destino)] = destino
+        return IndiceTrigramas(grafias)
+
+    def aproximar(self, nome_limpo, tipo):
+        """Nome padrão mais parecido, se a similaridade permite aplicar; registra a aproximação"""
+        sugestao = self.indices[tipo].sugerir(nome_limpo)
+        if sugestao is None or sugestao[1] < LIMITE_SUGESTAO:
+            return None
+        destino, similaridade = sugestao
+        aceito = similaridade >= LIMITE_ACEITE
+        if destino != nome_sem_padrao(nome_limpo):
+            self.novos_apelidos[tipo][nome_limpo] = {
+                'nome': destino,
+                'similaridade': similaridade,
+                'aceito': aceito,
+                'data': date.today().isoformat(),
+            }
+        return destino if aceito else None
+
+    def salvar_apelidos(self):
+        """Grava as aproximações novas no arquivo de apelidos; retorna quantas foram gravadas.
+
+        Mescla com o conteúdo atual do arquivo (entradas existentes, inclusive editadas à
+        mão, são mantidas) e troca o arquivo de forma atômica.
+        """
+        novos, self.novos_apelidos = self.novos_apelidos, {tipo: {} for tipo in TIPOS}
+        arquivo = self.arquivos.get('apelidos')
+        if arquivo is None or not any(novos.values()):
+            return 0
+
+        try:
+            with open(arquivo, 'r', encoding='utf-8') as f:
+                dados = json.load(f)
+        except (OSError, ValueError):
+            dados = {}
+        gravados = 0
+        for tipo, entradas in novos.items():
+            existentes = dados.setdefault(tipo, {})
+            for grafia, entrada in entradas.items():
+                if grafia not in existentes:
+                    existentes[grafia] = entrada
+                    gravados += 1
+        if not gravados:
+            return 0
+
+        temporario = arquivo.with_name(f"{arquivo.name}.{os.getpid()}.tmp")
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(dados, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(temporario, arquivo)
+        return gravados
+
+    def avisar(self, mensagem):
+        try:
+            import streamlit as st
+            st.warning(mensagem)
+        except:
+            print(mensagem)
+
+    def normalizar(self, nome, tipo):
+        """Nome padrão de `nome` para o `tipo` ('cliente' ou 'cliente_venda')"""
+        if pd.isna(nome) or nome == '':
+            return 'NÃO INFORMADO'
+
+        # Só textos entram no memo (1 e 1.0 têm o mesmo hash, mas str() diferente)
+        if type(nome) is not str:
+            return self.resolver(nome, tipo)[0]
+        memo = self.memo[tipo]
+        resultado = memo.get(nome)
+        if resultado is None:
+            resultado, self.origens[tipo][nome] = self.resolver(nome, tipo)
+            memo[nome] = resultado
+        return resultado
+
+    def origem(self, nome, tipo):
+        """Etapa que resolve `nome` (auditoria).
+
+        "mapeamento", "apelido", "regra <prioridade>: <nome>", "aproximação", "sem padrão"
+        (nome limpo mantido) ou "vazio".
+        """
+        if pd.isna(nome) or nome == '':
+            return 'vazio'
+        if type(nome) is not str:
+            return self.resolver(nome, tipo)[1]
+        self.normalizar(nome, tipo)
+        return self.origens[tipo][nome]
+
+    def resolver(self, nome, tipo):
+        """(nome padrão, origem): mapeamento direto, apelidos aprendidos, regras de fallback,
+        aproximação, nome limpo"""
+        if not self.compilado:
+            self.atualizar()
+        nome_limpo = limpar_nome(nome)
+
+        padrao = self.mapeamentos[tipo].get(nome_limpo)
+        if padrao is not None:
+            return padrao, 'mapeamento'
+        aprendido = self.apelidos[tipo].get(nome_limpo)
+        if aprendido is not None and aprendido.get('aceito') and aprendido.get('nome'):
+            return aprendido['nome'], 'apelido'
+        regras = self.regras[tipo]
+        indice = regras.casar(nome_limpo)
+        if indice is not None:
+            return regras.destinos[indice], regras.descricoes[indice]
+        # Grafia já registrada e não aceita: não aproximar de novo
+        if aprendido is None:
+            padrao = self.aproximar(nome_limpo, tipo)
+            if padrao is not None:
+                return padrao, 'aproximação'
+        return nome_sem_padrao(nome_limpo), 'sem padrão'
+
+    def normalizar_serie(self, serie, tipo):
+        """Normaliza uma coluna inteira; resultado categórico (categorias em ordem alfabética).
+
+        factorize -> cada valor distinto normalizado uma vez -> nomes devolvidos às linhas
+        pelos códigos inteiros: o custo acompanha o vocabulário, não o número de linhas.
+        """
+        inicio = time.perf_counter()
+        codigos, unicos = pd.factorize(serie)
+        self.medir('fatoracao', inicio)
+
+        inicio = time.perf_counter()
+        nomes = [self.normalizar(nome, tipo) for nome in unicos]
+        # Código -1 (vazio) aponta para o último elemento
+        nomes.append(self.normalizar(None, tipo))
+        self.medir('resolucao', inicio)
+
+        # Variações diferentes podem virar o mesmo nome padrão
+        inicio = time.perf_counter()
+        codigos_nomes, categorias = pd.factorize(pd.Index(nomes), sort=True)
+        resultado = pd.Series(pd.Categorical.from_codes(codigos_nomes[codigos], categories=categorias),
+                              index=serie.index, name=serie.name)
+        self.medir('montagem', inicio)
+        return resultado
+
+    def normalizar_cliente(self, nome):
+        return self.normalizar(nome, 'cliente')
+
+    def normalizar_cliente_venda(self, nome):
+        return self.normalizar(nome, 'cliente_venda')
@@ -0,0 +1,113 @@
+"""
+📋 PERFIL DE COLUNAS TERLOC - Preenchimento, tipo e cardinalidade das colunas
+==============================================================================
+Perfil calculado bloco a bloco durante a leitura em streaming (uma passada vetorizada
+por coluna e bloco, sem converter nada para texto). Decide quais colunas "Unnamed"
+descartar e vai resumido para o manifest do cache.
+"""
+
+import pandas as pd
+
+# Colunas "Unnamed" (sem cabeçalho) só são mantidas com mais células preenchidas que isto
+MINIMO_PREENCHIDAS_SEM_CABECALHO = 10
+
+# Tipos do infer_dtype do pandas que podem conter texto (células em branco: só espaços)
+TIPOS_COM_TEXTO = ('string', 'mixed', 'mixed-integer', 'mixed-integer-float')
+
+
+class PerfilColunas:
+    """📋 Perfil das colunas da planilha, acumulado bloco a bloco.
+
+    Por coluna: células não nulas, em branco (texto só com espaços), tipos inferidos das
+    células (infer_dtype do pandas) e valores distintos.
+    """
+
+    def __init__(self):
+        self.registros = 0
+        self.colunas = {}  # coluna -> {'nao_nulos', 'brancos', 'tipos', 'distintos'}
+
+    @classmethod
+    def de_dataframe(cls, df):
+        """Perfil de um DataFrame já carregado (colunas internas, prefixo "_", ficam fora)"""
+        perfil = cls()
+        perfil.adicionar(df[[col for col in df.columns if not col.startswith('_')]])
+        return perfil
+
+    def adicionar(self, chunk):
+        """Acumula um bloco de linhas no perfil"""
+        self.registros += len(chunk)
+        for col in chunk.columns:
+            info = self.colunas.setdefault(col, {'nao_nulos': 0, 'brancos': 0, 'tipos': set(), 'distintos': set()})
+            serie = chunk[col]
+            preenchidas = serie.notna()
+            nao_nulos = int(preenchidas.sum())
+            # Caso comum: colunas da área formatada da aba sem nenhum dado
+            if nao_nulos == 0:
+                continue
+
+            valores = serie[preenchidas]
+            tipo = pd.api.types.infer_dtype(valores, skipna=True)
+            info['nao_nulos'] += nao_nulos
+            info['tipos'].add(tipo)
+            if tipo in TIPOS_COM_TEXTO:
+                info['brancos'] += int(valores.str.strip().eq('').sum())
+            info['distintos'].update(pd.unique(valores))
+
+    def preenchidas(self, col):
+        info = self.colunas.get(col)
+        return 0 if info is None else info['nao_nulos'] - info['brancos']
+
+    def vazia(self, col):
+        """Coluna sem nenhuma célula não nula até aqui"""
+        info = self.colunas.get(col)
+        return info is not None and info['nao_nulos'] == 0
+
+    def descartar(self, col):
+        """Coluna "Unnamed" com poucas células preenchidas (ruído fora do cabeçalho)"""
+        return col in self.colunas and col.startswith('Unnamed:') and self.preenchidas(col) <= MINIMO_PREENCHIDAS_SEM_CABECALHO
+
+    def resumo(self):
+        """Resumo para o manifest: colunas mantidas e quantas foram descartadas"""
+        colunas = {}
+        for col, info in self.colunas.items():
+            if self.descartar(col):
+                continue
+            tipos = sorted(info['tipos'])
+            colunas[col] = {
+                'preenchidas': self.preenchidas(col),
+                'brancos': info['brancos'],
+                'nulos': self.registros - info['nao_nulos'],
+                'tipo': 'vazia' if not tipos else tipos[0] if len(tipos) == 1 else 'mixed',
+                'distintos': len(info['distintos']),
+            }
+        return {
+            'registros': self.registros,
+            'colunas': colunas,
+            'descartadas': sum(1 for col in self.colunas if self.descartar(col)),
+        }
+
+
+def somar_resumos(anterior, novo):
+    """Resumo do perfil após anexar linhas: contagens somadas; a cardinalidade passa a ser
+    um limite inferior (a maior das duas), já que os valores distintos não ficam guardados"""
+    if not anterior:
+        return novo
+    colunas = {}
+    for col, info in anterior['colunas'].items():
+        extra = novo['colunas'].get(col)
+        if extra is None:
+            colunas[col] = dict(info, nulos=info['nulos'] + novo['registros'])
+            continue
+        tipos = {info['tipo'], extra['tipo']} - {'vazia'}
+        colunas[col] = {
+            'preenchidas': info['preenchidas'] + extra['preenchidas'],
+            'brancos': info['brancos'] + extra['brancos'],
+            'nulos': info['nulos'] + extra['nulos'],
+            'tipo': 'vazia' if not tipos else tipos.pop() if len(tipos) == 1 else 'mixed',
+            'distintos': max(info['distintos'], extra['distintos']),
+        }
+    return {
+        'registros': anterior['registros'] + novo['registros'],
+        'colunas': colunas,
+        'descartadas': anterior['descartadas'],
+    }
@@ -0,0 +1,50 @@
+"""
+📐 ESBOÇOS DE QUANTIS TERLOC - Percentis das durações sem guardar nem ordenar as linhas
+=======================================================================================
+Cada duração cai num balde logarítmico (fronteiras em potências de GAMA, como no DDSketch):
+o esboço de um conjunto de durações é só a contagem por balde. Esboços se juntam somando as
+contagens do mesmo balde, então os de cada dia e cliente (artefato "esbocos_diarios") dão os
+percentis de qualquer período com erro relativo de no máximo PRECISAO_RELATIVA.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Erro relativo máximo do valor de um quantil (1%: 2h30 ± 1,5 min)
+PRECISAO_RELATIVA = 0.01
+GAMA = (1 + PRECISAO_RELATIVA) / (1 - PRECISAO_RELATIVA)
+
+# Durações zeradas (etapas registradas no mesmo horário) ficam num balde próprio
+BALDE_ZERO = -1
+
+# Percentis exibidos no dashboard
+QUANTIS = (0.5, 0.9, 0.95)
+
+
+def baldes(duracoes):
+    """Balde de cada duração (s, não negativa): ceil(log_GAMA(duração)), BALDE_ZERO para 0"""
+    duracoes = np.asarray(duracoes, dtype='float64')
+    resultado = np.full(len(duracoes), BALDE_ZERO, dtype='int16')
+    positivas = duracoes > 0
+    resultado[positivas] = np.ceil(np.log(duracoes[positivas]) / np.log(GAMA))
+    return resultado
+
+
+def valor_balde(balde):
+    """Duração representativa (s) de cada balde, a no máximo PRECISAO_RELATIVA de qualquer
+    duração que caia nele"""
+    balde = np.asarray(balde, dtype='float64')
+    return np.where(balde == BALDE_ZERO, 0.0, 2 * GAMA ** balde / (GAMA + 1))
+
+
+def quantis_do_esboco(baldes_esboco, contagens, quantis=QUANTIS):
+    """Quantis (s) de um esboço dado por baldes e contagens (repetir um balde soma as
+    contagens, o que junta esboços): {quantil: duração}, None com o esboço vazio"""
+    contagens = pd.Series(np.asarray(contagens, dtype='int64')).groupby(np.asarray(baldes_esboco)).sum()
+    acumulado = contagens.to_numpy().cumsum()
+    if not len(acumulado) or acumulado[-1] == 0:
+        return None
+    # Posição (base 0) de cada quantil entre as durações ordenadas -> balde que a contém
+    posicoes = np.asarray(quantis, dtype='float64') * (acumulado[-1] - 1)
+    indices = acumulado.searchsorted(posicoes, side='right')
+    return dict(zip(quantis, valor_balde(contagens.index.to_numpy()[indices]).tolist()))
@@ -6,12 +6,87 @@ Sistema que combina dados pré-carregados com upload opcional do usuário
 
 import streamlit as st
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import openpyxl
 import os
+import sys
+import re
+import shutil
+import zipfile
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, date, timedelta, time as horario
 import time
+import threading
+from contextlib import contextmanager
 import hashlib
+import json
 from io import BytesIO
+from normalizador_terloc import NormalizadorNomes
+from perfil_terloc import PerfilColunas, somar_resumos
+from esquema_terloc import resolver_cabecalho, avisos_esquema, instantes_etapas, TIPOS_COLUNAS, INSTANTES
+from cubo_diario_terloc import cubo_diario, esbocos_diarios
+from indice_terloc import posicoes_periodo
+
+# Leitor nativo (Rust) opcional - muito mais rápido que o openpyxl quando instalado
+try:
+    import python_calamine
+    CALAMINE_DISPONIVEL = True
+except ImportError:
+    CALAMINE_DISPONIVEL = False
+
+# Trava entre processos para a reconstrução do cache (fcntl no Linux, msvcrt no Windows)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Uma trava por dataset dentro do processo: as sessões Streamlit são threads
+TRAVAS_CACHE = {}
+TRAVAS_CACHE_GUARDA = threading.Lock()
+
+# Versão do esquema/normalização gravado no cache: incrementar ao mudar colunas gravadas
+# ou regras de normalização no código (todo cache de versão diferente é reconstruído)
+VERSAO_ESQUEMA = 7
+
+# Horário digitado na planilha ("12:00", "12:00:00"; ";" no lugar de ":" é erro comum de digitação)
+PADRAO_HORARIO = re.compile(r'\s*(\d{1,2})[:;](\d{2})(?:[:;](\d{2}))?\s*')
+
+# Formatos aceitos para datas digitadas como texto (as demais células já vêm como datetime)
+FORMATOS_DATA = ('%d/%m/%Y', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d')
+
+def segundos_do_dia(valor):
+    """Segundos desde a meia-noite de uma célula de horário; None se não for um horário"""
+    if isinstance(valor, datetime):
+        valor = valor.time()
+    if isinstance(valor, horario):
+        return valor.hour * 3600 + valor.minute * 60 + valor.second
+    if isinstance(valor, timedelta):
+        segundos = int(valor.total_seconds())
+        return segundos if 0 <= segundos < 24 * 3600 else None
+    if isinstance(valor, str):
+        partes = PADRAO_HORARIO.fullmatch(valor)
+        if partes:
+            horas, minutos, segundos = (int(parte or 0) for parte in partes.groups())
+            if horas < 24 and minutos < 60 and segundos < 60:
+                return horas * 3600 + minutos * 60 + segundos
+    return None
+
+def data_da_celula(valor):
+    """datetime de uma célula de data; None se não for uma data"""
+    if isinstance(valor, datetime):
+        return valor
+    if isinstance(valor, date):
+        return datetime(valor.year, valor.month, valor.day)
+    if isinstance(valor, str):
+        for formato in FORMATOS_DATA:
+            try:
+                return datetime.strptime(valor.strip(), formato)
+            except ValueError:
+                pass
+    return None
 
 class SistemaHibridoTerloc:
     def __init__(self):
@@ -20,366 +95,842 @@ class SistemaHibridoTerloc:
         self.cache_dir = Path("cache_terloc_hibrido")
         self.cache_dir.mkdir(exist_ok=True)
         
-        # Cache para dados padrão e usuário
-        self.cache_padrao = self.cache_dir / "dados_padrao.parquet"
-        self.cache_usuario = self.cache_dir / "dados_usuario.parquet"
-        self.metadata_padrao = self.cache_dir / "metadata_padrao.txt"
-        self.metadata_usuario = self.cache_dir / "metadata_usuario.txt"
-    
+        # Cache para dados padrão e usuário: datasets Parquet particionados por ano/mes
+        # de data_convertida (hive), para que a leitura decodifique só os meses de P1/P2.
+        # Cada gravação cria uma versão nova (dados_padrao.v<ns>) publicada pelo manifest
+        self.cache_padrao = self.cache_dir / "dados_padrao"
+        self.cache_usuario = self.cache_dir / "dados_usuario"
+        # Manifest JSON de cada dataset: versões da planilha, do mapeamento e do esquema
+        self.manifest_padrao = self.cache_dir / "manifest_padrao.json"
+        self.manifest_usuario = self.cache_dir / "manifest_usuario.json"
+        self.arquivo_mapeamento = Path('Mapeamento de Normalização de Nomes.txt')
+        # Regras de fallback (tokens/prioridade) para nomes fora do mapeamento
+        self.arquivo_regras = Path('Regras de Normalização de Nomes.json')
+        # Grafias novas aproximadas de um nome padrão (gerado na ingestão, editável à mão)
+        self.arquivo_apelidos = Path('Apelidos Aprendidos de Nomes.json')
+        # Mapeamento, regras e apelidos compilados uma vez (recompilados quando mudam) + memo por nome
+        self.normalizador = NormalizadorNomes(self.arquivo_mapeamento, self.arquivo_regras, self.arquivo_apelidos)
+        
+        # Colunas de nome normalizadas pelo mapeamento (coluna -> tipo no normalizador),
+        # gravadas como categóricas; o valor original fica no cache em "_original_<coluna>"
+        # para renormalizar sem reler a planilha
+        self.colunas_nomes = {
+            'CLIENTE': 'cliente',
+            'CLIENTE DE VENDA': 'cliente_venda',
+        }
+        
+        # Artefatos derivados gerados a cada versão publicada do dataset (ver gerar_artefatos):
+        # nome -> função(df com colunas internas) -> DataFrame
+        self.artefatos = {
+            'nomes': self.artefato_nomes,
+            'cubo_diario': cubo_diario,
+            'esbocos_diarios': esbocos_diarios,
+        }
+
+        # Leitura em streaming: linhas por bloco entregue à normalização
+        self.tamanho_chunk = 5000
+        
+        # Leitores de Excel em ordem de preferência (fallback automático para o próximo)
+        self.leitores_excel = ['calamine', 'openpyxl']
+        # O calamine materializa a área declarada da aba inteira; acima deste número de
+        # células (linhas x colunas da tag <dimension>) usamos o openpyxl em streaming
+        self.limite_celulas_calamine = 5_000_000
+        
+        # Hash só quando a assinatura (tamanho, mtime, inode) muda; lido em blocos de 1 MB
+        self.tamanho_bloco_hash = 1024 * 1024
+
     def calcular_hash_arquivo(self, arquivo_path):
-        """Calcula hash do arquivo para detectar mudanças"""
+        """Calcula hash do arquivo para detectar mudanças (BLAKE2 em blocos, memória constante)"""
         if not arquivo_path.exists():
             return None
         try:
+            digest = hashlib.blake2b(digest_size=16)
             with open(arquivo_path, 'rb') as f:
-                return hashlib.md5(f.read()).hexdigest()
+                for bloco in iter(lambda: f.read(self.tamanho_bloco_hash), b''):
+                    digest.update(bloco)
+            return digest.hexdigest()
         except Exception:
             return None
     
+    def assinatura_arquivo(self, arquivo_path):
+        """Assinatura barata do arquivo: tamanho, mtime (ns) e inode, sem ler o conteúdo"""
+        try:
+            info = arquivo_path.stat()
+        except OSError:
+            return None
+        return f"{info.st_size}:{info.st_mtime_ns}:{info.st_ino}"
+    
     def salvar_upload_usuario(self, uploaded_file):
         """Salva arquivo enviado pelo usuário"""
         try:
-            with open(self.arquivo_usuario, 'wb') as f:
-                f.write(uploaded_file.getbuffer())
-            
-            # Limpar cache do usuário para forçar recarregamento
-            if self.cache_usuario.exists():
-                self.cache_usuario.unlink()
-            if self.metadata_usuario.exists():
-                self.metadata_usuario.unlink()
+            with self.trava_cache(self.cache_usuario):
+                # Grava ao lado e troca de uma vez: ninguém lê upload pela metade
+                temporario = self.arquivo_usuario.with_name(f"{self.arquivo_usuario.name}.{os.getpid()}.tmp")
+                with open(temporario, 'wb') as f:
+                    f.write(uploaded_file.getbuffer())
+                os.replace(temporario, self.arquivo_usuario)
+                
+                # Limpar cache do usuário para forçar recarregamento
+                self.remover_cache(self.cache_usuario)
+                if self.manifest_usuario.exists():
+                    self.manifest_usuario.unlink()
             
             return True
         except Exception as e:
             st.error(f"Erro ao salvar arquivo: {e}")
             return False
-    
-    def carregar_dados_padrao(self, limite_registros=50000):
-        """Carrega dados do arquivo padrão (pré-carregado)"""
+
+    def nomes_colunas(self, cabecalho):
+        """Gera nomes de colunas a partir do cabeçalho, no mesmo padrão do pd.read_excel"""
+        nomes = []
+        vistos = {}
+        for i, valor in enumerate(cabecalho):
+            nome = f"Unnamed: {i}" if valor is None or str(valor).strip() == '' else str(valor)
+            if nome in vistos:
+                vistos[nome] += 1
+                nome = f"{nome}.{vistos[nome]}"
+            else:
+                vistos[nome] = 0
+            nomes.append(nome)
+        return nomes
+
+    def normalizar_linha(self, linha):
+        """Valores de uma linha no formato comum aos leitores ('' vira None, float inteiro vira int),
+        sem as células vazias do final"""
+        valores = []
+        for valor in linha:
+            if valor == '':
+                valor = None
+            elif isinstance(valor, float) and valor.is_integer():
+                valor = int(valor)
+            valores.append(valor)
+        while valores and valores[-1] is None:
+            valores.pop()
+        return valores
+
+    def iterar_chunks_planilha(self, linhas, limite_registros=50000, estado=None, prefixo=None):
+        """Percorre as linhas da aba (vindas de qualquer leitor) e entrega DataFrames de até
+        `tamanho_chunk` linhas, parando ao atingir `limite_registros`.
+
+        Linhas totalmente vazias são ignoradas: a aba declara ~1 milhão de linhas
+        formatadas, mas só as preenchidas contam para o limite.
+
+        🔁 Modo incremental: `estado` (dict) recebe a impressão digital do que foi lido
+        (linhas_planilha, registros, digest). Com `prefixo` (o estado salvo na última leitura),
+        as primeiras linhas só entram no digest; se ele bater, apenas as linhas novas viram
+        DataFrame. Se não bater, `estado['prefixo_alterado']` fica True e a leitura para.
+
+        📋 `estado['perfil']` recebe o perfil das colunas dos blocos entregues (PerfilColunas);
+        colunas "Unnamed" ainda sem nenhum dado saem do bloco antes de ser entregue.
+
+        🧭 Os blocos saem com os nomes canônicos do esquema (esquema_terloc);
+        `estado['esquema']` recebe a resolução do cabeçalho (colunas ausentes, desconhecidas).
+        """
+        estado = {} if estado is None else estado
+        cabecalho = next(linhas, None)
+        if cabecalho is None:
+            return
+
+        # Digest cobre o cabeçalho e todas as linhas até a última preenchida
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(repr(self.normalizar_linha(cabecalho)).encode('utf-8'))
+        vazias_pendentes = 0
+        linhas_planilha = 0
+        linhas_prefixo = prefixo['linhas_planilha'] if prefixo else 0
+        prefixo_conferido = prefixo is None
+        if prefixo is not None and linhas_prefixo == 0:
+            estado['prefixo_alterado'] = True
+            return
+
+        colunas, estado['esquema'] = resolver_cabecalho(self.nomes_colunas(cabecalho))
+        buffers = [[] for _ in colunas]
+        perfil = estado['perfil'] = PerfilColunas()
+        registros = 0
+        linhas_chunk = 0
+
+        for linha in linhas:
+            if registros >= limite_registros:
+                break
+            if not any(linha):
+                vazias_pendentes += 1
+                continue
+
+            valores = self.normalizar_linha(linha)
+            digest.update(b'\n' * (vazias_pendentes + 1) + repr(valores).encode('utf-8'))
+            linhas_planilha += vazias_pendentes + 1
+            vazias_pendentes = 0
+            registros += 1
+
+            # Linhas já ingeridas: só conferir o digest ao final do prefixo
+            if linhas_planilha < linhas_prefixo:
+                continue
+            if not prefixo_conferido:
+                prefixo_conferido = True
+                if linhas_planilha != linhas_prefixo or digest.hexdigest() != prefixo['digest']:
+                    estado['prefixo_alterado'] = True
+                    return
+                continue
+
+            # Dados além da largura do cabeçalho viram colunas "Unnamed"
+            if len(valores) > len(colunas):
+                for i in range(len(colunas), len(valores)):
+                    colunas.append(f"Unnamed: {i}")
+                    buffers.append([None] * linhas_chunk)
+
+            for i, buffer in enumerate(buffers):
+                buffer.append(valores[i] if i < len(valores) else None)
+
+            linhas_chunk += 1
+
+            if linhas_chunk >= self.tamanho_chunk:
+                yield self.perfilar_chunk(pd.DataFrame(dict(zip(colunas, buffers)), dtype=object), perfil)
+                buffers = [[] for _ in colunas]
+                linhas_chunk = 0
+
+        if linhas_chunk > 0:
+            yield self.perfilar_chunk(pd.DataFrame(dict(zip(colunas, buffers)), dtype=object), perfil)
+
+        # Planilha encolheu: o prefixo salvo não existe mais
+        if not prefixo_conferido:
+            estado['prefixo_alterado'] = True
+            return
+        estado.update(linhas_planilha=linhas_planilha, registros=registros, digest=digest.hexdigest())
+
+    def selecionar_aba(self, nomes_abas):
+        """Regra comum a todos os leitores: 'PLANILHA ÚNICA' ou, na falta dela, a primeira aba"""
+        if 'PLANILHA ÚNICA' in nomes_abas:
+            return 'PLANILHA ÚNICA', 'PLANILHA ÚNICA'
+        return nomes_abas[0], 'Primeira aba'
+
+    def abas_xlsx(self, zip_xlsx):
+        """Lista [(nome, r:id)] das abas a partir do xl/workbook.xml do pacote .xlsx"""
+        workbook = zip_xlsx.read('xl/workbook.xml').decode('utf-8')
+        abas = re.findall(r'<sheet\b[^>]*?name="([^"]*)"[^>]*?r:id="([^"]*)"', workbook)
+        return [(nome.replace('&amp;', '&'), rid) for nome, rid in abas]
+
+    def localizar_xml_aba(self, zip_xlsx, nome_aba):
+        """Encontra o membro XML de uma aba dentro do pacote .xlsx (workbook.xml + rels)"""
+        abas = dict(self.abas_xlsx(zip_xlsx))
+        if nome_aba not in abas:
+            return None
+        rid = abas[nome_aba]
+        rels = zip_xlsx.read('xl/_rels/workbook.xml.rels').decode('utf-8')
         
-        if not self.arquivo_padrao.exists():
-            return None, "Arquivo padrão não encontrado"
+        alvo = re.search(rf'<Relationship\b[^>]*?Id="{re.escape(rid)}"[^>]*?Target="([^"]*)"', rels)
+        if not alvo:
+            alvo = re.search(rf'<Relationship\b[^>]*?Target="([^"]*)"[^>]*?Id="{re.escape(rid)}"', rels)
+        if not alvo:
+            return None
+        destino = alvo.group(1)
+        return destino.lstrip('/') if destino.startswith('/') else f"xl/{destino}"
+
+    def dimensao_aba(self, arquivo_path, nome_aba):
+        """Lê (linhas, colunas) da tag <dimension> da aba sem descompactar a aba inteira"""
+        try:
+            with zipfile.ZipFile(arquivo_path) as zip_xlsx:
+                membro = self.localizar_xml_aba(zip_xlsx, nome_aba)
+                if membro is None:
+                    return None
+                with zip_xlsx.open(membro) as f:
+                    inicio = f.read(8192).decode('utf-8', errors='ignore')
+        except Exception:
+            return None
+        
+        ref = re.search(r'<dimension ref="[A-Z]*\d*:?([A-Z]+)(\d+)"', inicio)
+        if not ref:
+            return None
+        colunas = 0
+        for letra in ref.group(1):
+            colunas = colunas * 26 + (ord(letra) - ord('A') + 1)
+        return int(ref.group(2)), colunas
+
+    def impressao_aba(self, arquivo_path):
+        """🔎 CRC32 e tamanho, do diretório central do zip, das partes que definem os valores
+        da aba lida: XML da aba, sharedStrings e styles (formatos decidem o que é data).
+
+        Nenhuma parte grande é descompactada, então custa milissegundos em qualquer tamanho
+        de planilha. Edições em outras abas não mudam a impressão. None se não é .xlsx.
+        """
+        try:
+            with zipfile.ZipFile(arquivo_path) as zip_xlsx:
+                nomes_abas = [nome for nome, _ in self.abas_xlsx(zip_xlsx)]
+                nome_aba, _ = self.selecionar_aba(nomes_abas)
+                membro = self.localizar_xml_aba(zip_xlsx, nome_aba)
+                if membro is None:
+                    return None
+                
+                partes = {}
+                for nome in (membro, 'xl/sharedStrings.xml', 'xl/styles.xml'):
+                    try:
+                        info = zip_xlsx.getinfo(nome)
+                    except KeyError:
+                        continue
+                    partes[nome] = [info.CRC, info.file_size]
+                
+                # Sistema de datas 1904 (workbook.xml) também muda os valores lidos
+                workbook = zip_xlsx.read('xl/workbook.xml').decode('utf-8')
+                partes['date1904'] = bool(re.search(r'date1904="(1|true)"', workbook))
+                return partes
+        except Exception:
+            return None
+
+    def perfilar_chunk(self, chunk, perfil):
+        """Acumula o bloco no perfil e tira dele as colunas "Unnamed" ainda sem nenhum dado
+        (a área formatada da aba costuma declarar centenas delas)"""
+        perfil.adicionar(chunk)
+        vazias = [col for col in chunk.columns if col.startswith('Unnamed:') and perfil.vazia(col)]
+        return chunk.drop(columns=vazias) if vazias else chunk
+
+    def abrir_leitor_calamine(self, arquivo_path):
+        """Leitor python-calamine: retorna (fonte, gerador de linhas)"""
+        workbook = python_calamine.CalamineWorkbook.from_path(str(arquivo_path))
+        nome_aba, fonte = self.selecionar_aba(workbook.sheet_names)
         
-        # Verificar cache
-        hash_atual = self.calcular_hash_arquivo(self.arquivo_padrao)
-        cache_valido = False
+        dimensao = self.dimensao_aba(arquivo_path, nome_aba)
+        if dimensao and dimensao[0] * dimensao[1] > self.limite_celulas_calamine:
+            workbook.close()
+            raise ValueError(f"aba declara {dimensao[0]:,} x {dimensao[1]} células")
         
-        if self.cache_padrao.exists() and self.metadata_padrao.exists():
+        def linhas():
             try:
-                # Verificar se hash mudou
-                with open(self.metadata_padrao, 'r') as f:
-                    metadata = f.read()
-                    if f"Hash: {hash_atual}" in metadata:
-                        cache_valido = True
-            except:
-                pass
+                for linha in workbook.get_sheet_by_name(nome_aba).iter_rows():
+                    # calamine entrega datas puras como date; openpyxl/pandas usam datetime
+                    yield [datetime(v.year, v.month, v.day) if type(v) is date else v for v in linha]
+            finally:
+                workbook.close()
+        
+        return fonte, linhas()
+
+    def abrir_leitor_openpyxl(self, arquivo_path):
+        """Leitor openpyxl em modo read-only: retorna (fonte, gerador de linhas)"""
+        workbook = openpyxl.load_workbook(arquivo_path, read_only=True, data_only=True)
+        nome_aba, fonte = self.selecionar_aba(workbook.sheetnames)
         
-        if cache_valido:
+        def linhas():
             try:
-                df = pd.read_parquet(self.cache_padrao)
-                with open(self.metadata_padrao, 'r') as f:
-                    metadata = f.read()
-                data_cache = metadata.split('DataHora: ')[1].split('\n')[0] if 'DataHora:' in metadata else 'N/A'
-                return df, f"Dados padrão (cache) - Última atualização: {data_cache}"
-            except:
-                pass
+                yield from workbook[nome_aba].iter_rows(values_only=True)
+            finally:
+                workbook.close()
         
-        # Carregar do arquivo
-        try:
-            inicio = time.time()
-            
-            # Tentar diferentes abas
+        return fonte, linhas()
+
+    def ler_planilha(self, arquivo_path, limite_registros=50000, estado=None, prefixo=None):
+        """Lê a planilha em streaming e normaliza bloco a bloco.
+
+        Tenta os leitores de `leitores_excel` em ordem e cai para o próximo em caso de erro.
+        Retorna (df, fonte, leitor). Tempo e memória ficam proporcionais às linhas mantidas,
+        e não ao tamanho declarado da aba.
+
+        Com `prefixo` (ver `iterar_chunks_planilha`), df traz só as linhas novas, ainda com
+        os tipos brutos (object), ou None se as linhas já ingeridas foram alteradas.
+        `estado` recebe a impressão digital da leitura para o manifest.
+        """
+        leitores = {
+            'calamine': self.abrir_leitor_calamine,
+            'openpyxl': self.abrir_leitor_openpyxl,
+        }
+        estado = {} if estado is None else estado
+        erro = None
+        
+        for leitor in self.leitores_excel:
+            if leitor == 'calamine' and not CALAMINE_DISPONIVEL:
+                continue
             try:
-                df = pd.read_excel(self.arquivo_padrao, sheet_name='PLANILHA ÚNICA', engine='openpyxl')
-                fonte = 'PLANILHA ÚNICA'
-            except:
-                df = pd.read_excel(self.arquivo_padrao, sheet_name=0, engine='openpyxl')
-                fonte = 'Primeira aba'
+                estado.clear()
+                fonte, linhas = leitores[leitor](arquivo_path)
+                chunks = [self.normalizar_chunk(chunk) for chunk in self.iterar_chunks_planilha(linhas, limite_registros, estado, prefixo)]
+                # Interromper a leitura no meio: fecha o workbook (finally do gerador)
+                linhas.close()
+            except Exception as e:
+                erro = e
+                print(f"Leitor {leitor} indisponível para {arquivo_path}: {str(e)[:80]}")
+                continue
+            
+            if estado.get('prefixo_alterado'):
+                return None, fonte, leitor
             
-            # Aplicar limite
-            if len(df) > limite_registros:
-                df = df.head(limite_registros)
+            if estado.get('registros', 0) >= limite_registros:
                 fonte += f" (limitado a {limite_registros:,})"
             
-            # Normalizar e salvar cache
-            df = self.normalizar_dados(df)
-            self.salvar_cache(df, fonte, self.cache_padrao, self.metadata_padrao, hash_atual)
+            if not chunks:
+                return pd.DataFrame(), fonte, leitor
             
-            tempo = time.time() - inicio
-            return df, f"Dados padrão carregados em {tempo:.1f}s"
+            df = self.concatenar_chunks(chunks)
+            # Coluna "Unnamed" que só ganhou dados num bloco posterior volta à sua posição
+            ordem = [col for col in estado['perfil'].colunas if col in df.columns]
+            df = df[ordem + [col for col in df.columns if col not in estado['perfil'].colunas]]
+            if prefixo is None:
+                df = df.infer_objects()
             
+            return df, fonte, leitor
+        
+        raise erro if erro else ValueError("Nenhum leitor de Excel disponível")
+
+    def ler_manifest(self, manifest_file):
+        """Lê o manifest JSON do cache ({} se não existe ou está corrompido)"""
+        try:
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except:
+            return {}
+
+    def escrever_manifest(self, manifest_file, manifest):
+        """Grava o manifest JSON do cache (arquivo temporário + rename atômico)"""
+        temporario = manifest_file.with_name(f"{manifest_file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, manifest_file)
+
+    @contextmanager
+    def trava_cache(self, cache_path):
+        """🔒 Single-flight da reconstrução de um dataset.
+
+        Threads do mesmo processo esperam num Lock; outros processos numa trava de arquivo
+        (<dataset>.lock). Quem espera deve verificar o cache de novo ao entrar: normalmente
+        outra sessão acabou de publicar o resultado.
+        """
+        with TRAVAS_CACHE_GUARDA:
+            trava = TRAVAS_CACHE.setdefault(str(cache_path.resolve()), threading.Lock())
+        
+        with trava:
+            with open(cache_path.with_name(f"{cache_path.name}.lock"), 'a+b') as arquivo_trava:
+                self.travar_arquivo(arquivo_trava)
+                try:
+                    yield
+                finally:
+                    self.destravar_arquivo(arquivo_trava)
+
+    def travar_arquivo(self, arquivo):
+        """Trava exclusiva (bloqueante) de um arquivo aberto, entre processos"""
+        if fcntl is not None:
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX)
+            return
+        arquivo.seek(0)
+        while True:
+            try:
+                # LK_LOCK desiste após ~10s: continuar tentando até conseguir
+                msvcrt.locking(arquivo.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    def destravar_arquivo(self, arquivo):
+        """Libera a trava de `travar_arquivo`"""
+        if fcntl is not None:
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_UN)
+        else:
+            arquivo.seek(0)
+            msvcrt.locking(arquivo.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def dataset_atual(self, cache_path, manifest):
+        """Diretório da versão do dataset publicada no manifest (None se não existe)"""
+        nome = manifest.get('dataset')
+        if not nome:
+            return None
+        caminho = cache_path.with_name(nome)
+        return caminho if caminho.is_dir() else None
+
+    def nova_versao(self, cache_path):
+        """Diretório para gravar uma versão nova do dataset (ainda invisível aos leitores)"""
+        return cache_path.with_name(f"{cache_path.name}.v{time.time_ns()}")
+
+    def publicar_versao(self, cache_path, manifest_file, manifest, versao_path):
+        """Publica uma versão gravada por completo: o manifest passa a apontar para ela.
+
+        A troca é o rename atômico do manifest. A versão anterior é mantida para leitores
+        que já abriram o manifest antigo; as mais velhas (e sobras de gravações
+        interrompidas) são apagadas.
+        """
+        anterior = self.ler_manifest(manifest_file).get('dataset')
+        self.registrar_apelidos(manifest)
+        manifest['artefatos'] = self.gerar_artefatos(versao_path)
+        manifest['dataset'] = versao_path.name
+        self.escrever_manifest(manifest_file, manifest)
+        
+        for caminho in cache_path.parent.glob(f"{cache_path.name}.v*"):
+            if caminho.name not in (versao_path.name, anterior):
+                shutil.rmtree(caminho, ignore_errors=True)
+        # Formato antigo, sem versões
+        if cache_path.is_dir():
+            shutil.rmtree(cache_path, ignore_errors=True)
+
+    def registrar_apelidos(self, manifest):
+        """Grava os apelidos aprendidos na normalização e registra no manifest a versão
+        resultante do arquivo, para a própria gravação não disparar uma renormalização"""
+        if self.normalizador.salvar_apelidos():
+            manifest['apelidos'] = self.versao_arquivo(self.arquivo_apelidos)[0]
+
+    def versao_arquivo(self, arquivo_path, registrada=None, por_aba=False):
+        """Retorna (versao, igual): identificação do arquivo e se bate com a versão registrada.
+
+        ⚡ Se a assinatura (tamanho, mtime_ns, inode) bate, a versão registrada é
+        reaproveitada sem abrir o arquivo. Senão, com `por_aba`, compara a impressão da aba
+        lida (CRCs do zip); só para arquivos que não são .xlsx o conteúdo todo é hasheado.
+        """
+        registrada = registrada or {}
+        versao = {'stat': self.assinatura_arquivo(arquivo_path)}
+        
+        if versao['stat'] and registrada.get('stat') == versao['stat'] and ('hash' in registrada or 'partes' in registrada):
+            return dict(registrada), True
+        
+        if por_aba:
+            partes = self.impressao_aba(arquivo_path)
+            if partes is not None:
+                versao['partes'] = partes
+                return versao, registrada.get('partes') == partes
+        
+        versao['hash'] = self.calcular_hash_arquivo(arquivo_path)
+        return versao, bool(registrada) and 'hash' in registrada and registrada['hash'] == versao['hash']
+
+    def verificar_cache(self, arquivo_path, cache_path, manifest_file):
+        """Retorna (versoes, situacao) comparando planilha e arquivos de nomes com o manifest.
+
+        situacao:
+        - 'valido': nada mudou (arquivo copiado/salvo de novo, ou só outras abas editadas:
+          a assinatura nova vai para o manifest)
+        - 'mapeamento': só o mapeamento, as regras e/ou os apelidos aprendidos mudaram, basta
+          renormalizar os nomes do cache
+        - 'incremental': só a planilha mudou, tentar anexar as linhas novas
+        - 'reconstruir': sem cache, esquema de outra versão ou planilha e mapeamento mudaram
+        """
+        manifest = self.ler_manifest(manifest_file)
+        if manifest.get('versao_esquema') != VERSAO_ESQUEMA or self.dataset_atual(cache_path, manifest) is None:
+            manifest = {}
+        
+        versao_planilha, planilha_igual = self.versao_arquivo(arquivo_path, manifest.get('arquivo'), por_aba=True)
+        versao_mapeamento, mapeamento_igual = self.versao_arquivo(self.arquivo_mapeamento, manifest.get('mapeamento'))
+        versao_regras, regras_iguais = self.versao_arquivo(self.arquivo_regras, manifest.get('regras'))
+        versao_apelidos, apelidos_iguais = self.versao_arquivo(self.arquivo_apelidos, manifest.get('apelidos'))
+        versoes = {'arquivo': versao_planilha, 'mapeamento': versao_mapeamento, 'regras': versao_regras,
+                   'apelidos': versao_apelidos}
+        mapeamento_igual = mapeamento_igual and regras_iguais and apelidos_iguais
+        
+        if not manifest:
+            return versoes, 'reconstruir'
+        
+        if planilha_igual and mapeamento_igual:
+            if any(manifest.get(chave) != versao for chave, versao in versoes.items()):
+                try:
+                    manifest.update(versoes)
+                    self.escrever_manifest(manifest_file, manifest)
+                except:
+                    pass
+            return versoes, 'valido'
+        
+        if planilha_igual:
+            return versoes, 'mapeamento'
+        if mapeamento_igual:
+            return versoes, 'incremental'
+        return versoes, 'reconstruir'
+
+    def filtros_periodos(self, periodos):
+        """Monta os filtros (forma DNF do pyarrow) para uma lista de períodos (inicio, fim).
+
+        Cada mês de cada período vira uma conjunção com a partição ano/mes (poda de
+        diretórios) e os limites de data (poda de row groups pelas estatísticas).
+        """
+        filtros = []
+        for inicio, fim in periodos:
+            inicio = pd.Timestamp(inicio)
+            fim_exclusivo = pd.Timestamp(fim) + pd.Timedelta(days=1)
+            for mes in pd.period_range(inicio, pd.Timestamp(fim), freq='M'):
+                filtros.append([
+                    ('ano', '=', mes.year),
+                    ('mes', '=', mes.month),
+                    ('data_convertida', '>=', inicio),
+                    ('data_convertida', '<', fim_exclusivo),
+                ])
+        return filtros
+
+    def filtrar_periodos(self, df, periodos):
+        """Equivalente em memória de `filtros_periodos`, usado logo após reconstruir o cache
+        (df já ordenado por data: cada período é uma faixa contígua de posições)"""
+        if periodos is None or 'data_convertida' not in df.columns:
+            return df
+        mascara = np.zeros(len(df), dtype=bool)
+        for inicio, fim in periodos:
+            mascara[posicoes_periodo(df, inicio, fim)] = True
+        return df[mascara].reset_index(drop=True)
+    
+    def ordenar_por_data(self, df):
+        """Linhas em ordem de data_convertida (sem data no fim; empates na ordem da planilha),
+        a ordem física do cache e a que o dashboard fatia com `posicoes_periodo`"""
+        if 'data_convertida' not in df.columns:
+            return df
+        return df.sort_values('data_convertida', kind='stable', na_position='last', ignore_index=True)
+
+    def ler_cache(self, cache_path, periodos=None, internas=False):
+        """Lê o dataset do cache; com `periodos`, só as partições/row groups necessários.
+
+        As colunas internas (`_original_*`) só voltam com `internas=True`.
+        """
+        filtros = None
+        if periodos is not None:
+            filtros = self.filtros_periodos(periodos)
+            if not filtros:
+                return pd.DataFrame()
+        tabela = pq.read_table(cache_path, filters=filtros)
+        # ano/mes voltam como dictionary da partição: descartar antes do to_pandas
+        particoes = [c for c in ('ano', 'mes') if c in tabela.column_names]
+        df = tabela.drop_columns(particoes).to_pandas()
+        # Ordem de data (arquivos anexados depois podem trazer datas antigas); empates pela
+        # ordem de gravação
+        if '_ordem' in df.columns:
+            chaves = ['data_convertida', '_ordem'] if 'data_convertida' in df.columns else ['_ordem']
+            df = df.sort_values(chaves, kind='stable', na_position='last').drop(columns='_ordem').reset_index(drop=True)
+        # Os dicionários dos arquivos são unidos na ordem em que aparecem: voltar as
+        # categorias à ordem alfabética gravada pela normalização
+        for col in df.columns:
+            if isinstance(df[col].dtype, pd.CategoricalDtype) and not df[col].cat.categories.is_monotonic_increasing:
+                df[col] = df[col].cat.reorder_categories(sorted(df[col].cat.categories))
+        return df if internas else self.sem_colunas_internas(df)
+
+    def sem_colunas_internas(self, df):
+        """DataFrame sem as colunas internas do cache (prefixo "_")"""
+        return df.drop(columns=[c for c in df.columns if c.startswith('_')])
+
+    def gerar_artefatos(self, versao_path):
+        """Gera os artefatos derivados de uma versão em <versao>/_artefatos.
+
+        O prefixo "_" faz o pyarrow ignorar a pasta ao ler o dataset. Falha num artefato
+        não impede a publicação: ele só fica fora do manifest.
+        """
+        if not self.artefatos:
+            return {}
+        
+        df = self.ler_cache(versao_path, internas=True)
+        pasta = versao_path / '_artefatos'
+        pasta.mkdir(exist_ok=True)
+        
+        gerados = {}
+        for nome, gerar in self.artefatos.items():
+            try:
+                gerar(df).to_parquet(pasta / f"{nome}.parquet", index=False)
+                gerados[nome] = f"_artefatos/{nome}.parquet"
+            except Exception as e:
+                print(f"Artefato {nome} não gerado: {str(e)[:80]}")
+        return gerados
+
+    def artefato_nomes(self, df):
+        """Tabela de normalização (auditoria): valor original -> nome normalizado, com a
+        etapa que o resolveu (mapeamento, apelido, regra, aproximação, sem padrão) e contagem"""
+        partes = []
+        for coluna, tipo in self.colunas_nomes.items():
+            original = f'_original_{coluna}'
+            if coluna not in df.columns or original not in df.columns:
+                continue
+            contagem = df.groupby([original, coluna], observed=True).size().reset_index(name='registros')
+            contagem.columns = ['original', 'normalizado', 'registros']
+            contagem.insert(0, 'coluna', coluna)
+            contagem.insert(3, 'origem', [self.normalizador.origem(nome, tipo) for nome in contagem['original']])
+            partes.append(contagem)
+        if not partes:
+            return pd.DataFrame(columns=['coluna', 'original', 'normalizado', 'origem', 'registros'])
+        return pd.concat(partes, ignore_index=True)
+
+    def ler_artefato(self, cache_path, manifest_file, nome):
+        """Lê um artefato derivado da versão publicada (None se não existe)"""
+        manifest = self.ler_manifest(manifest_file)
+        dataset = self.dataset_atual(cache_path, manifest)
+        relativo = manifest.get('artefatos', {}).get(nome)
+        if dataset is None or relativo is None or not (dataset / relativo).exists():
+            return None
+        return pd.read_parquet(dataset / relativo)
+
+    def ler_dataset(self, cache_path, manifest_file, periodos=None, internas=False):
+        """Lê a versão publicada do dataset; retorna (df, manifest)"""
+        manifest = self.ler_manifest(manifest_file)
+        dataset = self.dataset_atual(cache_path, manifest)
+        if dataset is None:
+            raise FileNotFoundError(f"{cache_path.name} sem versão publicada")
+        return self.ler_cache(dataset, periodos, internas), manifest
+
+    def remover_cache(self, cache_path):
+        """Remove todas as versões de um dataset de cache (e o formato antigo sem versão)"""
+        for caminho in cache_path.parent.glob(f"{cache_path.name}.v*"):
+            shutil.rmtree(caminho, ignore_errors=True)
+        if cache_path.is_dir():
+            shutil.rmtree(cache_path)
+
+    def intervalo_datas(self, manifest_file):
+        """Intervalo (data_min, data_max) registrado no manifest do cache"""
+        manifest = self.ler_manifest(manifest_file)
+        if not manifest.get('data_min'):
+            return None
+        return (pd.Timestamp(manifest['data_min']).date(), pd.Timestamp(manifest['data_max']).date())
+
+    def carregar_dados_padrao(self, limite_registros=50000, periodos=None):
+        """Carrega dados do arquivo padrão (pré-carregado)"""
+        
+        if not self.arquivo_padrao.exists():
+            return None, "Arquivo padrão não encontrado"
+        
+        try:
+            return self.carregar_dataset(self.arquivo_padrao, self.cache_padrao, self.manifest_padrao,
+                                         limite_registros, periodos, "Dados padrão", "Última atualização")
         except Exception as e:
             return None, f"Erro ao carregar dados padrão: {str(e)[:50]}"
     
-    def carregar_dados_usuario(self, limite_registros=50000):
+    def carregar_dados_usuario(self, limite_registros=50000, periodos=None):
         """Carrega dados do arquivo enviado pelo usuário"""
         
         if not self.arquivo_usuario.exists():
             return None, "Nenhum arquivo de usuário encontrado"
         
         try:
-            inicio = time.time()
-            
-            # Verificar cache
-            hash_atual = self.calcular_hash_arquivo(self.arquivo_usuario)
-            cache_valido = False
+            return self.carregar_dataset(self.arquivo_usuario, self.cache_usuario, self.manifest_usuario,
+                                         limite_registros, periodos, "Dados do usuário", "Upload",
+                                         prefixo_fonte="Upload do usuário - ")
+        except Exception as e:
+            return None, f"Erro ao carregar dados do usuário: {str(e)[:50]}"
+    
+    def carregar_dataset(self, arquivo_path, cache_path, manifest_file, limite_registros, periodos,
+                         rotulo, rotulo_data, prefixo_fonte=''):
+        """Carrega um dataset pelo caminho mais barato que o manifest permitir.
+
+        Cache válido → leitura do Parquet; só o mapeamento mudou → renormalizar nomes no
+        cache; só a planilha cresceu → anexar linhas novas; senão → reconstruir da planilha.
+        """
+        inicio = time.time()
+        versoes, situacao = self.verificar_cache(arquivo_path, cache_path, manifest_file)
+        
+        if situacao == 'valido':
+            try:
+                df, manifest = self.ler_dataset(cache_path, manifest_file, periodos)
+                return df, f"{rotulo} (cache) - {rotulo_data}: {manifest.get('data_hora', 'N/A')}"
+            except:
+                pass
+        
+        # 🔒 Uma atualização por vez: as outras sessões esperam e usam o resultado publicado
+        with self.trava_cache(cache_path):
+            versoes, situacao = self.verificar_cache(arquivo_path, cache_path, manifest_file)
+            # Só os tempos de normalização desta carga entram no manifest
+            self.normalizador.consumir_tempos()
             
-            if self.cache_usuario.exists() and self.metadata_usuario.exists():
+            if situacao == 'valido':
                 try:
-                    with open(self.metadata_usuario, 'r') as f:
-                        metadata = f.read()
-                        if f"Hash: {hash_atual}" in metadata:
-                            cache_valido = True
+                    df, manifest = self.ler_dataset(cache_path, manifest_file, periodos)
+                    return df, f"{rotulo} (cache) - {rotulo_data}: {manifest.get('data_hora', 'N/A')}"
                 except:
                     pass
             
-            if cache_valido:
+            # Mapeamento de nomes mudou: renormalizar a partir dos valores originais do cache
+            if situacao == 'mapeamento':
                 try:
-                    df = pd.read_parquet(self.cache_usuario)
-                    with open(self.metadata_usuario, 'r') as f:
-                        metadata = f.read()
-                    data_upload = metadata.split('DataHora: ')[1].split('\n')[0] if 'DataHora:' in metadata else 'N/A'
-                    return df, f"Dados do usuário (cache) - Upload: {data_upload}"
-                except:
-                    pass
+                    self.renormalizar_cache(cache_path, manifest_file, versoes)
+                    df, _ = self.ler_dataset(cache_path, manifest_file, periodos)
+                    tempo = time.time() - inicio
+                    return df, f"{rotulo} renormalizados (arquivos de nomes alterados) em {tempo:.1f}s"
+                except Exception as e:
+                    print(f"Renormalização indisponível: {str(e)[:80]}")
             
-            # Carregar do arquivo
-            try:
-                df = pd.read_excel(self.arquivo_usuario, sheet_name='PLANILHA ÚNICA', engine='openpyxl')
-                fonte = 'Upload do usuário - PLANILHA ÚNICA'
-            except:
-                df = pd.read_excel(self.arquivo_usuario, sheet_name=0, engine='openpyxl')
-                fonte = 'Upload do usuário - Primeira aba'
-            
-            # Aplicar limite
-            if len(df) > limite_registros:
-                df = df.head(limite_registros)
-                fonte += f" (limitado a {limite_registros:,})"
-            
-            # Normalizar e salvar cache
-            df = self.normalizar_dados(df)
-            self.salvar_cache(df, fonte, self.cache_usuario, self.metadata_usuario, hash_atual)
+            # Planilha só cresceu: anexar as linhas novas ao cache
+            if situacao == 'incremental':
+                try:
+                    incremento = self.atualizar_cache_incremental(arquivo_path, cache_path, manifest_file,
+                                                                  versoes, limite_registros, prefixo_fonte)
+                    if incremento is not None:
+                        novas, _, leitor = incremento
+                        df, _ = self.ler_dataset(cache_path, manifest_file, periodos)
+                        tempo = time.time() - inicio
+                        return df, f"{rotulo} atualizados (+{novas} linhas) em {tempo:.1f}s via {leitor}"
+                except Exception as e:
+                    print(f"Atualização incremental indisponível: {str(e)[:80]}")
             
-            tempo = time.time() - inicio
-            return df, f"Dados do usuário carregados em {tempo:.1f}s"
+            # Carregar do arquivo (streaming, normalizando bloco a bloco)
+            etapas = {}
+            inicio_etapa = time.time()
+            estado = {}
+            df, fonte, leitor = self.ler_planilha(arquivo_path, limite_registros, estado)
+            fonte = prefixo_fonte + fonte
+            etapas['leitura'] = time.time() - inicio_etapa
+            # Cabeçalho renomeado na planilha: avisar já na carga (o dashboard repete pelo manifest)
+            avisos = avisos_esquema(estado.get('esquema'))
+            if avisos:
+                print(f"⚠️ {prefixo_fonte}colunas não encontradas na planilha: {', '.join(avisos)}")
             
-        except Exception as e:
-            return None, f"Erro ao carregar dados do usuário: {str(e)[:50]}"
+            # Limpeza de colunas e tipos sobre o resultado final, depois salvar cache
+            inicio_etapa = time.time()
+            df = self.finalizar_normalizacao(df, estado.get('perfil'))
+            etapas['finalizacao'] = time.time() - inicio_etapa
+            self.salvar_cache(df, fonte, cache_path, manifest_file, versoes, estado, etapas)
+        
+        tempo = time.time() - inicio
+        return self.filtrar_periodos(self.sem_colunas_internas(df), periodos), f"{rotulo} carregados em {tempo:.1f}s via {leitor}"
     
     def carregar_mapeamento_normalizacao(self):
-        """Carrega mapeamentos de normalização do arquivo txt"""
-        try:
-            arquivo_mapeamento = Path('Mapeamento de Normalização de Nomes.txt')
-            if not arquivo_mapeamento.exists():
-                return {}, {}
-            
-            with open(arquivo_mapeamento, 'r', encoding='utf-8') as f:
-                conteudo = f.read()
-            
-            mapeamento_clientes = {}
-            mapeamento_clientes_venda = {}
-            
-            # Processar seções
-            secoes = conteudo.split('2. Cliente de Venda')
-            secao_clientes = secoes[0].replace('1. Clientes', '').strip()
-            secao_clientes_venda = secoes[1].strip() if len(secoes) > 1 else ''
-            
-            # Processar clientes
-            for bloco in secao_clientes.split('Nome Padrão:')[1:]:
-                linhas = [l.strip() for l in bloco.strip().split('\n') if l.strip()]
-                if linhas:
-                    # Primeira linha contém: "NOME PADRAO Variações:"
-                    primeira_linha = linhas[0].strip()
-                    if ' Variações:' in primeira_linha:
-                        nome_padrao = primeira_linha.replace(' Variações:', '').strip()
-                    else:
-                        nome_padrao = primeira_linha
-                    
-                    # Processar variações (a partir da linha 1)
-                    for linha in linhas[1:]:
-                        if linha and linha != 'Variações:':
-                            variacao = linha.upper()
-                            mapeamento_clientes[variacao] = nome_padrao
-            
-            # Processar clientes de venda
-            for bloco in secao_clientes_venda.split('Nome Padrão:')[1:]:
-                linhas = [l.strip() for l in bloco.strip().split('\n') if l.strip()]
-                if linhas:
-                    # Primeira linha contém: "NOME PADRAO Variações:"
-                    primeira_linha = linhas[0].strip()
-                    if ' Variações:' in primeira_linha:
-                        nome_padrao = primeira_linha.replace(' Variações:', '').strip()
-                    else:
-                        nome_padrao = primeira_linha
-                    
-                    # Processar variações (a partir da linha 1)
-                    for linha in linhas[1:]:
-                        if linha and linha != 'Variações:':
-                            variacao = linha.upper()
-                            mapeamento_clientes_venda[variacao] = nome_padrao
-            
-            return mapeamento_clientes, mapeamento_clientes_venda
-        except Exception as e:
-            try:
-                import streamlit as st
-                st.warning(f"Erro ao carregar mapeamento: {e}")
-            except:
-                print(f"Erro ao carregar mapeamento: {e}")
-            return {}, {}
+        """Mapeamentos (clientes, clientes de venda) do arquivo txt, já compilados"""
+        self.normalizador.atualizar()
+        return self.normalizador.mapeamentos['cliente'], self.normalizador.mapeamentos['cliente_venda']
 
     def normalizar_nome_cliente(self, nome):
         """Normaliza nomes de clientes usando arquivo de mapeamento"""
-        if pd.isna(nome) or nome == '':
-            return 'NÃO INFORMADO'
-        
-        # Converter para string e limpar
-        nome_limpo = str(nome).strip().upper()
-        
-        # Remover acentos e caracteres especiais
-        nome_limpo = (nome_limpo.replace('Ã', 'A').replace('Õ', 'O').replace('Ç', 'C')
-                                .replace('É', 'E').replace('Ê', 'E').replace('Í', 'I')
-                                .replace('Ó', 'O').replace('Ô', 'O').replace('Ú', 'U')
-                                .replace('Ù', 'U').replace('Û', 'U').replace('Ü', 'U'))
-        
-        # Carregar mapeamento
-        mapeamento_clientes, _ = self.carregar_mapeamento_normalizacao()
-        
-        # Verificar mapeamento direto
-        if nome_limpo in mapeamento_clientes:
-            return mapeamento_clientes[nome_limpo]
-        
-        # Fallback para lógica antiga se não encontrar no mapeamento
-        # ADUFERTIL - Capturar todas as variações
-        if any(variacao in nome_limpo for variacao in ['ADUFERTIL', 'ADULFERTIL', 'ADUFETIL', 'ADUFERIL']):
-            return 'ADUFERTIL JUNDIAI'
-        
-        # ELEKEIROZ - Capturar TODAS as variações com erros de digitação
-        if any(variacao in nome_limpo for variacao in ['ELEKEIROZ', 'ELEIKEIROZ', 'ELEQUEIROZ', 'ELEQUEIOZ', 'ELKEIROZ']):
-            return 'ELEKEIROZ'
-        
-        # MOSAIC CUBATÃO
-        if 'MOSAIC' in nome_limpo and ('CUBATAO' in nome_limpo or 'CUBATÃO' in nome_limpo):
-            return 'MOSAIC CUBATÃO'
-        
-        # MOSAIC UBERABA
-        if 'MOSAIC' in nome_limpo and ('UBERABA' in nome_limpo or 'UBERADA' in nome_limpo):
-            return 'MOSAIC UBERABA'
-        
-        # MOSAIC genérico - mapear para CUBATÃO
-        if nome_limpo == 'MOSAIC':
-            return 'MOSAIC CUBATÃO'
-        
-        # CSRD
-        if 'CSRD' in nome_limpo:
-            return 'CSRD'
-        
-        # JBS
-        if 'JBS' in nome_limpo:
-            return 'JBS'
-        
-        # K+S
-        if 'K+S' in nome_limpo:
-            return 'K+S'
-        
-        # NITEX
-        if 'NITEX' in nome_limpo:
-            return 'NITEX'
-        
-        # QUIMIVITA
-        if 'QUIMIVITA' in nome_limpo:
-            return 'QUIMIVITA'
-        
-        # Se não encontrou padrão conhecido, retorna normalizado
-        return nome_limpo.replace('-', '/').replace('  ', ' ').strip()
+        return self.normalizador.normalizar_cliente(nome)
 
     def normalizar_cliente_venda(self, nome):
         """Normaliza nomes de clientes de venda usando arquivo de mapeamento"""
-        if pd.isna(nome) or nome == '':
-            return 'NÃO INFORMADO'
-        
-        # Converter para string e limpar
-        nome_limpo = str(nome).strip().upper()
-        
-        # Remover acentos e caracteres especiais
-        nome_limpo = (nome_limpo.replace('Ã', 'A').replace('Õ', 'O').replace('Ç', 'C')
-                                .replace('É', 'E').replace('Ê', 'E').replace('Í', 'I')
-                                .replace('Ó', 'O').replace('Ô', 'O').replace('Ú', 'U')
-                                .replace('Ù', 'U').replace('Û', 'U').replace('Ü', 'U'))
-        
-        # Carregar mapeamento
-        _, mapeamento_clientes_venda = self.carregar_mapeamento_normalizacao()
-        
-        # Verificar mapeamento direto
-        if nome_limpo in mapeamento_clientes_venda:
-            return mapeamento_clientes_venda[nome_limpo]
-        
-        # Fallback para lógica de detecção de padrões
-        
-        # ADUBOS ARAGUAIA - qualquer variação (Anápolis ou Catalão)
-        if 'ADUBOS' in nome_limpo and ('ARAG' in nome_limpo or 'ANAPOLIS' in nome_limpo):
-            return 'ADUBOS ARAGUAIA ANAPOLIS'
-        if 'ADUBOS' in nome_limpo and ('CATALAO' in nome_limpo or 'CATALÃO' in nome_limpo):
-            return 'ADUBOS ARAGUAIA CATALÃO'
-        
-        # ADUFERTIL ALFENAS - qualquer variação
-        if any(palavra in nome_limpo for palavra in ['ADUFERTIL', 'ADULFERTIL']) and 'ALFENAS' in nome_limpo:
-            return 'ADUFERTIL ALFENAS'
-        
-        # COFCO variações
-        if 'COFCO' in nome_limpo:
-            if 'CATANDUVA' in nome_limpo:
-                return 'COFCO CATANDUVA'
-            elif 'MERIDIANO' in nome_limpo:
-                return 'COFCO MERIDIANO'
-            elif 'POTIRENDABA' in nome_limpo or 'POTIRENDA' in nome_limpo:
-                return 'COFCO POTIRENDABA'
-            elif 'SEBASTIANOPOLIS' in nome_limpo or 'SEBASTIANÓPOLIS' in nome_limpo:
-                return 'COFCO SEBASTIANÓPOLIS'
-        
-        # FASS variações
-        if 'FASS' in nome_limpo:
-            if any(termo in nome_limpo for termo in ['NOVA IND', 'INDEPENDENC', 'N.INDEPEND']):
-                return 'FASS NOVA INDEPENDÊNCIA'
-            elif 'SERTAOZINHO' in nome_limpo or 'SERTÃOZINHO' in nome_limpo:
-                return 'FASS SERTÃOZINHO'
-        
-        # ICL variações
-        if 'ICL' in nome_limpo:
-            if 'JACAREI' in nome_limpo or 'JACAREÍ' in nome_limpo:
-                return 'ICL JACAREÍ'
-            elif 'UBERLANDIA' in nome_limpo or 'UBERLÂNDIA' in nome_limpo:
-                return 'ICL UBERLÂNDIA'
-        
-        # SAFRA variações
-        if 'SAFRA' in nome_limpo and 'ALFENAS' in nome_limpo:
-            return 'SAFRA ALFENAS'
-        
-        # SAFRA genérico - mapear para ALFENAS
-        if nome_limpo == 'SAFRA':
-            return 'SAFRA ALFENAS'
-        
-        # USINA variações
-        if 'USINA' in nome_limpo:
-            if 'SANTA ADEL' in nome_limpo:
-                return 'USINA SANTA ADÉLIA'
-            elif 'SAO MANOEL' in nome_limpo or 'SÃO MANOEL' in nome_limpo or 'SAO MANUEL' in nome_limpo or 'SÃO MANUEL' in nome_limpo:
-                return 'USINA SÃO MANOEL'
-        
-        # Se não encontrou padrão, retorna normalizado
-        return nome_limpo.replace('-', '/').replace('  ', ' ').strip()
+        return self.normalizador.normalizar_cliente_venda(nome)
 
     def normalizar_dados(self, df):
         """Normaliza dados para compatibilidade E aplica normalização de nomes"""
+        return self.finalizar_normalizacao(self.normalizar_chunk(df))
+
+    def concatenar_chunks(self, chunks):
+        """Concatena os blocos normalizados mantendo as colunas de nome categóricas.
+
+        Cada bloco tem as suas categorias; com a união (em ordem alfabética) aplicada a
+        todos, o pd.concat preserva o tipo em vez de cair para texto.
+        """
+        for coluna in self.colunas_nomes:
+            series = [chunk[coluna] for chunk in chunks if coluna in chunk.columns]
+            if len(series) < 2 or not all(isinstance(serie.dtype, pd.CategoricalDtype) for serie in series):
+                continue
+            categorias = sorted(set().union(*(serie.cat.categories for serie in series)))
+            for chunk in chunks:
+                chunk[coluna] = chunk[coluna].cat.set_categories(categorias)
+        return pd.concat(chunks, ignore_index=True)
+
+    def normalizar_chunk(self, df):
+        """Normalização linha a linha (nomes de clientes e datas) de um bloco da planilha"""
+        try:
+            # NORMALIZAÇÃO DE NOMES DE CLIENTES (CRÍTICO!)
+            # O valor original fica em "_original_<coluna>" para renormalizar pelo cache
+            self.normalizador.atualizar()
+            for coluna, tipo in self.colunas_nomes.items():
+                if coluna in df.columns:
+                    df[f'_original_{coluna}'] = df[coluna]
+                    df[coluna] = self.normalizador.normalizar_serie(df[coluna], tipo)
+            
+            # Processar datas se existirem
+            if 'DATA' in df.columns:
+                df['data_convertida'] = pd.to_datetime(df['DATA'], errors='coerce')
+            
+            return df
+        except Exception as e:
+            try:
+                import streamlit as st
+                st.warning(f"Erro na normalização: {str(e)[:100]}")
+            except:
+                print(f"Erro na normalização: {str(e)[:100]}")
+            return df
+
+    def finalizar_normalizacao(self, df, perfil=None):
+        """Limpeza de colunas e normalização de tipos sobre o DataFrame completo.
+
+        `perfil` é o perfil das colunas montado na leitura (sem ele, é calculado aqui).
+        """
         try:
             # LIMPEZA DE COLUNAS DESNECESSÁRIAS (CRÍTICO PARA PERFORMANCE!)
-            # Remover colunas "Unnamed" que estão vazias ou quase vazias
-            colunas_para_manter = []
-            for col in df.columns:
-                if not col.startswith('Unnamed:'):
-                    colunas_para_manter.append(col)
-                else:
-                    # Verificar se a coluna Unnamed tem dados úteis
-                    if not df[col].isna().all() and df[col].fillna('').astype(str).str.strip().ne('').sum() > 10:
-                        colunas_para_manter.append(col)
+            # Remover colunas "Unnamed" vazias ou quase vazias, pelas contagens do perfil
+            if perfil is None:
+                perfil = PerfilColunas.de_dataframe(df)
+            colunas_para_manter = [col for col in df.columns if not perfil.descartar(col)]
+            
+            # Colunas internas do cache (_original_*) não entram na contagem; as "Unnamed"
+            # vazias já ficaram fora dos blocos na leitura, mas contam pelo perfil
+            total_colunas = len(perfil.colunas) + sum(1 for col in self.sem_colunas_internas(df).columns if col not in perfil.colunas)
             
             # Manter apenas colunas úteis
             df = df[colunas_para_manter].copy()
@@ -388,40 +939,21 @@ class SistemaHibridoTerloc:
                 import streamlit as st
                 # Mensagem discreta no sidebar
                 with st.sidebar:
-                    st.caption(f"📊 Colunas: {len(colunas_para_manter)} de {len(df.columns) + len([c for c in df.columns if c.startswith('Unnamed:')])}")
+                    st.caption(f"📊 Colunas: {len(self.sem_colunas_internas(df).columns)} de {total_colunas}")
             except:
                 print(f"📊 Colunas mantidas: {len(colunas_para_manter)}")
             
-            # Normalização básica de tipos
+            # Coerção de tipos pelo esquema (ver tipo_coluna), direto para o tipo nativo
             for col in df.columns:
-                if df[col].dtype == 'object':
-                    df[col] = df[col].fillna('').astype(str)
-                elif df[col].dtype in ['int64', 'float64']:
-                    df[col] = df[col].replace([float('inf'), float('-inf')], 0)
-                    df[col] = df[col].fillna(0)
+                destino = self.tipo_coluna(col, df[col])
+                if destino is not None:
+                    df[col] = self.coagir_coluna(df[col], destino)
             
-            # NORMALIZAÇÃO DE NOMES DE CLIENTES (CRÍTICO!)
-            if 'CLIENTE' in df.columns:
-                try:
-                    import streamlit as st
-                    # Processamento silencioso, apenas log no sidebar ao final
-                    df['CLIENTE'] = df['CLIENTE'].apply(self.normalizar_nome_cliente)
-                except:
-                    print("🔄 Normalizando nomes de clientes...")
-                    df['CLIENTE'] = df['CLIENTE'].apply(self.normalizar_nome_cliente)
+            # Instante absoluto de cada etapa (int64, segundos): o dashboard só subtrai colunas
+            df = df.assign(**instantes_etapas(df))
             
-            if 'CLIENTE DE VENDA' in df.columns:
-                try:
-                    import streamlit as st
-                    # Processamento silencioso, apenas log no sidebar ao final
-                    df['CLIENTE DE VENDA'] = df['CLIENTE DE VENDA'].apply(self.normalizar_cliente_venda)
-                except:
-                    print("🔄 Normalizando clientes de venda...")
-                    df['CLIENTE DE VENDA'] = df['CLIENTE DE VENDA'].apply(self.normalizar_cliente_venda)
-            
-            # Processar datas se existirem
-            if 'DATA' in df.columns:
-                df['data_convertida'] = pd.to_datetime(df['DATA'], errors='coerce')
+            # Gravado (e devolvido) em ordem de data: períodos viram fatias contíguas
+            df = self.ordenar_por_data(df)
             
             # Mensagem final discreta no sidebar resumindo o processamento
             try:
@@ -446,41 +978,434 @@ class SistemaHibridoTerloc:
                 print(f"Erro na normalização: {str(e)[:100]}")
             return df
     
-    def salvar_cache(self, df, fonte, cache_file, metadata_file, hash_arquivo):
-        """Salva cache com informações"""
+    def tipo_coluna(self, col, valores):
+        """Tipo de destino de uma coluna na coerção (None mantém a coluna como está).
+
+        - 'data': colunas "DATA..." -> datetime64 (vazio/ilegível: NaT)
+        - 'hora': colunas "HORA..."/"HORARIO..." -> Int32, segundos desde a meia-noite (vazio: NA)
+        - 'numero': int64/float64 -> infinitos e vazios viram 0
+        - 'texto': demais colunas de texto -> categórico (vazio: '')
+        - 'bruto': colunas internas de texto ("_original_*") -> str (vazio: '')
+        Colunas do esquema (esquema_terloc) usam o tipo declarado; as demais, as regras acima.
+        Colunas de nome e data_convertida já saem tipadas da normalização por bloco.
+        """
+        if col in self.colunas_nomes or col == 'data_convertida':
+            return None
+        texto = pd.api.types.is_string_dtype(valores.dtype)
+        if col.startswith('_'):
+            return 'bruto' if texto else None
+        if col in TIPOS_COLUNAS:
+            return TIPOS_COLUNAS[col]
+        nome = col.upper()
+        if nome.startswith('DATA'):
+            return 'data'
+        if 'HORA' in nome:
+            return 'hora'
+        if valores.dtype in ['int64', 'float64']:
+            return 'numero'
+        # No pandas 3 colunas só de texto já vêm como 'str' (não 'object'): as duas
+        # recebem o mesmo tratamento, para o vazio ser sempre ''
+        return 'texto' if texto else None
+    
+    def coagir_coluna(self, valores, destino):
+        """Converte uma coluna para o tipo de `tipo_coluna`.
+
+        Datas e horários são convertidos por valor distinto (factorize) e devolvidos às
+        linhas pelos códigos inteiros, sem passar por texto.
+        """
+        if destino == 'numero':
+            return valores.replace([float('inf'), float('-inf')], 0).fillna(0)
+        if destino in ('texto', 'bruto'):
+            valores = valores.fillna('').astype(str)
+            return valores.astype('category') if destino == 'texto' else valores
+        if destino == 'data' and pd.api.types.is_datetime64_any_dtype(valores.dtype):
+            return valores.astype('datetime64[us]')
+        
+        codigos, unicos = pd.factorize(valores)
+        # Código -1 (vazio) aponta para o último elemento
+        if destino == 'data':
+            convertidos = np.array([data_da_celula(valor) for valor in unicos] + [None], dtype='datetime64[us]')
+            return pd.Series(convertidos[codigos], index=valores.index, name=valores.name)
+        convertidos = pd.array([segundos_do_dia(valor) for valor in unicos] + [None], dtype='Int32')
+        return pd.Series(convertidos.take(codigos), index=valores.index, name=valores.name)
+    
+    def salvar_cache(self, df, fonte, cache_path, manifest_file, versoes, estado=None, etapas=None):
+        """Salva cache (dataset particionado por ano/mes) e o manifest"""
         try:
-            df.to_parquet(cache_file, compression='snappy')
-            
-            metadata = f"""Fonte: {fonte}
-DataHora: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}
-Registros: {len(df):,}
-Colunas: {len(df.columns)}
-Hash: {hash_arquivo}"""
+            etapas = dict(etapas or {})
+            inicio = time.time()
+            versao_path = self.nova_versao(cache_path)
+            self.escrever_particoes(df, versao_path)
+            etapas['gravacao'] = time.time() - inicio
             
-            with open(metadata_file, 'w', encoding='utf-8') as f:
-                f.write(metadata)
+            datas = df['data_convertida'].dropna() if 'data_convertida' in df.columns else pd.Series(dtype='datetime64[us]')
+            manifest = self.montar_manifest(fonte, len(df), len(self.sem_colunas_internas(df).columns),
+                                            datas.min(), datas.max(), versoes, estado, etapas)
+            self.publicar_versao(cache_path, manifest_file, manifest, versao_path)
             
             return True
         except Exception as e:
             st.warning(f"Cache não salvo: {str(e)[:40]}")
             return False
     
-    def carregar_dados_inteligente(self, limite_registros=50000):
-        """Carrega dados priorizando usuário, fallback para padrão"""
+    def escrever_particoes(self, df, cache_path, ordem_inicial=0):
+        """Grava as linhas de df no dataset (novos arquivos nas partições ano/mes)"""
+        datas = df['data_convertida'] if 'data_convertida' in df.columns else pd.Series(pd.NaT, index=df.index)
+        # Estatísticas min/max por row group ficam ativas (padrão do pyarrow), o que
+        # permite podar row groups dentro de cada partição pelo filtro de data
+        # _ordem guarda a ordem das linhas gravadas (por data; empates na ordem da planilha):
+        # as partições voltam na ordem dos diretórios (mes=10 antes de mes=9)
+        tabela = pa.Table.from_pandas(df.assign(
+            _ordem=range(ordem_inicial, ordem_inicial + len(df)),
+            ano=datas.dt.year.astype('Int16'),
+            mes=datas.dt.month.astype('Int8'),
+        ), preserve_index=False)
+        # Categóricas com índice int32 fixo: o pyarrow escolheria a menor largura por
+        # arquivo (int8 até 127 categorias) e arquivos anexados depois com mais categorias
+        # deixariam o dataset ilegível
+        esquema = pa.schema([
+            pa.field(campo.name, pa.dictionary(pa.int32(), campo.type.value_type))
+            if pa.types.is_dictionary(campo.type) else campo
+            for campo in tabela.schema
+        ], metadata=tabela.schema.metadata)
+        pq.write_to_dataset(tabela.cast(esquema), cache_path, partition_cols=['ano', 'mes'], compression='snappy')
+    
+    def montar_manifest(self, fonte, registros, colunas, data_min, data_max, versoes, estado=None, etapas=None):
+        """Monta o manifest de uma versão do cache (gravado por `publicar_versao`).
+
+        `versoes` traz hash/assinatura da planilha e dos arquivos de nomes, `estado` a impressão
+        digital da leitura (modo incremental) e `etapas` o tempo (s) de cada etapa da carga
+        (somados os tempos das etapas do normalizador de nomes, prefixo "nomes_").
+        """
+        etapas = {**(etapas or {}), **self.etapas_nomes()}
+        manifest = {
+            'versao_esquema': VERSAO_ESQUEMA,
+            'fonte': fonte,
+            'data_hora': datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
+            'registros': int(registros),
+            'colunas': int(colunas),
+            'data_min': data_min.strftime('%Y-%m-%d') if pd.notna(data_min) else None,
+            'data_max': data_max.strftime('%Y-%m-%d') if pd.notna(data_max) else None,
+            'arquivo': versoes['arquivo'],
+            'mapeamento': versoes['mapeamento'],
+            'regras': versoes['regras'],
+            'apelidos': versoes['apelidos'],
+            'etapas': {etapa: round(tempo, 3) for etapa, tempo in etapas.items()},
+        }
+        if estado and 'digest' in estado:
+            manifest['prefixo'] = {'linhas_planilha': estado['linhas_planilha'], 'digest': estado['digest']}
+        if estado and 'perfil' in estado:
+            manifest['perfil'] = estado['perfil'].resumo()
+        if estado and 'esquema' in estado:
+            manifest['esquema'] = estado['esquema']
+        
+        return manifest
+    
+    def etapas_nomes(self):
+        """Tempos (s) das etapas do normalizador (prefixo "nomes_") desde a última consulta"""
+        return {f'nomes_{etapa}': tempo for etapa, tempo in self.normalizador.consumir_tempos().items()}
+    
+    def registrar_renormalizacao(self, manifest, inicio):
+        """Registra no manifest o tempo da renormalização e os das etapas do normalizador"""
+        etapas = {etapa: tempo for etapa, tempo in manifest.get('etapas', {}).items() if not etapa.startswith('nomes_')}
+        etapas.update({etapa: round(tempo, 3) for etapa, tempo in self.etapas_nomes().items()})
+        etapas['renormalizacao'] = round(time.time() - inicio, 3)
+        manifest['etapas'] = etapas
+    
+    def renormalizar_cache(self, cache_path, manifest_file, versoes):
+        """Reaplica a normalização de nomes sobre o cache a partir dos valores originais.
+
+        Usado quando só os arquivos de nomes mudaram: evita reler e reprocessar a planilha.
+        Primeiro calcula o diff (valor original -> nome padrão) contra o artefato "nomes":
+        sem mudanças, só o manifest é atualizado (a versão do dataset continua a mesma);
+        com mudanças, só as categorias afetadas são renomeadas (`renomear_nomes_cache`).
+        Sem o artefato, renormaliza o dataset inteiro (cada nome distinto uma única vez).
+        """
+        inicio = time.time()
+        self.normalizador.atualizar()
+        
+        try:
+            inicio_diff = time.perf_counter()
+            diferencas = self.diferencas_nomes(cache_path, manifest_file)
+            self.normalizador.medir('diff', inicio_diff)
+        except Exception as e:
+            print(f"Diff de nomes indisponível: {str(e)[:80]}")
+            diferencas = None
+        
+        if diferencas is not None:
+            renomear, dividir = diferencas
+            manifest = self.ler_manifest(manifest_file)
+            manifest.update(versoes)
+            manifest['data_hora'] = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+            if not any(renomear.values()) and not any(dividir.values()):
+                self.registrar_renormalizacao(manifest, inicio)
+                self.registrar_apelidos(manifest)
+                self.escrever_manifest(manifest_file, manifest)
+                return
+            versao_path = self.renomear_nomes_cache(cache_path, manifest, renomear, dividir)
+            self.registrar_renormalizacao(manifest, inicio)
+            self.publicar_versao(cache_path, manifest_file, manifest, versao_path)
+            return
+        
+        df, manifest = self.ler_dataset(cache_path, manifest_file, internas=True)
+        for coluna, tipo in self.colunas_nomes.items():
+            original = f'_original_{coluna}'
+            if original not in df.columns:
+                raise ValueError(f"cache sem {original}")
+            df[coluna] = self.normalizador.normalizar_serie(df[original], tipo)
+        
+        versao_path = self.nova_versao(cache_path)
+        self.escrever_particoes(df, versao_path)
+        
+        manifest.update(versoes)
+        manifest['data_hora'] = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+        self.registrar_renormalizacao(manifest, inicio)
+        self.publicar_versao(cache_path, manifest_file, manifest, versao_path)
+    
+    def diferencas_nomes(self, cache_path, manifest_file):
+        """Diff entre os nomes gravados no cache e a normalização atual, por coluna de nome.
+
+        Parte do artefato "nomes" (valor original -> nome gravado, com contagem) e
+        normaliza só os valores distintos. Retorna (renomear, dividir):
+        - renomear: coluna -> {nome gravado: nome novo}, categorias que mudam inteiras
+        - dividir: coluna -> nomes gravados cujos originais passam a ter nomes diferentes
+        None sem o artefato (ou se ele não cobre todas as linhas do cache).
+        """
+        nomes = self.ler_artefato(cache_path, manifest_file, 'nomes')
+        if nomes is None:
+            return None
+        registros = self.ler_manifest(manifest_file).get('registros')
+        
+        renomear, dividir = {}, {}
+        for coluna, tipo in self.colunas_nomes.items():
+            destinos = {}  # nome gravado -> nomes novos dos seus valores originais
+            linhas = nomes[nomes['coluna'] == coluna]
+            if int(linhas['registros'].sum()) != registros:
+                return None
+            for original, gravado in zip(linhas['original'], linhas['normalizado']):
+                destinos.setdefault(gravado, set()).add(self.normalizador.normalizar(original, tipo))
+            renomear[coluna], dividir[coluna] = {}, set()
+            for gravado, novos in destinos.items():
+                if len(novos) > 1:
+                    dividir[coluna].add(gravado)
+                elif gravado not in novos:
+                    renomear[coluna][gravado] = next(iter(novos))
+        return renomear, dividir
+    
+    def renomear_nomes_cache(self, cache_path, manifest, renomear, dividir):
+        """Grava uma versão nova com os nomes alterados só nos arquivos onde aparecem.
+
+        Arquivos sem categorias afetadas entram por hardlink. Nos demais, o dicionário da
+        coluna categórica é reescrito (os índices das linhas não mudam); só as categorias
+        divididas exigem renormalizar as linhas do arquivo a partir de "_original_<coluna>".
+        Retorna o diretório da versão (ainda não publicada).
+        """
+        versao_path = self.nova_versao(cache_path)
+        self.copiar_versao(self.dataset_atual(cache_path, manifest), versao_path)
+        
+        for arquivo in sorted(versao_path.rglob('*.parquet')):
+            tabela = pq.read_table(arquivo)
+            alterada = False
+            for coluna, tipo in self.colunas_nomes.items():
+                if coluna not in tabela.column_names:
+                    continue
+                campo = tabela.schema.field(coluna)
+                presentes = {rotulo for chunk in tabela.column(coluna).chunks for rotulo in chunk.dictionary.to_pylist()}
+                if presentes & dividir[coluna]:
+                    serie = self.normalizador.normalizar_serie(tabela.column(f'_original_{coluna}').to_pandas(), tipo)
+                    valores = pa.array(serie.values).cast(campo.type)
+                elif presentes & set(renomear[coluna]):
+                    valores = self.renomear_dicionario(tabela.column(coluna), renomear[coluna], campo.type)
+                else:
+                    continue
+                tabela = tabela.set_column(tabela.schema.get_field_index(coluna), campo, valores)
+                alterada = True
+            
+            if alterada:
+                # Arquivo novo no lugar do hardlink: a versão anterior continua intacta
+                temporario = arquivo.with_name(f"{arquivo.name}.tmp")
+                pq.write_table(tabela, temporario, compression='snappy')
+                os.replace(temporario, arquivo)
+        return versao_path
+    
+    def renomear_dicionario(self, coluna, renomear, tipo):
+        """Renomeia as categorias de uma coluna dictionary do Arrow sem tocar nas linhas.
+
+        Se duas categorias viram o mesmo nome, o dicionário é deduplicado e só os índices
+        são remapeados (um take sobre inteiros).
+        """
+        chunks = []
+        for chunk in coluna.chunks:
+            rotulos = [renomear.get(rotulo, rotulo) for rotulo in chunk.dictionary.to_pylist()]
+            unicos = list(dict.fromkeys(rotulos))
+            if len(unicos) == len(rotulos):
+                indices = chunk.indices
+            else:
+                posicao = {rotulo: i for i, rotulo in enumerate(unicos)}
+                indices = pa.array([posicao[rotulo] for rotulo in rotulos], tipo.index_type).take(chunk.indices)
+            chunks.append(pa.DictionaryArray.from_arrays(indices, pa.array(unicos, tipo.value_type)))
+        return pa.chunked_array(chunks, tipo)
+    
+    def alinhar_incremento(self, df_novo, dataset_path):
+        """Converte as linhas novas (tipos brutos) para o esquema do cache.
+
+        Reproduz o que `finalizar_normalizacao` faria sobre o DataFrame completo (os
+        instantes das etapas são recalculados das colunas já alinhadas). Retorna
+        None quando as linhas novas mudariam o esquema (coluna descartada que passou a ter
+        dados, coluna de data com texto, inteiro com vazio...): aí só a reconstrução serve.
+        """
+        esquema = pq.ParquetDataset(dataset_path).schema
+        colunas = [c for c in esquema.names if c not in ('ano', 'mes', '_ordem')]
+        
+        # Colunas fora do cache (Unnamed descartadas ou novas) precisam continuar vazias
+        for col in df_novo.columns:
+            if col not in colunas and df_novo[col].notna().any():
+                return None
+        
+        alinhado = {}
+        for col in colunas:
+            if col in INSTANTES.values():
+                continue
+            if col in df_novo.columns:
+                valores = df_novo[col]
+            else:
+                valores = pd.Series(None, index=df_novo.index, dtype=object)
+            tipo = esquema.field(col).type
+            inferido = valores.infer_objects()
+            vazio = valores.isna().all()
+            destino = self.tipo_coluna(col, valores)
+            
+            if destino in ('data', 'hora'):
+                # Datas e horários têm tipo fixo pelo nome da coluna
+                esperado = pa.types.is_timestamp(tipo) if destino == 'data' else pa.types.is_int32(tipo)
+                if not esperado:
+                    return None
+                alinhado[col] = self.coagir_coluna(valores, destino)
+            elif pa.types.is_dictionary(tipo):
+                # Colunas de nome já chegam categóricas da normalização; as de texto viram
+                # categóricas aqui. As categorias de cada arquivo são unidas na leitura
+                if col in self.colunas_nomes:
+                    if not isinstance(valores.dtype, pd.CategoricalDtype):
+                        return None
+                    alinhado[col] = valores
+                    continue
+                # Coluna vazia no cache + valores tipados agora: no DataFrame completo ela
+                # deixaria de ser texto (as do esquema são texto pelo tipo declarado)
+                if not vazio and col not in TIPOS_COLUNAS and not pd.api.types.is_string_dtype(inferido.dtype):
+                    existentes = pq.read_table(dataset_path, columns=[col]).column(col).to_pandas()
+                    if existentes.astype(str).eq('').all():
+                        return None
+                alinhado[col] = self.coagir_coluna(valores, 'texto')
+            elif pa.types.is_timestamp(tipo):
+                if not (vazio or pd.api.types.is_datetime64_any_dtype(inferido.dtype)):
+                    return None
+                alinhado[col] = pd.to_datetime(valores).astype(f'datetime64[{tipo.unit}]')
+            elif pa.types.is_string(tipo) or pa.types.is_large_string(tipo):
+                # Coluna vazia no cache + valores tipados agora: no DataFrame completo ela
+                # deixaria de ser texto
+                if not vazio and not pd.api.types.is_string_dtype(inferido.dtype):
+                    existentes = pq.read_table(dataset_path, columns=[col]).column(col).to_pandas()
+                    if existentes.fillna('').eq('').all():
+                        return None
+                alinhado[col] = valores.fillna('').astype(str)
+            elif pa.types.is_integer(tipo):
+                if not pd.api.types.is_integer_dtype(inferido.dtype):
+                    return None
+                alinhado[col] = inferido.astype(tipo.to_pandas_dtype())
+            elif pa.types.is_floating(tipo):
+                if pd.api.types.is_bool_dtype(inferido.dtype) or not (vazio or pd.api.types.is_numeric_dtype(inferido.dtype)):
+                    return None
+                alinhado[col] = pd.to_numeric(valores).astype('float64').replace([float('inf'), float('-inf')], 0).fillna(0)
+            else:
+                return None
+        
+        alinhado = pd.DataFrame(alinhado, index=df_novo.index)
+        return alinhado.assign(**instantes_etapas(alinhado))[colunas]
+    
+    def atualizar_cache_incremental(self, arquivo_path, cache_path, manifest_file, versoes, limite_registros=50000, prefixo_fonte=''):
+        """🔁 Anexa ao cache só as linhas acrescentadas ao final da planilha.
+
+        Usa a impressão digital da leitura (manifest['prefixo']) para conferir que as
+        linhas já ingeridas não mudaram; só as linhas seguintes são normalizadas e gravadas
+        como novos arquivos nas partições. Retorna (linhas_novas, fonte, leitor) ou None
+        quando é preciso reconstruir tudo (linhas antigas editadas, cache sem digest,
+        esquema mudou).
+        """
+        manifest = self.ler_manifest(manifest_file)
+        dataset = self.dataset_atual(cache_path, manifest)
+        if dataset is None or 'prefixo' not in manifest:
+            return None
+        
+        inicio = time.time()
+        estado = {}
+        df_novo, fonte, leitor = self.ler_planilha(arquivo_path, limite_registros, estado, manifest['prefixo'])
+        if df_novo is None:
+            return None
+        
+        if len(df_novo):
+            df_novo = self.alinhar_incremento(df_novo, dataset)
+            if df_novo is None:
+                return None
+            df_novo = self.ordenar_por_data(df_novo)
+        
+        # Versão nova = arquivos da atual (hardlinks, nunca alterados) + arquivos das linhas novas
+        versao_path = self.nova_versao(cache_path)
+        self.copiar_versao(dataset, versao_path)
+        if len(df_novo):
+            self.escrever_particoes(df_novo, versao_path, ordem_inicial=manifest['registros'])
+        
+        datas = df_novo['data_convertida'].dropna() if 'data_convertida' in df_novo.columns else pd.Series(dtype='datetime64[us]')
+        data_min = pd.Timestamp(manifest['data_min']) if manifest['data_min'] else pd.NaT
+        data_max = pd.Timestamp(manifest['data_max']) if manifest['data_max'] else pd.NaT
+        if len(datas):
+            data_min = min(datas.min(), data_min) if pd.notna(data_min) else datas.min()
+            data_max = max(datas.max(), data_max) if pd.notna(data_max) else datas.max()
+        
+        etapas = {'incremento': time.time() - inicio}
+        novo_manifest = self.montar_manifest(prefixo_fonte + fonte, estado['registros'], manifest['colunas'],
+                                             data_min, data_max, versoes, estado, etapas)
+        if 'perfil' in novo_manifest:
+            novo_manifest['perfil'] = somar_resumos(manifest.get('perfil'), novo_manifest['perfil'])
+        self.publicar_versao(cache_path, manifest_file, novo_manifest, versao_path)
+        return len(df_novo), fonte, leitor
+    
+    def copiar_versao(self, origem, destino):
+        """Copia uma versão do dataset para `destino` usando hardlinks (cópia se não suportado)"""
+        for arquivo in origem.rglob('*'):
+            relativo = arquivo.relative_to(origem)
+            # Artefatos são regerados na publicação (e não podem ser sobrescritos via hardlink)
+            if relativo.parts[0] == '_artefatos':
+                continue
+            alvo = destino / relativo
+            if arquivo.is_dir():
+                alvo.mkdir(parents=True, exist_ok=True)
+                continue
+            alvo.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(arquivo, alvo)
+            except OSError:
+                shutil.copy2(arquivo, alvo)
+    
+    def carregar_dados_inteligente(self, limite_registros=50000, periodos=None):
+        """Carrega dados priorizando usuário, fallback para padrão.
+
+        `periodos` (lista de (inicio, fim)) restringe a leitura do cache às partições
+        desses períodos; com períodos, um resultado vazio é válido (período sem dados).
+        """
         
         # Tentar carregar dados do usuário primeiro
-        df_usuario, msg_usuario = self.carregar_dados_usuario(limite_registros)
+        df_usuario, msg_usuario = self.carregar_dados_usuario(limite_registros, periodos)
         
-        if df_usuario is not None and not df_usuario.empty:
+        if df_usuario is not None and (periodos is not None or not df_usuario.empty):
             # Mensagem discreta no sidebar
             with st.sidebar:
                 st.caption(f"✅ {msg_usuario}")
             return df_usuario
         
         # Fallback para dados padrão
-        df_padrao, msg_padrao = self.carregar_dados_padrao(limite_registros)
+        df_padrao, msg_padrao = self.carregar_dados_padrao(limite_registros, periodos)
         
-        if df_padrao is not None and not df_padrao.empty:
+        if df_padrao is not None and (periodos is not None or not df_padrao.empty):
             # Mensagem discreta no sidebar
             with st.sidebar:
                 st.caption(f"✅ {msg_padrao}")
@@ -490,15 +1415,144 @@ Hash: {hash_arquivo}"""
         st.warning("⚠️ Nenhum arquivo de dados encontrado")
         return pd.DataFrame()
     
+    def manifest_ativo(self, limite_registros=50000):
+        """Manifest da fonte que `carregar_dados_inteligente` usaria (usuário, senão padrão).
+
+        Chama os carregadores com `periodos=[]`: o cache é validado (ou reconstruído),
+        mas nenhuma partição é decodificada.
+        """
+        fontes = [
+            (self.carregar_dados_usuario, self.manifest_usuario),
+            (self.carregar_dados_padrao, self.manifest_padrao),
+        ]
+        for carregar, manifest_file in fontes:
+            df, _ = carregar(limite_registros, periodos=[])
+            if df is not None and manifest_file.exists():
+                return manifest_file
+        return None
+    
+    def intervalo_datas_inteligente(self, limite_registros=50000):
+        """Intervalo (data_min, data_max) do dataset ativo, sem ler as linhas do cache"""
+        manifest_file = self.manifest_ativo(limite_registros)
+        return self.intervalo_datas(manifest_file) if manifest_file else None
+    
+    def versao_dados_inteligente(self, limite_registros=50000):
+        """🏷️ Identificação da versão publicada do dataset ativo: (fonte, versão).
+
+        Muda a cada reconstrução/atualização do cache, então serve de chave para
+        caches em memória compartilhados entre sessões (nada a invalidar por TTL).
+        """
+        manifest_file = self.manifest_ativo(limite_registros)
+        if manifest_file is None:
+            return None
+        return manifest_file.stem, self.ler_manifest(manifest_file).get('dataset')
+    
+    def auditoria_normalizacao_inteligente(self, limite_registros=50000):
+        """🔍 Auditoria da normalização de nomes do dataset ativo: (tabela, etapas).
+
+        `tabela` é o artefato "nomes" (coluna, original, normalizado, origem, registros),
+        do valor mais frequente para o menos, ou None sem o artefato; `etapas` são os
+        tempos (s) registrados no manifest pela última carga.
+        """
+        manifest_file = self.manifest_ativo(limite_registros)
+        if manifest_file is None:
+            return None, {}
+        cache_path = self.cache_usuario if manifest_file == self.manifest_usuario else self.cache_padrao
+        tabela = self.ler_artefato(cache_path, manifest_file, 'nomes')
+        if tabela is not None:
+            tabela = tabela.sort_values(['coluna', 'registros'], ascending=[True, False], ignore_index=True)
+        return tabela, self.ler_manifest(manifest_file).get('etapas', {})
+    
+    def perfil_colunas_inteligente(self, limite_registros=50000):
+        """📋 Perfil das colunas da planilha inteira (preenchimento, tipo, cardinalidade),
+        calculado na leitura e guardado no manifest do dataset ativo; {} sem cache"""
+        manifest_file = self.manifest_ativo(limite_registros)
+        if manifest_file is None:
+            return {}
+        return self.ler_manifest(manifest_file).get('perfil', {})
+    
+    def esquema_colunas_inteligente(self, limite_registros=50000):
+        """🧭 Resolução do cabeçalho da planilha do dataset ativo contra o esquema
+        (colunas canônicas, ausentes, desconhecidas), do manifest; {} sem cache"""
+        manifest_file = self.manifest_ativo(limite_registros)
+        if manifest_file is None:
+            return {}
+        return self.ler_manifest(manifest_file).get('esquema', {})
+    
+    def artefato_ativo(self, nome, limite_registros=50000):
+        """Artefato derivado da versão publicada do dataset ativo (None sem ele)"""
+        manifest_file = self.manifest_ativo(limite_registros)
+        if manifest_file is None:
+            return None
+        cache_path = self.cache_usuario if manifest_file == self.manifest_usuario else self.cache_padrao
+        return self.ler_artefato(cache_path, manifest_file, nome)
+    
+    def cubo_diario_inteligente(self, limite_registros=50000):
+        """🧊 Cubo diário (dia x cliente x cliente de venda) do dataset ativo: artefato
+        "cubo_diario" da versão publicada, ou None sem o artefato"""
+        return self.artefato_ativo('cubo_diario', limite_registros)
+    
+    def esbocos_diarios_inteligente(self, limite_registros=50000):
+        """📐 Esboços de quantis das durações por célula do cubo diário, do dataset ativo:
+        artefato "esbocos_diarios" da versão publicada, ou None sem o artefato"""
+        return self.artefato_ativo('esbocos_diarios', limite_registros)
+    
+    def aquecer_cache(self, limite_registros=50000):
+        """🔥 Valida e, se preciso, atualiza/reconstrói o cache de cada fonte existente.
+
+        Usa `periodos=[]`: nenhuma partição é lida, só o trabalho de atualização é feito,
+        para que o dashboard encontre tudo pronto. Retorna as mensagens de cada fonte.
+        """
+        mensagens = []
+        fontes = [
+            (self.arquivo_usuario, self.carregar_dados_usuario),
+            (self.arquivo_padrao, self.carregar_dados_padrao),
+        ]
+        for arquivo, carregar in fontes:
+            if arquivo.exists():
+                _, mensagem = carregar(limite_registros, periodos=[])
+                mensagens.append(mensagem)
+        return mensagens
+    
+    def observar(self, intervalo=5.0, debounce=10.0, limite_registros=50000):
+        """👀 Observa planilha padrão, upload e arquivos de nomes e aquece o cache após mudanças.
+
+        Verifica as assinaturas (stat) a cada `intervalo` segundos; depois de uma mudança,
+        espera `debounce` segundos sem novas mudanças (planilha ainda sendo salva/copiada)
+        antes de atualizar. Roda até Ctrl+C.
+        """
+        arquivos = [self.arquivo_padrao, self.arquivo_usuario, self.arquivo_mapeamento, self.arquivo_regras,
+                    self.arquivo_apelidos]
+        assinaturas = [self.assinatura_arquivo(a) for a in arquivos]
+        ultima_mudanca = None
+        
+        for mensagem in self.aquecer_cache(limite_registros):
+            print(f"[{datetime.now():%H:%M:%S}] {mensagem}")
+        
+        try:
+            while True:
+                time.sleep(intervalo)
+                atuais = [self.assinatura_arquivo(a) for a in arquivos]
+                if atuais != assinaturas:
+                    assinaturas = atuais
+                    ultima_mudanca = time.time()
+                    print(f"[{datetime.now():%H:%M:%S}] Mudança detectada, aguardando {debounce:.0f}s sem alterações...")
+                elif ultima_mudanca is not None and time.time() - ultima_mudanca >= debounce:
+                    ultima_mudanca = None
+                    for mensagem in self.aquecer_cache(limite_registros):
+                        print(f"[{datetime.now():%H:%M:%S}] {mensagem}")
+        except KeyboardInterrupt:
+            print("Observação encerrada")
+    
     def limpar_dados_usuario(self):
         """Remove dados do usuário"""
         try:
-            if self.arquivo_usuario.exists():
-                self.arquivo_usuario.unlink()
-            if self.cache_usuario.exists():
-                self.cache_usuario.unlink()
-            if self.metadata_usuario.exists():
-                self.metadata_usuario.unlink()
+            with self.trava_cache(self.cache_usuario):
+                if self.arquivo_usuario.exists():
+                    self.arquivo_usuario.unlink()
+                self.remover_cache(self.cache_usuario)
+                if self.manifest_usuario.exists():
+                    self.manifest_usuario.unlink()
             return True
         except:
             return False
@@ -564,11 +1618,71 @@ sistema_hibrido = SistemaHibridoTerloc()
 #                     else:
 #                         st.error("❌ Erro ao salvar arquivo")
 
-def carregar_dados_streamlit(limite_registros=50000):
+def carregar_dados_streamlit(limite_registros=50000, periodos=None):
     """Função principal para uso no Streamlit"""
-    return sistema_hibrido.carregar_dados_inteligente(limite_registros)
+    return sistema_hibrido.carregar_dados_inteligente(limite_registros, periodos)
+
+def intervalo_datas_streamlit(limite_registros=50000):
+    """Intervalo de datas disponível, para montar os seletores de P1/P2 antes de carregar"""
+    return sistema_hibrido.intervalo_datas_inteligente(limite_registros)
+
+def versao_dados_streamlit(limite_registros=50000):
+    """Versão do dataset ativo, para chavear os caches do dashboard"""
+    return sistema_hibrido.versao_dados_inteligente(limite_registros)
+
+def auditoria_normalizacao_streamlit(limite_registros=50000):
+    """Auditoria da normalização de nomes do dataset ativo: (tabela, etapas)"""
+    return sistema_hibrido.auditoria_normalizacao_inteligente(limite_registros)
+
+def perfil_colunas_streamlit(limite_registros=50000):
+    """Perfil das colunas do dataset ativo, do manifest do cache"""
+    return sistema_hibrido.perfil_colunas_inteligente(limite_registros)
+
+def esquema_colunas_streamlit(limite_registros=50000):
+    """Resolução do cabeçalho do dataset ativo contra o esquema, do manifest do cache"""
+    return sistema_hibrido.esquema_colunas_inteligente(limite_registros)
+
+def cubo_diario_streamlit(limite_registros=50000):
+    """Cubo diário do dataset ativo (artefato do cache), None sem o artefato"""
+    return sistema_hibrido.cubo_diario_inteligente(limite_registros)
+
+def esbocos_diarios_streamlit(limite_registros=50000):
+    """Esboços de quantis do dataset ativo (artefato do cache), None sem o artefato"""
+    return sistema_hibrido.esbocos_diarios_inteligente(limite_registros)
+
+def executar_linha_de_comando(argumentos=None):
+    """Pré-aquecimento do cache pela linha de comando (`--aquecer`, `--watch` ou `--auditoria`)"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Pré-aquecimento do cache do sistema híbrido TERLOC")
+    parser.add_argument('--aquecer', action='store_true', help="atualiza o cache das fontes existentes e sai")
+    parser.add_argument('--watch', action='store_true', help="observa as planilhas e atualiza o cache a cada mudança")
+    parser.add_argument('--intervalo', type=float, default=5.0, help="segundos entre verificações no --watch (padrão: 5)")
+    parser.add_argument('--debounce', type=float, default=10.0, help="segundos sem mudanças antes de atualizar (padrão: 10)")
+    parser.add_argument('--limite', type=int, default=50000, help="limite de registros (padrão: 50000)")
+    parser.add_argument('--auditoria', metavar='ARQUIVO.parquet', nargs='?', const='auditoria_nomes.parquet',
+                        help="mostra a auditoria da normalização de nomes e a exporta em Parquet (padrão: auditoria_nomes.parquet)")
+    args = parser.parse_args(argumentos)
+    
+    if args.auditoria:
+        tabela, etapas = sistema_hibrido.auditoria_normalizacao_inteligente(args.limite)
+        if tabela is None:
+            print("Auditoria indisponível: cache sem o artefato de nomes")
+            return
+        tabela.to_parquet(args.auditoria, index=False)
+        resumo = tabela.groupby(['coluna', 'origem']).agg(valores=('original', 'size'), registros=('registros', 'sum'))
+        print(resumo.sort_values('registros', ascending=False).to_string())
+        print("\nTempos (s): " + ", ".join(f"{etapa} {tempo}" for etapa, tempo in etapas.items()))
+        print(f"Auditoria exportada: {args.auditoria} ({len(tabela)} valores distintos)")
+    elif args.watch:
+        sistema_hibrido.observar(args.intervalo, args.debounce, args.limite)
+    else:
+        for mensagem in sistema_hibrido.aquecer_cache(args.limite):
+            print(mensagem)
 
-if __name__ == "__main__":
+if __name__ == "__main__" and len(sys.argv) > 1:
+    executar_linha_de_comando()
+elif __name__ == "__main__":
     print("🔄 TESTE DO SISTEMA HÍBRIDO")
     print("=" * 40)
     